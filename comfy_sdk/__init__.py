@@ -1,8 +1,32 @@
+from .async_client import AsyncComfyClient
+from .batching import batch_jobs, generate_batched, split_batch
+from .cache import ResultCache, prompt_hash
 from .client import ComfyClient
-from .generate import DEFAULT_WORKFLOW_PATH, build_prompt_from_workflow, generate_from_workflow
+from .dataset import DatasetIndex, caption_tokens, image_size
+from .download import DownloadStage, download_images
+from .generate import (
+    DEFAULT_WORKFLOW_PATH,
+    build_prompt_from_workflow,
+    generate_from_workflow,
+    generate_many,
+    order_jobs,
+)
+from .jobspec import JobSpec, load_spec, run_spec
+from .journal import JobJournal
+from .manifest import ManifestStore, lora_set
+from .ordering import JobPlan
+from .pool import ComfyPool, connect
+from .scheduler import Scheduler
+from .subgraphs import FaceIDSubgraph, LoraChainSubgraph, Subgraph, splice_loras
+from .sweep import ResultsTable, Sweep, cartesian, latin_hypercube, run_sweep
+from .timing import JsonlSink, MemorySink, TimingRecorder, format_summary, summarize
 from .workflow import (
+    PromptGraph,
+    WorkflowTemplate,
     add_lora_to_chain,
+    copy_prompt,
     find_nodes_by_type,
+    load_template,
     load_workflow,
     set_checkpoint,
     set_clip_text,
@@ -17,13 +41,51 @@ from .workflow import (
 )
 
 __all__ = [
+    "AsyncComfyClient",
     "ComfyClient",
+    "ComfyPool",
+    "DatasetIndex",
+    "DownloadStage",
+    "FaceIDSubgraph",
+    "JobJournal",
+    "JobSpec",
+    "JobPlan",
+    "JsonlSink",
+    "LoraChainSubgraph",
+    "ManifestStore",
+    "MemorySink",
+    "download_images",
     "DEFAULT_WORKFLOW_PATH",
     "build_prompt_from_workflow",
+    "caption_tokens",
+    "cartesian",
+    "connect",
+    "generate_batched",
     "generate_from_workflow",
+    "generate_many",
+    "image_size",
+    "latin_hypercube",
+    "PromptGraph",
+    "ResultCache",
+    "ResultsTable",
+    "Scheduler",
+    "Subgraph",
+    "Sweep",
+    "TimingRecorder",
+    "WorkflowTemplate",
     "add_lora_to_chain",
+    "batch_jobs",
+    "copy_prompt",
     "find_nodes_by_type",
+    "format_summary",
+    "load_spec",
+    "load_template",
     "load_workflow",
+    "lora_set",
+    "order_jobs",
+    "run_spec",
+    "run_sweep",
+    "prompt_hash",
     "set_checkpoint",
     "set_clip_text",
     "set_latent_size",
@@ -33,5 +95,8 @@ __all__ = [
     "set_output_prefix",
     "set_positive_prompt",
     "set_sampler_params",
+    "splice_loras",
+    "split_batch",
+    "summarize",
     "workflow_to_prompt",
 ]
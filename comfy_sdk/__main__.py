@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+import urllib.error
+
+from .cache import ResultCache
+from .generate import order_jobs
+from .jobspec import JobSpec, run_spec
+from .pool import connect
+
+DEFAULT_URL = "http://127.0.0.1:8188"
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m comfy_sdk")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="Run a JSON or YAML job spec.")
+    run.add_argument("spec", help="Path to the job spec.")
+    run.add_argument(
+        "--server",
+        default=os.environ.get("COMFY_URL"),
+        help="Server URL, or a comma-separated list to spread jobs over; overrides the spec.",
+    )
+    run.add_argument("--cache", help="Result cache folder; cached prompts are never queued.")
+    run.add_argument("--lookahead", type=int, default=4)
+    run.add_argument("--timeout", type=float, default=600.0)
+    run.add_argument(
+        "--dry-run", action="store_true", help="Build every prompt and print the plan only."
+    )
+    return parser
+
+
+def _run(args: argparse.Namespace) -> int:
+    spec = JobSpec.from_file(args.spec)
+    if args.dry_run:
+        plan = order_jobs(spec.jobs(), spec.workflow_path)
+        print(f"{spec.name}: {len(plan)} jobs into {spec.output_dir}")
+        print(plan.summary())
+        return 0
+
+    base_url = args.server or spec.spec.get("server") or DEFAULT_URL
+    client = connect(base_url)
+    cache = ResultCache(args.cache) if args.cache else None
+    started = time.perf_counter()
+    done = 0
+    try:
+        results = run_spec(
+            spec, client=client, cache=cache, lookahead=args.lookahead, timeout=args.timeout
+        )
+        for record in results:
+            done += 1
+            print(f"[{done}/{len(spec)}] scene {record['scene_index']}: {record['images']}")
+    except urllib.error.URLError as exc:
+        print(
+            f"ComfyUI is not reachable at {base_url}. Start the server or set COMFY_URL.",
+            file=sys.stderr,
+        )
+        raise SystemExit(1) from exc
+    finally:
+        client.close()
+    print(f"{done} jobs in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+def main() -> int:
+    args = build_arg_parser().parse_args()
+    if args.command == "run":
+        return _run(args)
+    return 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, TypeVar
+
+from .client import ComfyClient
+
+T = TypeVar("T")
+
+
+class AsyncComfyClient:
+    """asyncio front-end for ``ComfyClient``.
+
+    Each call runs the blocking client on a dedicated thread pool, so many prompts can be
+    queued, awaited and downloaded concurrently while sharing one keep-alive connection pool
+    and one websocket. Waits get a pool of their own, so long waits never hold up queueing or
+    downloads. A ``client`` passed in stays owned by the caller and is not closed here.
+    """
+
+    def __init__(
+        self,
+        base_url: str = "http://127.0.0.1:8188",
+        timeout: float = 30.0,
+        *,
+        pool_size: int = 4,
+        max_workers: int = 16,
+        max_waits: int = 64,
+        client: ComfyClient | None = None,
+    ) -> None:
+        self._owns_client = client is None
+        self.client = client or ComfyClient(base_url, timeout, pool_size=pool_size)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="comfy")
+        self._wait_executor = ThreadPoolExecutor(
+            max_workers=max_waits, thread_name_prefix="comfy-wait"
+        )
+
+    @property
+    def base_url(self) -> str:
+        return self.client.base_url
+
+    @property
+    def client_id(self) -> str:
+        return self.client.client_id
+
+    async def __aenter__(self) -> "AsyncComfyClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    async def _run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def close(self) -> None:
+        if self._owns_client:
+            await self._run(self.client.close)
+        self._executor.shutdown(wait=False)
+        self._wait_executor.shutdown(wait=False)
+
+    async def queue_prompt(self, prompt: Dict[str, Any], *, front: bool = False) -> str:
+        return await self._run(self.client.queue_prompt, prompt, front=front)
+
+    async def get_history(self, prompt_id: str) -> Dict[str, Any]:
+        return await self._run(self.client.get_history, prompt_id)
+
+    async def wait_for_prompt(
+        self,
+        prompt_id: str,
+        *,
+        poll_interval: float = 1.0,
+        timeout: float = 300.0,
+        use_websocket: bool = True,
+    ) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        wait = functools.partial(
+            self.client.wait_for_prompt,
+            prompt_id,
+            poll_interval=poll_interval,
+            timeout=timeout,
+            use_websocket=use_websocket,
+        )
+        return await loop.run_in_executor(self._wait_executor, wait)
+
+    def extract_images(self, history: Dict[str, Any], prompt_id: str) -> List[Dict[str, Any]]:
+        return self.client.extract_images(history, prompt_id)
+
+    async def download_image(
+        self, filename: str, *, subfolder: str = "", image_type: str = "output"
+    ) -> bytes:
+        return await self._run(
+            self.client.download_image, filename, subfolder=subfolder, image_type=image_type
+        )
+
+    async def download_image_to(
+        self,
+        filename: str,
+        target: str | Path,
+        *,
+        subfolder: str = "",
+        image_type: str = "output",
+        expected_size: int | None = None,
+    ) -> int:
+        return await self._run(
+            self.client.download_image_to,
+            filename,
+            target,
+            subfolder=subfolder,
+            image_type=image_type,
+            expected_size=expected_size,
+        )
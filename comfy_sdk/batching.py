@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Tuple
+
+from .cache import prompt_hash
+from .generate import DEFAULT_WORKFLOW_PATH, _job_prompt, generate_many
+from .journal import prompt_seed
+from .workflow import Prompt, copy_prompt, find_nodes_by_type, set_latent_size
+
+_SEED_FIELDS = ("seed", "noise_seed")
+
+# Result fields that describe the whole batched prompt and are copied to every job's result.
+_SHARED_FIELDS = ("prompt_id", "history", "cached", "resumed")
+
+
+def batch_signature(prompt: Prompt) -> str | None:
+    """Hash of ``prompt`` ignoring seeds and output prefixes, or None if it can't be batched.
+
+    Only prompts with a single ``EmptyLatentImage`` at ``batch_size`` 1 are batchable; prompts
+    that differ in anything but seed and ``SaveImage`` prefix get different signatures.
+    """
+    latents = list(find_nodes_by_type(prompt, "EmptyLatentImage"))
+    if len(latents) != 1 or prompt[latents[0]].get("inputs", {}).get("batch_size", 1) != 1:
+        return None
+    masked = copy_prompt(prompt)
+    for node in masked.values():
+        inputs = node.get("inputs", {})
+        for name in _SEED_FIELDS:
+            if isinstance(inputs.get(name), int):
+                inputs[name] = None
+        if node.get("class_type") == "SaveImage":
+            inputs.pop("filename_prefix", None)
+    return prompt_hash(masked)
+
+
+def batch_jobs(
+    jobs: Iterable[Mapping[str, Any]],
+    workflow_path: str | Path = DEFAULT_WORKFLOW_PATH,
+    *,
+    max_batch: int = 4,
+) -> List[Dict[str, Any]]:
+    """Fold jobs that differ only in seed and output prefix into ``batch_size`` N prompts.
+
+    Each returned job carries the merged ``"prompt"`` and its ``"members"``, the original
+    ``(index, job)`` pairs in latent order. The batch samples with the first member's seed and
+    saves under its prefix. ComfyUI draws the noise for the whole latent batch from that one
+    seed, so image ``i`` is not the image the member's own seed would have given; it is
+    reproduced by the batch seed plus ``batch_index`` ``i``. Jobs with different prompt text
+    need separate conditioning and are never merged.
+    """
+    if max_batch < 1:
+        raise ValueError("max_batch must be at least 1")
+    groups: Dict[Any, List[Tuple[int, Mapping[str, Any], Prompt]]] = {}
+    for index, job in enumerate(jobs):
+        prompt = _job_prompt(job, workflow_path)
+        signature = batch_signature(prompt)
+        groups.setdefault(signature if signature is not None else ("single", index), []).append(
+            (index, job, prompt)
+        )
+
+    batched = []
+    for members in groups.values():
+        for start in range(0, len(members), max_batch):
+            chunk = members[start:start + max_batch]
+            prompt = chunk[0][2]
+            if len(chunk) > 1:
+                prompt = copy_prompt(prompt)
+                set_latent_size(prompt, batch_size=len(chunk))
+            batched.append(
+                {"prompt": prompt, "members": [(index, job) for index, job, _ in chunk]}
+            )
+    return batched
+
+
+def split_batch(result: Mapping[str, Any]) -> List[Dict[str, Any]]:
+    """Per-member results of one batched prompt, mapping outputs back by batch position.
+
+    Every output node returns one image per latent, so the ``i``-th image of each node (and
+    its downloaded path) belongs to member ``i``.
+    """
+    members = result["job"]["members"]
+    size = len(members)
+    seed = prompt_seed(result["job"]["prompt"])
+    split = []
+    for position, (index, job) in enumerate(members):
+        member = {
+            "index": index,
+            "job": job,
+            "images": result["images"][position::size],
+            "seed": seed,
+            "batch_index": position,
+            "batch_size": size,
+        }
+        for field in _SHARED_FIELDS:
+            if field in result:
+                member[field] = result[field]
+        if "paths" in result:
+            member["paths"] = result["paths"][position::size]
+        split.append(member)
+    return split
+
+
+def generate_batched(
+    jobs: Iterable[Mapping[str, Any]],
+    workflow_path: str | Path = DEFAULT_WORKFLOW_PATH,
+    *,
+    max_batch: int = 4,
+    ordered: bool = False,
+    **options: Any,
+) -> Iterator[Dict[str, Any]]:
+    """Run ``jobs`` through ``generate_many`` as seed batches and yield one result per job.
+
+    ``options`` are passed to ``generate_many``. Results carry the original ``"index"`` and
+    ``"job"`` plus ``"seed"``, ``"batch_index"`` and ``"batch_size"`` for reproduction; with
+    ``ordered`` they are yielded in the original job order.
+    """
+    batched = batch_jobs(jobs, workflow_path, max_batch=max_batch)
+    finished: Dict[int, Dict[str, Any]] = {}
+    next_index = 0
+    for result in generate_many(batched, workflow_path, **options):
+        for member in split_batch(result):
+            if not ordered:
+                yield member
+                continue
+            finished[member["index"]] = member
+            while next_index in finished:
+                yield finished.pop(next_index)
+                next_index += 1
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Sequence
+
+from .download import claim_path, relative_target
+
+_ENTRY_FILE = "entry.json"
+# Stores of one key are serialized on one of these locks, picked by the key's hash.
+_KEY_LOCKS = 64
+
+
+def prompt_hash(prompt: Mapping[str, Any], inputs: Iterable[str] = ()) -> str:
+    """Canonical SHA-256 of a prompt graph plus the content hashes of its uploaded inputs.
+
+    Images uploaded with ``ComfyClient.upload_image`` are already named by content hash, so
+    their LoadImage fields cover them; ``inputs`` is for anything else the graph depends on.
+    """
+    canonical = json.dumps(prompt, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    digest = hashlib.sha256(canonical.encode("utf-8"))
+    for item in sorted(inputs):
+        digest.update(b"\0")
+        digest.update(item.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _copy_file(source: Path, target: Path) -> None:
+    target.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(source, target)
+
+
+class ResultCache:
+    """On-disk cache of finished prompts (history plus output images), size-bounded LRU."""
+
+    def __init__(self, root: str | Path, *, max_bytes: int = 20 * 1024**3) -> None:
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(_KEY_LOCKS)]
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+        self._scan()
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def _scan(self) -> None:
+        found = []
+        for entry_file in self.root.glob(f"*/*/{_ENTRY_FILE}"):
+            directory = entry_file.parent
+            size = sum(path.stat().st_size for path in directory.iterdir() if path.is_file())
+            found.append((entry_file.stat().st_mtime, directory.name, size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total += size
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Dict[str, Any] | None:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return self._read(key)
+
+    def _read(self, key: str) -> Dict[str, Any] | None:
+        directory = self._entry_dir(key)
+        entry_file = directory / _ENTRY_FILE
+        try:
+            entry = json.loads(entry_file.read_text(encoding="utf-8"))
+            os.utime(entry_file)
+        except (OSError, ValueError):
+            self.discard(key)
+            return None
+        for image in entry["images"]:
+            image["path"] = str(directory / image["path"])
+        return entry
+
+    def put(
+        self,
+        key: str,
+        *,
+        prompt_id: str,
+        history: Mapping[str, Any],
+        images: Sequence[Mapping[str, Any]],
+        files: Sequence[str | Path],
+    ) -> Dict[str, Any]:
+        """Store a finished prompt; ``files`` are the local copies of ``images``, in order."""
+        if len(files) != len(images):
+            raise ValueError("files must hold one local path per image")
+        def _copy(index: int, image: Mapping[str, Any], target: Path) -> None:
+            _copy_file(Path(files[index]), target)
+
+        return self._store(key, prompt_id, history, images, _copy)
+
+    def fetch(
+        self,
+        key: str,
+        client: Any,
+        *,
+        prompt_id: str,
+        history: Mapping[str, Any],
+        images: Sequence[Mapping[str, Any]],
+    ) -> Dict[str, Any]:
+        """Store a finished prompt, downloading its images from ``client`` straight into the cache."""
+        # A ComfyPool is asked for the server that ran the prompt, so same-named outputs on
+        # other servers are never fetched instead.
+        route = getattr(client, "client_for_prompt", None)
+        owner = route(prompt_id) if route is not None else client
+
+        def _download(index: int, image: Mapping[str, Any], target: Path) -> None:
+            owner.download_image_to(
+                image["filename"],
+                target,
+                subfolder=image.get("subfolder", ""),
+                image_type=image.get("type", "output"),
+            )
+
+        return self._store(key, prompt_id, history, images, _download)
+
+    def _store(
+        self,
+        key: str,
+        prompt_id: str,
+        history: Mapping[str, Any],
+        images: Sequence[Mapping[str, Any]],
+        write: Callable[[int, Mapping[str, Any], Path], None],
+    ) -> Dict[str, Any]:
+        # Two workers finishing the same prompt would race on the entry directory and count
+        # its size twice; the second one waits and returns the first one's entry.
+        with self._key_locks[hash(key) % _KEY_LOCKS]:
+            if key in self:
+                entry = self._read(key)
+                if entry is not None:
+                    return entry
+            return self._write(key, prompt_id, history, images, write)
+
+    def _write(
+        self,
+        key: str,
+        prompt_id: str,
+        history: Mapping[str, Any],
+        images: Sequence[Mapping[str, Any]],
+        write: Callable[[int, Mapping[str, Any], Path], None],
+    ) -> Dict[str, Any]:
+        directory = self._entry_dir(key)
+        directory.parent.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(dir=directory.parent, prefix=f".{key}."))
+        try:
+            stored = []
+            for index, image in enumerate(images):
+                name = f"{index:03d}_{Path(image['filename']).name}"
+                write(index, image, staging / name)
+                stored.append({**image, "path": name})
+            entry = {"key": key, "prompt_id": prompt_id, "history": history, "images": stored}
+            (staging / _ENTRY_FILE).write_text(json.dumps(entry), encoding="utf-8")
+            size = sum(path.stat().st_size for path in staging.iterdir())
+            if directory.exists():
+                shutil.rmtree(directory)
+            os.replace(staging, directory)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        with self._lock:
+            self._total -= self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._total += size
+        self.evict()
+        for image in stored:
+            image["path"] = str(directory / image["path"])
+        return entry
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._total -= self._entries.pop(key, 0)
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def evict(self) -> List[str]:
+        evicted = []
+        while True:
+            with self._lock:
+                # The newest entry is kept even if it alone exceeds max_bytes.
+                if self._total <= self.max_bytes or len(self._entries) <= 1:
+                    break
+                key, size = self._entries.popitem(last=False)
+                self._total -= size
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            evicted.append(key)
+        return evicted
+
+    def export(
+        self,
+        entry: Mapping[str, Any],
+        target_dir: str | Path,
+        *,
+        claim: Callable[[Path], Path] | None = None,
+    ) -> List[Path]:
+        """Copy a cached entry's images to where a ``DownloadStage`` would have put them.
+
+        Pass the stage's ``claim`` so cached and downloaded outputs of one run get the same
+        ``_1``, ``_2`` ... suffixes on clashing names.
+        """
+        if claim is None:
+            claim = functools.partial(claim_path, set())
+        paths = []
+        for image in entry["images"]:
+            target = claim(Path(target_dir) / relative_target(image))
+            _copy_file(Path(image["path"]), target)
+            paths.append(target)
+        return paths
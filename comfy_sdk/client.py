@@ -1,46 +1,173 @@
 from __future__ import annotations
 
+import hashlib
 import json
+import mimetypes
+import os
+import socket
+import tempfile
+import threading
 import time
+import urllib.error
 import urllib.parse
-import urllib.request
 import uuid
-from typing import Any, Dict, Iterable, List
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Tuple
+
+from .timing import TimingRecorder
+from .transport import ConnectionPool
+from .websocket import WebSocket, WebSocketError
+
+# Websocket events after which ComfyUI has stopped working on a prompt.
+_TERMINAL_EVENTS = {"execution_success", "execution_error", "execution_interrupted"}
+_MAX_FINISHED = 1024
+_CHUNK_SIZE = 256 * 1024
+# Polling interval cap for attached prompts, whose websocket events go to another client.
+_ATTACHED_POLL_INTERVAL = 0.25
+
+
+def _encode_multipart(
+    fields: Mapping[str, str], file_field: str, filename: str, data: bytes
+) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    parts: List[bytes] = []
+    for name, value in fields.items():
+        header = f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+        parts.append(f"{header}{value}\r\n".encode("utf-8"))
+    parts.append(
+        (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode("utf-8")
+    )
+    parts.append(data)
+    parts.append(f"\r\n--{boundary}--\r\n".encode("utf-8"))
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
 
 
 class ComfyClient:
-    def __init__(self, base_url: str = "http://127.0.0.1:8188", timeout: float = 30.0) -> None:
+    def __init__(
+        self,
+        base_url: str = "http://127.0.0.1:8188",
+        timeout: float = 30.0,
+        *,
+        pool_size: int = 4,
+        timings: TimingRecorder | None = None,
+    ) -> None:
         self.base_url = base_url.rstrip("/")
         self.timeout = timeout
         self.client_id = str(uuid.uuid4())
+        self.pool = ConnectionPool(self.base_url, maxsize=pool_size, timeout=timeout)
+        self.timings = timings
+
+        self.socket_check_interval = 10.0
+        self._socket: WebSocket | None = None
+        self._socket_generation = 0
+        self._socket_lock = threading.Lock()
+        self._finished: "OrderedDict[str, str]" = OrderedDict()
+        self._queued_generation: Dict[str, int] = {}
+        self._attached: set[str] = set()
+        self._uploaded: Dict[Tuple[str, str, str], str] = {}
+        # Server queue length from the latest websocket "status" event, and when it arrived.
+        self.queue_remaining: int | None = None
+        self.queue_updated = 0.0
 
-    def _request(self, method: str, path: str, payload: bytes | None = None) -> Any:
-        url = f"{self.base_url}{path}"
-        headers = {"Content-Type": "application/json"} if payload is not None else {}
-        request = urllib.request.Request(url, data=payload, headers=headers, method=method)
-        with urllib.request.urlopen(request, timeout=self.timeout) as response:
-            content_type = response.headers.get("Content-Type", "")
-            if "application/json" in content_type:
-                return json.load(response)
-            return response.read()
-
-    def queue_prompt(self, prompt: Dict[str, Any]) -> str:
-        body = json.dumps({"prompt": prompt, "client_id": self.client_id}).encode("utf-8")
+    def __enter__(self) -> "ComfyClient":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._socket_lock:
+            self._drop_socket()
+        self.pool.close()
+
+    def _request(
+        self,
+        method: str,
+        path: str,
+        payload: bytes | None = None,
+        content_type: str = "application/json",
+    ) -> Any:
+        headers = {"Content-Type": content_type} if payload is not None else {}
+        _, response_headers, body = self.pool.request(method, path, payload, headers)
+        content_type = response_headers.get("Content-Type", "")
+        if "application/json" in content_type:
+            return json.loads(body)
+        return body
+
+    def queue_prompt(self, prompt: Dict[str, Any], *, front: bool = False) -> str:
+        payload: Dict[str, Any] = {"prompt": prompt, "client_id": self.client_id}
+        if front:
+            payload["front"] = True
+        body = json.dumps(payload).encode("utf-8")
+        generation = self._socket_generation if self._socket is not None else -1
+        started = time.time()
         response = self._request("POST", "/prompt", body)
-        return response["prompt_id"]
+        prompt_id = response["prompt_id"]
+        if self.timings is not None:
+            self.timings.queued(prompt_id, started, time.time())
+        if generation >= 0:
+            # The socket was already listening, so completion events for this prompt will arrive.
+            self._queued_generation[prompt_id] = generation
+            while len(self._queued_generation) > _MAX_FINISHED:
+                self._queued_generation.pop(next(iter(self._queued_generation)))
+        return prompt_id
 
     def get_history(self, prompt_id: str) -> Dict[str, Any]:
         return self._request("GET", f"/history/{prompt_id}")
 
+    def get_queue(self) -> Dict[str, Any]:
+        return self._request("GET", "/queue")
+
+    def attach(self, prompt_id: str, prompt: Dict[str, Any] | None = None) -> bool:
+        """Return True if the server still knows ``prompt_id``, queued or finished.
+
+        An attached prompt was queued under another ``client_id``, so its progress events never
+        reach this client's websocket; ``wait_for_prompt`` polls its history instead.
+        """
+        # Queue before history: a prompt finishing in between still shows up in one of them.
+        queue = self.get_queue()
+        for item in queue.get("queue_running", []) + queue.get("queue_pending", []):
+            if len(item) > 1 and item[1] == prompt_id:
+                self._attached.add(prompt_id)
+                return True
+        return prompt_id in self.get_history(prompt_id)
+
     def wait_for_prompt(
         self,
         prompt_id: str,
         *,
         poll_interval: float = 1.0,
         timeout: float = 300.0,
+        use_websocket: bool = True,
     ) -> Dict[str, Any]:
-        start = time.monotonic()
-        while time.monotonic() - start < timeout:
+        started = time.monotonic()
+        deadline = started + timeout
+        history = None
+        try:
+            self._attached.remove(prompt_id)
+        except KeyError:
+            attached = False
+        else:
+            attached = True
+        if attached:
+            poll_interval = min(poll_interval, _ATTACHED_POLL_INTERVAL)
+        elif use_websocket:
+            history = self._wait_with_websocket(prompt_id, deadline, poll_interval)
+        if history is None:
+            history = self._poll_history(prompt_id, deadline, poll_interval)
+        if self.timings is not None:
+            waited = time.monotonic() - started
+            self.timings.completed(prompt_id, history.get(prompt_id, {}), waited)
+        return history
+
+    def _poll_history(self, prompt_id: str, deadline: float, poll_interval: float) -> Dict[str, Any]:
+        while time.monotonic() < deadline:
             history = self.get_history(prompt_id)
             entry = history.get(prompt_id)
             if entry and entry.get("outputs"):
@@ -48,6 +175,104 @@ class ComfyClient:
             time.sleep(poll_interval)
         raise TimeoutError(f"Timed out waiting for prompt {prompt_id}")
 
+    def _socket_url(self) -> str:
+        parsed = urllib.parse.urlsplit(self.base_url)
+        scheme = "wss" if parsed.scheme == "https" else "ws"
+        query = urllib.parse.urlencode({"clientId": self.client_id})
+        return urllib.parse.urlunsplit((scheme, parsed.netloc, f"{parsed.path}/ws", query, ""))
+
+    def _drop_socket(self) -> None:
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _handle_event(self, message: Any) -> None:
+        if not isinstance(message, dict):
+            return
+        event = message.get("type")
+        data = message.get("data") or {}
+        if event == "status":
+            exec_info = (data.get("status") or {}).get("exec_info") or {}
+            if "queue_remaining" in exec_info:
+                self.queue_remaining = exec_info["queue_remaining"]
+                self.queue_updated = time.monotonic()
+            return
+        prompt_id = data.get("prompt_id")
+        if not prompt_id:
+            return
+        if event in _TERMINAL_EVENTS or (event == "executing" and data.get("node") is None):
+            self._finished.setdefault(prompt_id, event)
+            while len(self._finished) > _MAX_FINISHED:
+                self._finished.popitem(last=False)
+
+    def _wait_with_websocket(
+        self, prompt_id: str, deadline: float, poll_interval: float
+    ) -> Dict[str, Any] | None:
+        # Returns None when the websocket is unavailable so the caller can fall back to polling.
+        checked_generation = self._queued_generation.pop(prompt_id, -1)
+        last_check = time.monotonic()
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Timed out waiting for prompt {prompt_id}")
+
+            with self._socket_lock:
+                if self._finished.pop(prompt_id, None) is not None:
+                    break
+                if self._socket is None:
+                    try:
+                        self._socket = WebSocket.connect(self._socket_url(), timeout=self.timeout)
+                    except (OSError, WebSocketError):
+                        return None
+                    self._socket_generation += 1
+                generation = self._socket_generation
+
+            if generation != checked_generation:
+                # Events sent before this socket connected are lost; history covers that gap.
+                checked_generation = generation
+                last_check = time.monotonic()
+                history = self.get_history(prompt_id)
+                entry = history.get(prompt_id)
+                if entry and entry.get("outputs"):
+                    return history
+
+            with self._socket_lock:
+                if prompt_id in self._finished or self._socket is None:
+                    continue
+                try:
+                    self._socket.settimeout(min(remaining, 0.5))
+                    message = self._socket.recv()
+                except socket.timeout:
+                    # A silent socket may belong to a server that died without closing it.
+                    if time.monotonic() - last_check >= self.socket_check_interval:
+                        checked_generation = -1
+                    continue
+                except (OSError, WebSocketError, UnicodeDecodeError):
+                    self._drop_socket()
+                    continue
+                if message is None:
+                    self._drop_socket()
+                    continue
+                if isinstance(message, str):
+                    try:
+                        self._handle_event(json.loads(message))
+                    except ValueError:
+                        pass
+
+        # ComfyUI announces completion just before it records the history entry.
+        delay = 0.005
+        announced = time.monotonic()
+        while True:
+            history = self.get_history(prompt_id)
+            if history.get(prompt_id):
+                if self.timings is not None:
+                    self.timings.add(prompt_id, "history", time.monotonic() - announced)
+                return history
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Timed out waiting for prompt {prompt_id}")
+            time.sleep(delay)
+            delay = min(delay * 2, poll_interval)
+
     def extract_images(self, history: Dict[str, Any], prompt_id: str) -> List[Dict[str, Any]]:
         outputs = history.get(prompt_id, {}).get("outputs", {})
         images: List[Dict[str, Any]] = []
@@ -60,3 +285,109 @@ class ComfyClient:
             {"filename": filename, "subfolder": subfolder, "type": image_type}
         )
         return self._request("GET", f"/view?{query}")
+
+    def iter_image(
+        self,
+        filename: str,
+        *,
+        subfolder: str = "",
+        image_type: str = "output",
+        chunk_size: int = _CHUNK_SIZE,
+    ) -> Iterator[bytes]:
+        query = urllib.parse.urlencode(
+            {"filename": filename, "subfolder": subfolder, "type": image_type}
+        )
+        with self.pool.open("GET", f"/view?{query}") as response:
+            while True:
+                chunk = response.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def download_image_to(
+        self,
+        filename: str,
+        target: str | Path,
+        *,
+        subfolder: str = "",
+        image_type: str = "output",
+        expected_size: int | None = None,
+        chunk_size: int = _CHUNK_SIZE,
+    ) -> int:
+        """Stream an image into ``target`` through a temporary file and return its size.
+
+        The temporary file only replaces ``target`` once the byte count matches the server's
+        Content-Length and ``expected_size``, when given.
+        """
+        target = Path(target)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        query = urllib.parse.urlencode(
+            {"filename": filename, "subfolder": subfolder, "type": image_type}
+        )
+        handle = tempfile.NamedTemporaryFile(
+            dir=target.parent, prefix=f".{target.name}.", suffix=".part", delete=False
+        )
+        try:
+            with handle:
+                with self.pool.open("GET", f"/view?{query}") as response:
+                    length = response.getheader("Content-Length")
+                    written = 0
+                    while True:
+                        chunk = response.read(chunk_size)
+                        if not chunk:
+                            break
+                        handle.write(chunk)
+                        written += len(chunk)
+            for expected in (int(length) if length else None, expected_size):
+                if expected is not None and written != expected:
+                    raise RuntimeError(
+                        f"Downloaded {written} bytes for {filename!r} but expected {expected}"
+                    )
+            os.replace(handle.name, target)
+        except BaseException:
+            Path(handle.name).unlink(missing_ok=True)
+            raise
+        return written
+
+    def has_image(self, filename: str, *, subfolder: str = "", image_type: str = "input") -> bool:
+        query = urllib.parse.urlencode(
+            {"filename": filename, "subfolder": subfolder, "type": image_type}
+        )
+        try:
+            self._request("HEAD", f"/view?{query}")
+        except urllib.error.HTTPError as exc:
+            if exc.code == 404:
+                return False
+            raise
+        return True
+
+    def upload_image(
+        self,
+        path: str | Path,
+        *,
+        subfolder: str = "",
+        image_type: str = "input",
+    ) -> str:
+        """Upload ``path`` under a content-hash name and return the name for LoadImage.
+
+        Images the server already has, seen earlier by this client or found with a HEAD
+        request on ``/view``, are not sent again.
+        """
+        source = Path(path)
+        data = source.read_bytes()
+        filename = f"{hashlib.sha256(data).hexdigest()[:32]}{source.suffix.lower()}"
+        key = (subfolder, image_type, filename)
+        cached = self._uploaded.get(key)
+        if cached is not None:
+            return cached
+
+        if not self.has_image(filename, subfolder=subfolder, image_type=image_type):
+            fields = {"type": image_type, "subfolder": subfolder, "overwrite": "true"}
+            body, content_type = _encode_multipart(fields, "image", filename, data)
+            response = self._request("POST", "/upload/image", body, content_type)
+            filename = response.get("name", filename)
+            subfolder = response.get("subfolder", subfolder)
+
+        name = f"{subfolder}/{filename}" if subfolder else filename
+        self._uploaded[key] = name
+        return name
@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+
+IMAGE_SUFFIXES = frozenset({".jpg", ".jpeg", ".png", ".webp"})
+
+INDEX_NAME = ".comfy_dataset.json"
+
+_INDEX_VERSION = 1
+_CHUNK = 1024 * 1024
+# Bytes read from the start of a file to find its dimensions; JPEG EXIF blocks can be large.
+_HEADER_BYTES = 256 * 1024
+# JPEG start-of-frame markers; C4, C8 and CC share the range but carry no frame size.
+_JPEG_SOF = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def image_size(path: str | Path) -> Tuple[int, int] | None:
+    """Width and height from a PNG, JPEG or WebP header, without decoding the image."""
+    with open(path, "rb") as handle:
+        header = handle.read(_HEADER_BYTES)
+    if header.startswith(b"\x89PNG\r\n\x1a\n") and header[12:16] == b"IHDR":
+        return struct.unpack(">II", header[16:24])
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        chunk = header[12:16]
+        if chunk == b"VP8 " and len(header) >= 30:
+            width, height = struct.unpack("<HH", header[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L" and len(header) >= 25:
+            bits = int.from_bytes(header[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X" and len(header) >= 30:
+            return (
+                int.from_bytes(header[24:27], "little") + 1,
+                int.from_bytes(header[27:30], "little") + 1,
+            )
+        return None
+    if header[:2] == b"\xff\xd8":
+        position = 2
+        while position + 9 <= len(header):
+            if header[position] != 0xFF:
+                position += 1
+                continue
+            marker = header[position + 1]
+            if marker == 0xFF or 0xD0 <= marker <= 0xD9 or marker == 0x01:
+                position += 2 if marker != 0xFF else 1
+                continue
+            length = struct.unpack(">H", header[position + 2:position + 4])[0]
+            if marker in _JPEG_SOF:
+                height, width = struct.unpack(">HH", header[position + 5:position + 9])
+                return width, height
+            position += 2 + length
+    return None
+
+
+def file_sha256(path: str | Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def caption_tokens(text: str) -> List[str]:
+    """Comma-separated caption tags, with ``(tag:1.2)`` weights and brackets stripped."""
+    tokens = []
+    for part in text.split(","):
+        token = part.strip().strip("()[]{}").strip()
+        if ":" in token:
+            name, _, weight = token.rpartition(":")
+            try:
+                float(weight)
+            except ValueError:
+                pass
+            else:
+                token = name.strip("()[]{} ")
+        if token:
+            tokens.append(token)
+    return tokens
+
+
+def _stamp(path: Path) -> Tuple[int, int] | None:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class DatasetIndex:
+    """Catalog of a training image folder kept in one JSON file next to the images.
+
+    Each image is recorded with its size, mtime, dimensions, SHA-256 and the tokens of its
+    ``.txt`` sidecar caption. ``update`` rescans the folder but only re-reads files whose size
+    or mtime changed, so queries such as ``missing_captions`` or ``with_token`` never open an
+    image.
+    """
+
+    def __init__(self, root: str | Path, index_path: str | Path | None = None) -> None:
+        self.root = Path(root)
+        self.index_path = Path(index_path) if index_path is not None else self.root / INDEX_NAME
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._by_token: Dict[str, set[str]] = {}
+        if self.index_path.exists():
+            with open(self.index_path, encoding="utf-8") as handle:
+                data = json.load(handle)
+            if data.get("version") == _INDEX_VERSION:
+                for relpath, entry in data.get("images", {}).items():
+                    self._add(relpath, entry)
+
+    def _add(self, relpath: str, entry: Dict[str, Any]) -> None:
+        self._remove(relpath)
+        self._entries[relpath] = entry
+        for token in entry.get("tokens") or ():
+            self._by_token.setdefault(token.lower(), set()).add(relpath)
+
+    def _remove(self, relpath: str) -> None:
+        entry = self._entries.pop(relpath, None)
+        if entry is None:
+            return
+        for token in entry.get("tokens") or ():
+            paths = self._by_token.get(token.lower())
+            if paths is not None:
+                paths.discard(relpath)
+                if not paths:
+                    del self._by_token[token.lower()]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, relpath: str) -> bool:
+        return relpath in self._entries
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return (self._record(relpath) for relpath in sorted(self._entries))
+
+    def _record(self, relpath: str) -> Dict[str, Any]:
+        return {"path": relpath, **self._entries[relpath]}
+
+    def get(self, relpath: str) -> Dict[str, Any] | None:
+        return self._record(relpath) if relpath in self._entries else None
+
+    def annotate(self, relpath: str, **values: Any) -> None:
+        """Store extra fields on an image, such as a fingerprint; dropped when the image changes."""
+        with self._lock:
+            self._entries[relpath].update(values)
+
+    def absolute(self, relpath: str) -> Path:
+        return self.root / relpath
+
+    def _scan(self) -> Iterator[Path]:
+        stack = [self.root]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(Path(entry.path))
+                    elif Path(entry.name).suffix.lower() in IMAGE_SUFFIXES:
+                        yield Path(entry.path)
+
+    def _caption(self, image: Path, entry: Dict[str, Any]) -> None:
+        caption = image.with_suffix(".txt")
+        stamp = _stamp(caption)
+        if stamp is None:
+            entry["caption_stamp"] = None
+            entry["tokens"] = None
+            return
+        if entry.get("caption_stamp") != list(stamp):
+            entry["caption_stamp"] = list(stamp)
+            entry["tokens"] = caption_tokens(caption.read_text(encoding="utf-8", errors="replace"))
+
+    @staticmethod
+    def _describe(image: Path, stamp: Tuple[int, int]) -> Dict[str, Any]:
+        size = image_size(image)
+        return {
+            "size": stamp[0],
+            "mtime_ns": stamp[1],
+            "width": size[0] if size else None,
+            "height": size[1] if size else None,
+            "sha256": file_sha256(image),
+        }
+
+    def update(self, *, workers: int = 4, save: bool = True) -> Dict[str, int]:
+        """Bring the index in line with the folder; returns counts of what changed.
+
+        Only new images and images whose size or mtime changed are hashed, in parallel.
+        Captions are re-read when their own size or mtime changed.
+        """
+        counts = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0, "captions": 0}
+        seen = set()
+        stale: List[Tuple[str, Path, Tuple[int, int]]] = []
+        for image in self._scan():
+            relpath = image.relative_to(self.root).as_posix()
+            stamp = _stamp(image)
+            if stamp is None:
+                continue
+            seen.add(relpath)
+            entry = self._entries.get(relpath)
+            if entry is not None and (entry["size"], entry["mtime_ns"]) == stamp:
+                updated = dict(entry)
+                self._caption(image, updated)
+                if updated.get("caption_stamp") != entry.get("caption_stamp"):
+                    counts["captions"] += 1
+                    with self._lock:
+                        self._add(relpath, updated)
+                counts["unchanged"] += 1
+                continue
+            stale.append((relpath, image, stamp))
+
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            described = executor.map(lambda item: self._describe(item[1], item[2]), stale)
+            for (relpath, image, _), entry in zip(stale, described):
+                counts["changed" if relpath in self._entries else "added"] += 1
+                self._caption(image, entry)
+                with self._lock:
+                    self._add(relpath, entry)
+
+        with self._lock:
+            for relpath in set(self._entries) - seen:
+                self._remove(relpath)
+                counts["removed"] += 1
+        if save:
+            self.save()
+        return counts
+
+    def save(self) -> None:
+        """Write the index atomically, so readers never see a half-written file."""
+        with self._lock:
+            data = {
+                "version": _INDEX_VERSION,
+                "images": {relpath: self._entries[relpath] for relpath in sorted(self._entries)},
+            }
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=self.index_path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "w", encoding="utf-8") as stream:
+                json.dump(data, stream, separators=(",", ":"))
+            os.replace(temp_path, self.index_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def missing_captions(self) -> List[Dict[str, Any]]:
+        return [record for record in self if record.get("tokens") is None]
+
+    def with_token(self, token: str) -> List[Dict[str, Any]]:
+        """Images whose caption has ``token`` as a whole tag, case-insensitively."""
+        return [self._record(relpath) for relpath in sorted(self._by_token.get(token.lower(), ()))]
+
+    def with_tokens(self, tokens: Sequence[str]) -> List[Dict[str, Any]]:
+        """Images whose caption has every one of ``tokens``."""
+        if not tokens:
+            return list(self)
+        matches = set.intersection(*(self._by_token.get(token.lower(), set()) for token in tokens))
+        return [self._record(relpath) for relpath in sorted(matches)]
+
+    def token_counts(self) -> Dict[str, int]:
+        return {token: len(paths) for token, paths in sorted(self._by_token.items())}
+
+    def duplicates(self) -> List[List[str]]:
+        """Groups of paths with identical content, by SHA-256."""
+        by_hash: Dict[str, List[str]] = {}
+        for relpath in sorted(self._entries):
+            by_hash.setdefault(self._entries[relpath]["sha256"], []).append(relpath)
+        return [paths for paths in by_hash.values() if len(paths) > 1]
@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Hashable, Iterable, List, Sequence, Tuple
+
+from .dataset import DatasetIndex
+
+METHODS = ("phash", "ahash")
+
+# Images are reduced to this square before hashing; the hash keeps the 8x8 low frequencies.
+_SAMPLE = 32
+_HASH_SIDE = 8
+
+
+def _require_imaging() -> Tuple[Any, Any]:
+    try:
+        import numpy
+        from PIL import Image
+    except ImportError as exc:
+        raise ImportError(
+            "Perceptual hashing needs NumPy and Pillow; "
+            "install them with 'pip install numpy pillow'"
+        ) from exc
+    return numpy, Image
+
+
+def _load_sample(path: str) -> Tuple[bytes | None, str | None]:
+    # Runs in a worker process. ``draft`` lets the JPEG decoder downscale while decoding,
+    # which is most of the saving on multi-megabyte photos. A file that will not decode comes
+    # back as an error message, so one bad image does not end the whole scan.
+    _, Image = _require_imaging()
+    try:
+        with Image.open(path) as image:
+            image.draft("L", (_SAMPLE * 2, _SAMPLE * 2))
+            sample = image.convert("L").resize((_SAMPLE, _SAMPLE), Image.LANCZOS).tobytes()
+    except Exception as exc:
+        return None, f"{type(exc).__name__}: {exc}"
+    return sample, None
+
+
+def _dct_matrix(numpy: Any, size: int) -> Any:
+    rows = numpy.arange(size)[:, None]
+    columns = numpy.arange(size)[None, :]
+    matrix = numpy.cos(numpy.pi * (2 * columns + 1) * rows / (2 * size)) * numpy.sqrt(2 / size)
+    matrix[0] /= numpy.sqrt(2)
+    return matrix
+
+
+def hash_samples(samples: Sequence[bytes], method: str = "phash") -> List[int]:
+    """64-bit hashes of ``_SAMPLE`` x ``_SAMPLE`` grayscale samples, computed as one batch.
+
+    ``phash`` thresholds the lowest 8x8 DCT coefficients at their median (the DC term is left
+    out of the median); ``ahash`` thresholds an 8x8 box-filtered image at its mean.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown hash method {method!r}; expected one of {METHODS}")
+    numpy, _ = _require_imaging()
+    if not samples:
+        return []
+    pixels = numpy.frombuffer(b"".join(samples), dtype=numpy.uint8)
+    pixels = pixels.reshape(len(samples), _SAMPLE, _SAMPLE).astype(numpy.float32)
+    if method == "phash":
+        dct = _dct_matrix(numpy, _SAMPLE).astype(numpy.float32)
+        low = (dct @ pixels @ dct.T)[:, :_HASH_SIDE, :_HASH_SIDE].reshape(len(samples), -1)
+        threshold = numpy.median(low[:, 1:], axis=1, keepdims=True)
+    else:
+        block = _SAMPLE // _HASH_SIDE
+        low = pixels.reshape(len(samples), _HASH_SIDE, block, _HASH_SIDE, block).mean(axis=(2, 4))
+        low = low.reshape(len(samples), -1)
+        threshold = low.mean(axis=1, keepdims=True)
+    packed = numpy.packbits(low > threshold, axis=1)
+    return [int.from_bytes(row.tobytes(), "big") for row in packed]
+
+
+def perceptual_hashes(
+    paths: Sequence[str | Path], *, method: str = "phash", workers: int | None = None
+) -> Tuple[Dict[str, int], Dict[str, str]]:
+    """Hash ``paths``: images are decoded in a process pool, then hashed in one NumPy batch.
+
+    Returns ``(hashes, errors)``, both keyed by path as given; a file that cannot be decoded
+    is left out of ``hashes`` and its error message goes in ``errors``.
+    """
+    _require_imaging()
+    names = [str(path) for path in paths]
+    if not names:
+        return {}, {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        loaded = list(executor.map(_load_sample, names, chunksize=16))
+    errors = {name: error for name, (_, error) in zip(names, loaded) if error is not None}
+    decoded = [(name, sample) for name, (sample, _) in zip(names, loaded) if sample is not None]
+    values = hash_samples([sample for _, sample in decoded], method)
+    return {name: value for (name, _), value in zip(decoded, values)}, errors
+
+
+def hamming(first: int, second: int) -> int:
+    return bin(first ^ second).count("1")
+
+
+def _popcount(numpy: Any, values: Any) -> Any:
+    table = numpy.array([bin(byte).count("1") for byte in range(256)], dtype=numpy.uint8)
+    return table[values.view(numpy.uint8)].reshape(len(values), 8).sum(axis=1)
+
+
+def near_pairs(values: Sequence[int], threshold: int) -> List[Tuple[int, int]]:
+    """Index pairs ``(i, j)``, ``i < j``, of hashes at most ``threshold`` bits apart.
+
+    Multi-index hashing: the 64 bits are cut into ``threshold + 1`` chunks, and two hashes that
+    close must agree exactly on at least one chunk. Only hashes sharing a chunk value are
+    compared, and each chunk's candidates are checked in one vectorised popcount.
+    """
+    numpy, _ = _require_imaging()
+    hashes = numpy.array(values, dtype=numpy.uint64)
+    if len(hashes) < 2:
+        return []
+    chunks = min(max(threshold, 0) + 1, 64)
+    bounds = [64 * chunk // chunks for chunk in range(chunks + 1)]
+    found = []
+    for low, high in zip(bounds, bounds[1:]):
+        mask = numpy.uint64((1 << (high - low)) - 1)
+        keys = (hashes >> numpy.uint64(low)) & mask
+        order = numpy.argsort(keys, kind="stable")
+        starts = numpy.flatnonzero(numpy.diff(keys[order])) + 1
+        firsts, ends = numpy.r_[0, starts], numpy.r_[starts, len(order)]
+        left, right = [], []
+        for first, end in zip(firsts[ends - firsts > 1], ends[ends - firsts > 1]):
+            group = order[first:end]
+            rows, columns = numpy.triu_indices(len(group), 1)
+            left.append(group[rows])
+            right.append(group[columns])
+        if not left:
+            continue
+        first_index, second_index = numpy.concatenate(left), numpy.concatenate(right)
+        close = _popcount(numpy, hashes[first_index] ^ hashes[second_index]) <= threshold
+        pairs = numpy.sort(numpy.stack([first_index[close], second_index[close]], axis=1), axis=1)
+        found.append(pairs[:, 0].astype(numpy.int64) * len(hashes) + pairs[:, 1])
+    if not found:
+        return []
+    codes = numpy.unique(numpy.concatenate(found))
+    return [(int(code) // len(hashes), int(code) % len(hashes)) for code in codes]
+
+
+def cluster_hashes(hashes: Iterable[Tuple[Hashable, int]], threshold: int) -> List[List[Hashable]]:
+    """Groups of keys linked by hashes at most ``threshold`` bits apart, in input order.
+
+    Linking is transitive, so a chain of small steps ends up in one cluster.
+    """
+    items = list(hashes)
+    parent = list(range(len(items)))
+
+    def _find(position: int) -> int:
+        while parent[position] != position:
+            parent[position] = parent[parent[position]]
+            position = parent[position]
+        return position
+
+    for first, second in near_pairs([value for _, value in items], threshold):
+        root, other = _find(first), _find(second)
+        if root != other:
+            parent[max(root, other)] = min(root, other)
+
+    clusters: Dict[int, List[Hashable]] = {}
+    for position, (key, _) in enumerate(items):
+        clusters.setdefault(_find(position), []).append(key)
+    return [members for members in clusters.values() if len(members) > 1]
+
+
+class DuplicateFinder:
+    """Near-duplicate images in a dataset folder, by perceptual hash.
+
+    Hashes are stored in the folder's ``DatasetIndex``, so only new or changed images are
+    decoded on later runs. In each cluster the image to keep is the one with a caption and
+    the most pixels, then the first by path; the rest are reported as duplicates. Images that
+    cannot be decoded are skipped and listed in ``errors``.
+    """
+
+    def __init__(
+        self,
+        root: str | Path,
+        *,
+        threshold: int = 6,
+        method: str = "phash",
+        workers: int | None = None,
+    ) -> None:
+        if method not in METHODS:
+            raise ValueError(f"Unknown hash method {method!r}; expected one of {METHODS}")
+        self.index = DatasetIndex(root)
+        self.threshold = threshold
+        self.method = method
+        self.workers = workers
+        self.errors: Dict[str, str] = {}
+
+    def fingerprint(self) -> int:
+        """Hash the images that have no stored hash yet; returns how many were hashed."""
+        self.index.update(save=False)
+        missing = {
+            str(self.index.absolute(record["path"])): record["path"]
+            for record in self.index
+            if self.method not in record
+        }
+        values, errors = perceptual_hashes(list(missing), method=self.method, workers=self.workers)
+        for path, value in values.items():
+            self.index.annotate(missing[path], **{self.method: f"{value:016x}"})
+        self.errors = {missing[path]: error for path, error in errors.items()}
+        self.index.save()
+        return len(values)
+
+    def clusters(self) -> List[Dict[str, Any]]:
+        """Fingerprint, then return ``{"keep", "duplicates"}`` records per cluster."""
+        self.fingerprint()
+        records = {record["path"]: record for record in self.index}
+        hashes = (
+            (relpath, int(record[self.method], 16))
+            for relpath, record in records.items()
+            if self.method in record
+        )
+        found = []
+        for members in cluster_hashes(hashes, self.threshold):
+            ranked = sorted(
+                (records[relpath] for relpath in members),
+                key=lambda record: (
+                    record.get("tokens") is None,
+                    -((record.get("width") or 0) * (record.get("height") or 0)),
+                    record["path"],
+                ),
+            )
+            found.append({"keep": ranked[0], "duplicates": ranked[1:]})
+        return found
+
+    def report(self, clusters: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+        """JSON-ready summary: each cluster's kept path and its duplicates with their distance."""
+        method = self.method
+        return {
+            "root": str(self.index.root),
+            "method": self.method,
+            "threshold": self.threshold,
+            "images": len(self.index),
+            "duplicates": sum(len(cluster["duplicates"]) for cluster in clusters),
+            "skipped": dict(sorted(self.errors.items())),
+            "clusters": [
+                {
+                    "keep": cluster["keep"]["path"],
+                    "duplicates": [
+                        {
+                            "path": record["path"],
+                            "distance": hamming(
+                                int(cluster["keep"][method], 16), int(record[method], 16)
+                            ),
+                        }
+                        for record in cluster["duplicates"]
+                    ],
+                }
+                for cluster in clusters
+            ],
+        }
+
+    def quarantine(self, clusters: Sequence[Dict[str, Any]], target: str | Path) -> List[Path]:
+        """Move each duplicate and its caption sidecar under ``target``, keeping relative paths."""
+        target = Path(target)
+        moved = []
+        for cluster in clusters:
+            for record in cluster["duplicates"]:
+                source = self.index.absolute(record["path"])
+                for path in (source, source.with_suffix(".txt")):
+                    if not path.exists():
+                        continue
+                    destination = target / path.relative_to(self.index.root)
+                    destination.parent.mkdir(parents=True, exist_ok=True)
+                    shutil.move(str(path), str(destination))
+                    moved.append(destination)
+        self.index.update()
+        return moved
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import threading
+import urllib.parse
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+from typing import Any, Dict, Iterable, List, Mapping, Tuple
+
+from .client import ComfyClient
+from .pool import ComfyPool
+
+_HOST_SLOTS: Dict[Tuple[str, int], threading.BoundedSemaphore] = {}
+_HOST_SLOTS_LOCK = threading.Lock()
+
+
+def host_slots(base_url: str, limit: int) -> threading.BoundedSemaphore:
+    # Shared by every DownloadStage in the process with the same limit, so that limit holds
+    # per host, not per stage.
+    key = (urllib.parse.urlsplit(base_url).netloc, limit)
+    with _HOST_SLOTS_LOCK:
+        slots = _HOST_SLOTS.get(key)
+        if slots is None:
+            slots = _HOST_SLOTS[key] = threading.BoundedSemaphore(limit)
+        return slots
+
+
+def relative_target(image: Mapping[str, Any]) -> Path:
+    """Where an output image goes under a download folder: ``subfolder / filename``.
+
+    The server's subfolder is kept, minus anything that could climb out of the folder.
+    """
+    subfolder = str(image.get("subfolder") or "").replace("\\", "/")
+    parts = [part for part in PurePosixPath(subfolder).parts if part not in ("/", ".", "..")]
+    return Path(*parts, PurePosixPath(image["filename"]).name)
+
+
+def claim_path(claimed: set[Path], target: Path) -> Path:
+    """Add ``target`` to ``claimed``, suffixed ``_1``, ``_2`` ... if an earlier output has it."""
+    candidate, suffix = target, 0
+    while candidate in claimed:
+        suffix += 1
+        candidate = target.with_name(f"{target.stem}_{suffix}{target.suffix}")
+    claimed.add(candidate)
+    return candidate
+
+
+class DownloadStage:
+    """Thread pool that fetches prompt outputs in parallel, bounded per ComfyUI host.
+
+    ``per_host`` bounds concurrent downloads from one host across every stage in the process
+    that uses the same ``per_host``; stages with a different value get a budget of their own.
+    Outputs land under ``target_dir / subfolder / filename``. A path already claimed by an
+    earlier output of this stage gets a ``_1``, ``_2`` ... suffix instead of being overwritten.
+    """
+
+    def __init__(self, client: ComfyClient | ComfyPool, *, max_workers: int = 4, per_host: int = 4) -> None:
+        if max_workers < 1 or per_host < 1:
+            raise ValueError("max_workers and per_host must be at least 1")
+        self.client = client
+        self.per_host = per_host
+        self._lock = threading.Lock()
+        self._claimed: set[Path] = set()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="comfy-download")
+
+    def __enter__(self) -> "DownloadStage":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def _download(self, image: Mapping[str, Any], target: Path, prompt_id: str | None) -> Path:
+        # A ComfyPool knows which of its servers produced the image; a plain client is the server.
+        route = getattr(self.client, "client_for_image", None)
+        client = route(image, prompt_id) if route is not None else self.client
+        with host_slots(client.base_url, self.per_host):
+            client.download_image_to(
+                image["filename"],
+                target,
+                subfolder=image.get("subfolder", ""),
+                image_type=image.get("type", "output"),
+            )
+        return target
+
+    def claim(self, target: Path) -> Path:
+        """Reserve ``target`` for this stage, or a suffixed name if it is already taken."""
+        with self._lock:
+            return claim_path(self._claimed, target)
+
+    def submit(
+        self,
+        images: Iterable[Mapping[str, Any]],
+        target_dir: str | Path,
+        *,
+        prompt_id: str | None = None,
+    ) -> List[Future]:
+        """Queue downloads; ``prompt_id`` tells a ``ComfyPool`` which server made the images."""
+        directory = Path(target_dir)
+        return [
+            self._executor.submit(
+                self._download, image, self.claim(directory / relative_target(image)), prompt_id
+            )
+            for image in images
+        ]
+
+    def download(
+        self,
+        images: Iterable[Mapping[str, Any]],
+        target_dir: str | Path,
+        *,
+        prompt_id: str | None = None,
+    ) -> List[Path]:
+        return [
+            future.result() for future in self.submit(images, target_dir, prompt_id=prompt_id)
+        ]
+
+
+def download_images(
+    client: ComfyClient | ComfyPool,
+    images: Iterable[Mapping[str, Any]],
+    target_dir: str | Path,
+    *,
+    max_workers: int = 4,
+    per_host: int = 4,
+    prompt_id: str | None = None,
+) -> List[Path]:
+    with DownloadStage(client, max_workers=max_workers, per_host=per_host) as stage:
+        return stage.download(images, target_dir, prompt_id=prompt_id)
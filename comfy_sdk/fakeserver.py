@@ -0,0 +1,388 @@
+from __future__ import annotations
+
+import base64
+import email.parser
+import email.policy
+import hashlib
+import json
+import socket
+import struct
+import threading
+import time
+import urllib.parse
+import uuid
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, List, Tuple
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+QueueItem = Tuple[int, str, Dict[str, Any], Dict[str, Any]]
+
+
+class FakeComfyServer:
+    """In-process stand-in for the ComfyUI HTTP and websocket API, for tests and benchmarks.
+
+    Prompts run one at a time, like ComfyUI, by sleeping ``sampling_delay`` seconds, after
+    which every SaveImage node produces ``batch_size`` PNG-signed files of ``image_bytes``
+    bytes. ``history_delay`` holds the history entry back after completion is announced, as
+    a slow server does. Request counts and bytes moved are kept for reporting.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        *,
+        sampling_delay: float = 0.05,
+        image_bytes: int = 64 * 1024,
+        progress_steps: int = 0,
+        history_delay: float = 0.0,
+    ) -> None:
+        self.sampling_delay = sampling_delay
+        self.image_bytes = image_bytes
+        self.progress_steps = progress_steps
+        self.history_delay = history_delay
+
+        self.history: Dict[str, Dict[str, Any]] = {}
+        self.outputs: Dict[Tuple[str, str, str], bytes] = {}
+        self.inputs: Dict[Tuple[str, str], bytes] = {}
+        self.request_counts: Counter[str] = Counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.connections = 0
+        self.prompts_executed = 0
+        self.max_queue_depth = 0
+
+        self._pending: Deque[QueueItem] = deque()
+        self._running: QueueItem | None = None
+        self._number = 0
+        self._image_counter = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._sockets: Dict[str, List[socket.socket]] = {}
+        self._closed = False
+
+        self._httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._httpd.daemon_threads = True
+        self._threads: List[threading.Thread] = []
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeComfyServer":
+        self._threads = [
+            threading.Thread(target=self._httpd.serve_forever, daemon=True),
+            threading.Thread(target=self._worker, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self) -> None:
+        with self._wakeup:
+            self._closed = True
+            self._wakeup.notify_all()
+            sockets = [sock for group in self._sockets.values() for sock in group]
+            self._sockets.clear()
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+                sock.close()
+            except OSError:
+                pass
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+    def __enter__(self) -> "FakeComfyServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def queue_snapshot(self) -> Dict[str, List[List[Any]]]:
+        with self._lock:
+            running = [self._running] if self._running else []
+            pending = list(self._pending)
+        return {
+            "queue_running": [[n, pid, prompt, extra, []] for n, pid, prompt, extra in running],
+            "queue_pending": [[n, pid, prompt, extra, []] for n, pid, prompt, extra in pending],
+        }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.request_counts.clear()
+            self.bytes_in = self.bytes_out = self.connections = 0
+            self.prompts_executed = self.max_queue_depth = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": dict(self.request_counts),
+                "connections": self.connections,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "prompts_executed": self.prompts_executed,
+                "max_queue_depth": self.max_queue_depth,
+            }
+
+    def submit(
+        self, prompt: Dict[str, Any], client_id: str | None, front: bool = False
+    ) -> Dict[str, Any]:
+        prompt_id = str(uuid.uuid4())
+        with self._wakeup:
+            self._number += 1
+            item = (self._number, prompt_id, prompt, {"client_id": client_id})
+            if front:
+                self._pending.appendleft(item)
+            else:
+                self._pending.append(item)
+            depth = len(self._pending) + bool(self._running)
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+            self._wakeup.notify_all()
+        return {"prompt_id": prompt_id, "number": item[0], "node_errors": {}}
+
+    def _worker(self) -> None:
+        while True:
+            with self._wakeup:
+                while not self._pending and not self._closed:
+                    self._wakeup.wait()
+                if self._closed:
+                    return
+                self._running = self._pending.popleft()
+            number, prompt_id, prompt, extra = self._running
+            client_id = extra.get("client_id")
+            start_ms = int(time.time() * 1000)
+            self._broadcast(
+                client_id, "execution_start", {"prompt_id": prompt_id, "timestamp": start_ms}
+            )
+            for node_id in prompt:
+                self._broadcast(client_id, "executing", {"node": node_id, "prompt_id": prompt_id})
+            for step in range(self.progress_steps):
+                time.sleep(self.sampling_delay / max(self.progress_steps, 1))
+                self._broadcast(
+                    client_id,
+                    "progress",
+                    {"value": step + 1, "max": self.progress_steps, "prompt_id": prompt_id},
+                )
+            if not self.progress_steps:
+                time.sleep(self.sampling_delay)
+
+            outputs = self._render(prompt)
+            end_ms = int(time.time() * 1000)
+            for node_id, output in outputs.items():
+                executed = {"node": node_id, "output": output, "prompt_id": prompt_id}
+                self._broadcast(client_id, "executed", executed)
+            entry = {
+                "prompt": [number, prompt_id, prompt, extra, list(outputs)],
+                "outputs": outputs,
+                "status": {
+                    "status_str": "success",
+                    "completed": True,
+                    "messages": [
+                        ["execution_start", {"prompt_id": prompt_id, "timestamp": start_ms}],
+                        ["execution_success", {"prompt_id": prompt_id, "timestamp": end_ms}],
+                    ],
+                },
+            }
+            # Like ComfyUI, completion is announced just before the history entry is stored.
+            self._broadcast(
+                client_id, "execution_success", {"prompt_id": prompt_id, "timestamp": end_ms}
+            )
+            self._broadcast(client_id, "executing", {"node": None, "prompt_id": prompt_id})
+            if self.history_delay:
+                time.sleep(self.history_delay)
+            with self._lock:
+                self.history[prompt_id] = entry
+                self._running = None
+                self.prompts_executed += 1
+
+    def _render(self, prompt: Dict[str, Any]) -> Dict[str, Any]:
+        batch_size = 1
+        for node in prompt.values():
+            if node.get("class_type") == "EmptyLatentImage":
+                batch_size = int(node.get("inputs", {}).get("batch_size", 1) or 1)
+        outputs: Dict[str, Any] = {}
+        for node_id, node in prompt.items():
+            if node.get("class_type") != "SaveImage":
+                continue
+            prefix = str(node.get("inputs", {}).get("filename_prefix", "ComfyUI"))
+            images = []
+            for _ in range(batch_size):
+                with self._lock:
+                    self._image_counter += 1
+                    counter = self._image_counter
+                filename = f"{prefix}_{counter:05d}_.png"
+                body = _PNG_SIGNATURE + hashlib.sha256(filename.encode()).digest()
+                body += b"\0" * max(self.image_bytes - len(body), 0)
+                with self._lock:
+                    self.outputs[(filename, "", "output")] = body
+                images.append({"filename": filename, "subfolder": "", "type": "output"})
+            outputs[node_id] = {"images": images}
+        return outputs
+
+    def _broadcast(self, client_id: str | None, event: str, data: Dict[str, Any]) -> None:
+        if client_id is None:
+            return
+        frame = _ws_frame(json.dumps({"type": event, "data": data}).encode("utf-8"))
+        with self._lock:
+            sockets = list(self._sockets.get(client_id, []))
+        for sock in sockets:
+            try:
+                sock.sendall(frame)
+            except OSError:
+                with self._lock:
+                    group = self._sockets.get(client_id, [])
+                    if sock in group:
+                        group.remove(sock)
+
+    def _register_socket(self, client_id: str, sock: socket.socket) -> None:
+        with self._lock:
+            self._sockets.setdefault(client_id, []).append(sock)
+            queue_remaining = len(self._pending) + bool(self._running)
+        status = {"status": {"exec_info": {"queue_remaining": queue_remaining}}, "sid": client_id}
+        sock.sendall(_ws_frame(json.dumps({"type": "status", "data": status}).encode("utf-8")))
+
+
+def _ws_frame(payload: bytes, opcode: int = 0x1) -> bytes:
+    header = bytes([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        header += bytes([length])
+    elif length < 1 << 16:
+        header += bytes([126]) + struct.pack("!H", length)
+    else:
+        header += bytes([127]) + struct.pack("!Q", length)
+    return header + payload
+
+
+def _make_handler(server: FakeComfyServer) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def setup(self) -> None:
+            super().setup()
+            with server._lock:
+                server.connections += 1
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+        def _route(self) -> Tuple[str, Dict[str, str]]:
+            parsed = urllib.parse.urlsplit(self.path)
+            query = dict(urllib.parse.parse_qsl(parsed.query, keep_blank_values=True))
+            endpoint = "/" + parsed.path.lstrip("/").split("/", 1)[0]
+            with server._lock:
+                server.request_counts[f"{self.command} {endpoint}"] += 1
+            return parsed.path, query
+
+        def _body(self) -> bytes:
+            length = int(self.headers.get("Content-Length", 0))
+            data = self.rfile.read(length) if length else b""
+            with server._lock:
+                server.bytes_in += len(data)
+            return data
+
+        def _send(self, status: int, body: bytes, content_type: str) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if self.command == "HEAD":
+                return
+            self.wfile.write(body)
+            with server._lock:
+                server.bytes_out += len(body)
+
+        def _json(self, payload: Any, status: int = 200) -> None:
+            self._send(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+        def do_GET(self) -> None:
+            path, query = self._route()
+            if path == "/ws":
+                self._websocket(query.get("clientId", ""))
+            elif path == "/queue":
+                self._json(server.queue_snapshot())
+            elif path.startswith("/history/"):
+                prompt_id = path[len("/history/"):]
+                with server._lock:
+                    entry = server.history.get(prompt_id)
+                self._json({prompt_id: entry} if entry else {})
+            elif path == "/view":
+                key = (
+                    query.get("filename", ""),
+                    query.get("subfolder", ""),
+                    query.get("type", "output"),
+                )
+                with server._lock:
+                    body = server.outputs.get(key)
+                    if body is None and key[2] == "input":
+                        body = server.inputs.get((key[1], key[0]))
+                if body is None:
+                    self._send(404, b"not found", "text/plain")
+                else:
+                    self._send(200, body, "image/png")
+            else:
+                self._send(404, b"not found", "text/plain")
+
+        do_HEAD = do_GET
+
+        def do_POST(self) -> None:
+            path, _ = self._route()
+            body = self._body()
+            if path == "/prompt":
+                payload = json.loads(body)
+                front = bool(payload.get("front"))
+                self._json(server.submit(payload["prompt"], payload.get("client_id"), front))
+            elif path == "/upload/image":
+                self._upload(body)
+            else:
+                self._send(404, b"not found", "text/plain")
+
+        def _upload(self, body: bytes) -> None:
+            content_type = self.headers.get("Content-Type", "")
+            header = f"Content-Type: {content_type}\r\n\r\n".encode("latin-1")
+            message = email.parser.BytesParser(policy=email.policy.default).parsebytes(header + body)
+            fields: Dict[str, Any] = {}
+            image: Tuple[str, bytes] | None = None
+            for part in message.iter_parts():
+                name = part.get_param("name", header="content-disposition")
+                filename = part.get_filename()
+                payload = part.get_payload(decode=True) or b""
+                if filename is not None and name == "image":
+                    image = (filename, payload)
+                else:
+                    fields[name] = payload.decode("utf-8")
+            if image is None:
+                self._send(400, b"missing image", "text/plain")
+                return
+            subfolder = fields.get("subfolder", "")
+            with server._lock:
+                server.inputs[(subfolder, image[0])] = image[1]
+            self._json({"name": image[0], "subfolder": subfolder, "type": fields.get("type", "input")})
+
+        def _websocket(self, client_id: str) -> None:
+            key = self.headers.get("Sec-WebSocket-Key", "")
+            accept = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode("ascii")).digest())
+            self.send_response(101, "Switching Protocols")
+            self.send_header("Upgrade", "websocket")
+            self.send_header("Connection", "Upgrade")
+            self.send_header("Sec-WebSocket-Accept", accept.decode("ascii"))
+            self.end_headers()
+            self.wfile.flush()
+            server._register_socket(client_id, self.connection)
+            # Hold the connection open until the client goes away; inbound frames are ignored.
+            try:
+                while self.rfile.read(1):
+                    pass
+            except OSError:
+                pass
+            self.close_connection = True
+
+    return Handler
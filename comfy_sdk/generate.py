@@ -1,11 +1,18 @@
 from __future__ import annotations
 
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait as wait_futures
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, Iterator, Mapping, Tuple
 
+from .cache import ResultCache, prompt_hash
 from .client import ComfyClient
+from .download import DownloadStage
+from .journal import JobJournal, prompt_seed
+from .ordering import JobPlan, estimate_reloads, model_signature, order_by_model
+from .pool import ComfyPool
 from .workflow import (
-    load_workflow,
+    load_template,
     set_checkpoint,
     set_latent_size,
     set_lora,
@@ -14,7 +21,6 @@ from .workflow import (
     set_output_prefix,
     set_positive_prompt,
     set_sampler_params,
-    workflow_to_prompt,
 )
 
 DEFAULT_WORKFLOW_PATH = Path(__file__).resolve().parents[1] / "workflows" / "girls_workflow.json"
@@ -41,8 +47,7 @@ def build_prompt_from_workflow(
     loras: list[dict[str, Any]] | None = None,
     output_prefix: str | None = None,
 ) -> Dict[str, Any]:
-    workflow = load_workflow(workflow_path)
-    prompt = workflow_to_prompt(workflow)
+    prompt = load_template(workflow_path).prompt()
 
     if positive is not None:
         set_positive_prompt(prompt, positive)
@@ -80,19 +85,236 @@ def build_prompt_from_workflow(
 def generate_from_workflow(
     workflow_path: str | Path = DEFAULT_WORKFLOW_PATH,
     *,
-    client: ComfyClient | None = None,
+    client: ComfyClient | ComfyPool | None = None,
     wait: bool = True,
     poll_interval: float = 1.0,
     timeout: float = 300.0,
+    cache: ResultCache | None = None,
     **overrides: Any,
 ) -> Dict[str, Any]:
     comfy = client or ComfyClient()
+    timings = getattr(comfy, "timings", None)
+    started, build_started = time.time(), time.perf_counter()
     prompt = build_prompt_from_workflow(workflow_path, **overrides)
+    build_seconds = time.perf_counter() - build_started
+    key = prompt_hash(prompt) if cache is not None else None
+    if key is not None:
+        entry = cache.get(key)
+        if entry is not None:
+            return _cached_result(entry)
+
     prompt_id = comfy.queue_prompt(prompt)
+    if timings is not None:
+        timings.tag(prompt_id, started_at=started)
+        timings.add(prompt_id, "build", build_seconds)
 
     if not wait:
         return {"prompt_id": prompt_id}
 
     history = comfy.wait_for_prompt(prompt_id, poll_interval=poll_interval, timeout=timeout)
     images = comfy.extract_images(history, prompt_id)
-    return {"prompt_id": prompt_id, "images": images, "history": history}
+    result = {"prompt_id": prompt_id, "images": images, "history": history}
+    if key is not None:
+        download_started = time.perf_counter()
+        entry = cache.fetch(key, comfy, prompt_id=prompt_id, history=history, images=images)
+        if timings is not None:
+            timings.add(prompt_id, "download", time.perf_counter() - download_started)
+        result.update(images=entry["images"], cached=False)
+    if timings is not None:
+        timings.finish(prompt_id, images=len(images))
+    return result
+
+
+def _cached_result(entry: Mapping[str, Any]) -> Dict[str, Any]:
+    # Cached images carry a local "path"; nothing about them needs the server any more.
+    return {
+        "prompt_id": entry["prompt_id"],
+        "images": entry["images"],
+        "history": entry["history"],
+        "cached": True,
+    }
+
+
+def _job_prompt(job: Mapping[str, Any], workflow_path: str | Path) -> Dict[str, Any]:
+    prompt = job.get("prompt")
+    if prompt is None:
+        overrides = {name: value for name, value in job.items() if name != "prompt"}
+        prompt = build_prompt_from_workflow(workflow_path, **overrides)
+    return prompt
+
+
+def order_jobs(
+    jobs: Iterable[Mapping[str, Any]], workflow_path: str | Path = DEFAULT_WORKFLOW_PATH
+) -> JobPlan:
+    """Build every job's prompt and reorder the jobs to cut checkpoint and LoRA reloads.
+
+    All prompts are built up front, so only use this when jobs mix models; jobs that share one
+    checkpoint and LoRA stack are better passed to ``generate_many`` as they are, streamed.
+    """
+    entries = [(index, job, _job_prompt(job, workflow_path)) for index, job in enumerate(jobs)]
+    signatures = [model_signature(prompt) for _, _, prompt in entries]
+    order = order_by_model(signatures)
+    return JobPlan(
+        [entries[position] for position in order],
+        reloads_before=estimate_reloads(signatures),
+        reloads_after=estimate_reloads([signatures[position] for position in order]),
+    )
+
+
+def generate_many(
+    jobs: Iterable[Mapping[str, Any]] | JobPlan,
+    workflow_path: str | Path = DEFAULT_WORKFLOW_PATH,
+    *,
+    client: ComfyClient | ComfyPool | None = None,
+    lookahead: int = 4,
+    ordered: bool = False,
+    poll_interval: float = 1.0,
+    timeout: float = 300.0,
+    download_dir: str | Path | None = None,
+    download_workers: int = 4,
+    cache: ResultCache | None = None,
+    journal: JobJournal | None = None,
+) -> Iterator[Dict[str, Any]]:
+    """Queue up to ``lookahead`` jobs ahead and yield each result as its prompt finishes.
+
+    A job is a mapping of ``build_prompt_from_workflow`` overrides or carries a ready
+    ``"prompt"``; results are yielded in completion order unless ``ordered`` is set. With
+    ``download_dir``, outputs are fetched in parallel as soon as each prompt finishes, while
+    the server samples the next one, and their local paths are added under ``"paths"``.
+    Jobs found in ``cache`` are never queued; their stored results are yielded instead.
+    With ``journal``, finished jobs are recorded as they complete; on a re-run they are
+    yielded from the journal with ``"resumed"`` set, and prompts still held by the server
+    are re-attached instead of queued again. Pass a ``JobPlan`` from ``order_jobs`` to run
+    jobs grouped by model; results keep their original ``"index"``, and ``ordered`` still
+    yields them in that original order.
+    """
+    if lookahead < 1:
+        raise ValueError("lookahead must be at least 1")
+
+    comfy = client or ComfyClient()
+    timings = getattr(comfy, "timings", None)
+    if isinstance(jobs, JobPlan):
+        job_iter: Iterator[Tuple[int, Mapping[str, Any], Any]] = iter(jobs)
+    else:
+        job_iter = ((index, job, None) for index, job in enumerate(jobs))
+    executor = ThreadPoolExecutor(max_workers=lookahead, thread_name_prefix="comfy-wait")
+    downloads = (
+        DownloadStage(comfy, max_workers=download_workers) if download_dir is not None else None
+    )
+    in_flight: Dict[Future, None] = {}
+    finished: Dict[int, Dict[str, Any]] = {}
+    next_index = 0
+    exhausted = False
+
+    def _record(result: Dict[str, Any], key: str | None, prompt: Mapping[str, Any]) -> Dict[str, Any]:
+        if journal is not None:
+            journal.record_done(
+                key,
+                index=result["index"],
+                prompt_id=result["prompt_id"],
+                seed=prompt_seed(prompt),
+                images=result["images"],
+                paths=result.get("paths", ()),
+            )
+        return result
+
+    def _wait(
+        index: int, job: Mapping[str, Any], prompt: Mapping[str, Any], prompt_id: str, key: str | None
+    ) -> Dict[str, Any]:
+        history = comfy.wait_for_prompt(prompt_id, poll_interval=poll_interval, timeout=timeout)
+        images = comfy.extract_images(history, prompt_id)
+        download_started = time.perf_counter()
+        result = {
+            "index": index,
+            "job": job,
+            "prompt_id": prompt_id,
+            "images": images,
+            "history": history,
+        }
+        if downloads is not None:
+            result["paths"] = downloads.download(images, download_dir, prompt_id=prompt_id)
+        if cache is not None:
+            if downloads is not None:
+                cache.put(
+                    key, prompt_id=prompt_id, history=history, images=images, files=result["paths"]
+                )
+            else:
+                entry = cache.fetch(key, comfy, prompt_id=prompt_id, history=history, images=images)
+                result["images"] = entry["images"]
+            result["cached"] = False
+        if timings is not None:
+            if downloads is not None or cache is not None:
+                timings.add(prompt_id, "download", time.perf_counter() - download_started)
+            timings.finish(prompt_id, index=index, images=len(images))
+        return _record(result, key, prompt)
+
+    def _from_cache(
+        index: int, job: Mapping[str, Any], prompt: Mapping[str, Any], key: str, entry: Mapping[str, Any]
+    ) -> Dict[str, Any]:
+        result = {"index": index, "job": job, **_cached_result(entry)}
+        if download_dir is not None:
+            result["paths"] = cache.export(entry, download_dir, claim=downloads.claim)
+        return _record(result, key, prompt)
+
+    def _resumed(index: int, job: Mapping[str, Any], record: Mapping[str, Any]) -> Dict[str, Any]:
+        result = {
+            "index": index,
+            "job": job,
+            "prompt_id": record["prompt_id"],
+            "images": record["images"],
+            "history": {},
+            "resumed": True,
+        }
+        if download_dir is not None:
+            result["paths"] = [Path(path) for path in record["paths"]]
+        return result
+
+    try:
+        while True:
+            while not exhausted and len(in_flight) < lookahead:
+                try:
+                    index, job, prompt = next(job_iter)
+                except StopIteration:
+                    exhausted = True
+                    break
+                started, build_started = time.time(), time.perf_counter()
+                if prompt is None:
+                    prompt = _job_prompt(job, workflow_path)
+                build_seconds = time.perf_counter() - build_started
+                key = prompt_hash(prompt) if cache is not None or journal is not None else None
+                record = journal.done(key) if journal is not None else None
+                if record is not None:
+                    in_flight[executor.submit(_resumed, index, job, record)] = None
+                    continue
+                entry = cache.get(key) if cache is not None else None
+                if entry is not None:
+                    in_flight[executor.submit(_from_cache, index, job, prompt, key, entry)] = None
+                    continue
+                prompt_id = journal.pending(key) if journal is not None else None
+                if prompt_id is None or not comfy.attach(prompt_id, prompt):
+                    prompt_id = comfy.queue_prompt(prompt)
+                    if journal is not None:
+                        journal.record_queued(key, index=index, prompt_id=prompt_id)
+                if timings is not None:
+                    timings.tag(prompt_id, started_at=started)
+                    timings.add(prompt_id, "build", build_seconds)
+                in_flight[executor.submit(_wait, index, job, prompt, prompt_id, key)] = None
+
+            if not in_flight:
+                break
+
+            done, _ = wait_futures(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in done:
+                del in_flight[future]
+                result = future.result()
+                if not ordered:
+                    yield result
+                    continue
+                finished[result["index"]] = result
+                while next_index in finished:
+                    yield finished.pop(next_index)
+                    next_index += 1
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if downloads is not None:
+            downloads.close()
@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import copy
+import json
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Sequence
+
+from .batching import generate_batched
+from .cache import ResultCache
+from .client import ComfyClient
+from .generate import DEFAULT_WORKFLOW_PATH, build_prompt_from_workflow, generate_many, order_jobs
+from .journal import JobJournal
+from .manifest import ManifestStore
+from .pool import ComfyPool
+from .subgraphs import FaceIDSubgraph, splice_loras
+from .sweep import OVERRIDE_KEYS
+from .workflow import Prompt
+
+_MODEL_OVERRIDES = frozenset({"ckpt_name", "loras", "lora_name"})
+_SUBGRAPH_TYPES = ("faceid", "loras")
+_ENV_REFERENCE = re.compile(r"\$\{(\w+)(?::-([^}|]*))?(?:\|(\w+))?\}")
+_ENV_TYPES = {"int": int, "float": float}
+
+
+def _expand_env(value: Any) -> Any:
+    # "${NAME:-default}" in any string expands to a string. Only a string that is one whole
+    # reference with a type, like "${STEPS:-30|int}", is converted.
+    if isinstance(value, Mapping):
+        return {name: _expand_env(item) for name, item in value.items()}
+    if isinstance(value, list):
+        return [_expand_env(item) for item in value]
+    if not isinstance(value, str) or "${" not in value:
+        return value
+    whole = _ENV_REFERENCE.fullmatch(value)
+    for match in _ENV_REFERENCE.finditer(value):
+        kind = match.group(3)
+        if kind is not None and (kind not in _ENV_TYPES or whole is None):
+            raise ValueError(
+                f"Bad reference {match.group(0)!r}: a type must be one of {sorted(_ENV_TYPES)}"
+                " and the reference must be the whole string"
+            )
+    expanded = _ENV_REFERENCE.sub(
+        lambda match: os.environ.get(match.group(1), match.group(2) or ""), value
+    )
+    if whole is None or whole.group(3) is None:
+        return expanded
+    try:
+        return _ENV_TYPES[whole.group(3)](expanded)
+    except ValueError:
+        raise ValueError(f"{whole.group(1)}={expanded!r} is not a valid {whole.group(3)}") from None
+
+
+def _set_loras(overrides: Dict[str, Any]) -> Dict[str, Any]:
+    # An entry whose name expanded to nothing is dropped, so "${STYLE_LORA:-}" is optional.
+    if isinstance(overrides.get("loras"), list):
+        overrides["loras"] = [lora for lora in overrides["loras"] if lora.get("lora_name")]
+    return overrides
+
+
+def load_spec(path: str | Path) -> Dict[str, Any]:
+    """Read a job spec from JSON, or from YAML if the file ends in ``.yaml`` or ``.yml``."""
+    path = Path(path)
+    text = path.read_text(encoding="utf-8")
+    if path.suffix.lower() in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError as exc:
+            raise ImportError(
+                "YAML job specs need PyYAML; install it with 'pip install pyyaml' or use JSON"
+            ) from exc
+        spec = yaml.safe_load(text)
+    else:
+        spec = json.loads(text)
+    if not isinstance(spec, Mapping):
+        raise ValueError(f"Job spec {path} must be a mapping, got {type(spec).__name__}")
+    return _expand_env(spec)
+
+
+class JobSpec:
+    """A batch run described as data instead of a script.
+
+    Keys: ``template`` (workflow path), ``defaults`` (``build_prompt_from_workflow``
+    overrides for every job), ``vars`` and ``positive`` (a ``str.format`` template, by default
+    ``"{scene}"``), ``scenes`` (strings, or mappings of overrides, template variables, ``name``
+    and ``refs``), ``count``, ``repeat`` (jobs per scene), ``seed_base`` (job ``n`` gets
+    ``seed_base + n``), ``uploads`` (reference name to local image), ``subgraphs`` and
+    ``output`` (``dir``, ``prefix``, ``captions``). ``${NAME:-default}`` in any string reads
+    the environment and stays a string; a string that is just ``${NAME:-default|int}`` or
+    ``|float`` becomes that number. A LoRA whose ``lora_name`` comes out empty is left out.
+    Relative paths are taken from the working directory, like the scripts.
+    """
+
+    def __init__(self, spec: Mapping[str, Any]) -> None:
+        self.spec = dict(spec)
+        self.name = str(spec.get("name", "job"))
+        self.workflow_path = Path(spec.get("template") or DEFAULT_WORKFLOW_PATH)
+        self.defaults = _set_loras(dict(spec.get("defaults", {})))
+        unknown = set(self.defaults) - OVERRIDE_KEYS
+        if unknown:
+            raise ValueError(f"Unknown defaults {sorted(unknown)}; expected prompt overrides")
+        self.variables = dict(spec.get("vars", {}))
+        self.positive = spec.get("positive", "{scene}")
+        scenes = [
+            {"scene": scene} if isinstance(scene, str) else _set_loras(dict(scene))
+            for scene in spec.get("scenes", [])
+        ]
+        if not scenes:
+            raise ValueError("Job spec has no scenes")
+        count = spec.get("count")
+        if count is not None and not 1 <= int(count) <= len(scenes):
+            raise ValueError(f"count must be between 1 and {len(scenes)}")
+        self.scenes = scenes[:int(count)] if count is not None else scenes
+        self.repeat = int(spec.get("repeat", 1))
+        self.seed_base = spec.get("seed_base")
+        self.max_batch = int(spec.get("max_batch", 1))
+        self.uploads = {name: Path(path) for name, path in spec.get("uploads", {}).items()}
+        output = spec.get("output", {})
+        self.output_dir = Path(output.get("dir", Path("generated") / self.name))
+        self.prefix = output.get("prefix", self.name + "_{n:03d}")
+        self.captions = bool(output.get("captions", False))
+        self.subgraphs = [self._subgraph(dict(entry)) for entry in spec.get("subgraphs", [])]
+        self.refs: Dict[str, str] = {}
+
+    @classmethod
+    def from_file(cls, path: str | Path) -> "JobSpec":
+        return cls(load_spec(path))
+
+    @staticmethod
+    def _subgraph(entry: Dict[str, Any]) -> Dict[str, Any]:
+        kind = entry.pop("type", None)
+        if kind not in _SUBGRAPH_TYPES:
+            raise ValueError(f"Unknown subgraph type {kind!r}; expected one of {_SUBGRAPH_TYPES}")
+        if kind == "loras":
+            return {"type": kind, "loras": _set_loras(entry)["loras"]}
+        refs = entry.pop("refs", [])
+        weight = entry.pop("apply_weight", None)
+        return {"type": kind, "refs": refs, "weight": weight, "block": FaceIDSubgraph(**entry)}
+
+    def __len__(self) -> int:
+        return len(self.scenes) * self.repeat
+
+    def varies_model(self) -> bool:
+        """Whether scenes override the checkpoint or LoRAs, so reordering can save reloads."""
+        return any(_MODEL_OVERRIDES & set(scene) for scene in self.scenes)
+
+    def upload(self, client: ComfyClient | ComfyPool) -> Dict[str, str]:
+        """Upload the reference images once; returns reference name to server file name."""
+        for name, path in self.uploads.items():
+            if not path.exists():
+                raise FileNotFoundError(f"Reference image {name!r} not found: {path}")
+            self.refs[name] = client.upload_image(path)
+        return self.refs
+
+    def _resolve_refs(self, refs: Sequence[Any], scene_index: int) -> List[str]:
+        # A list of lists is a rotation: scene ``i`` uses entry ``(i - 1) % len``.
+        if refs and isinstance(refs[0], list):
+            refs = refs[(scene_index - 1) % len(refs)]
+        return [self.refs.get(ref, ref) for ref in refs]
+
+    def _prepare(self, prompt: Prompt, scene: Mapping[str, Any], scene_index: int) -> List[str]:
+        used: List[str] = []
+        for subgraph in self.subgraphs:
+            if subgraph["type"] == "loras":
+                splice_loras(prompt, subgraph["loras"])
+                continue
+            refs = self._resolve_refs(scene.get("refs", subgraph["refs"]), scene_index)
+            subgraph["block"].apply(prompt, refs, weight=subgraph["weight"])
+            used.extend(refs)
+        return used
+
+    def jobs(self) -> Iterator[Dict[str, Any]]:
+        """Build each job's prompt only when it is asked for, in scene then repeat order.
+
+        A job carries its ``"prompt"`` and a ``"record"`` of the fields the manifest keeps.
+        """
+        number = 0
+        for scene_index, scene in enumerate(self.scenes, start=1):
+            for repeat in range(self.repeat):
+                number += 1
+                values = {
+                    **self.variables,
+                    **{key: value for key, value in scene.items() if key not in OVERRIDE_KEYS},
+                    "n": number,
+                    "index": scene_index,
+                    "repeat": repeat,
+                }
+                overrides = copy.deepcopy(self.defaults)
+                overrides.update(
+                    (key, value) for key, value in scene.items() if key in OVERRIDE_KEYS
+                )
+                if "positive" not in scene:
+                    overrides["positive"] = self.positive.format_map(values)
+                if "seed" not in scene and self.seed_base is not None:
+                    overrides["seed"] = int(self.seed_base) + number
+                overrides.setdefault("output_prefix", self.prefix.format_map(values))
+                prompt = build_prompt_from_workflow(self.workflow_path, **overrides)
+                refs = self._prepare(prompt, scene, scene_index)
+                record: Dict[str, Any] = {"scene_index": scene_index}
+                if "name" in scene:
+                    record["scene"] = scene["name"]
+                if self.repeat > 1:
+                    record["repeat"] = repeat
+                record.update(
+                    positive=overrides.get("positive"), negative=overrides.get("negative")
+                )
+                if refs:
+                    record["refs"] = refs
+                yield {"prompt": prompt, "record": record}
+
+
+def run_spec(
+    spec: JobSpec,
+    *,
+    client: ComfyClient | ComfyPool,
+    cache: ResultCache | None = None,
+    lookahead: int = 4,
+    poll_interval: float = 1.0,
+    timeout: float = 600.0,
+) -> Iterator[Dict[str, Any]]:
+    """Run ``spec`` with resume and manifest, yielding each manifest record as it is stored.
+
+    References are uploaded first. Jobs stream straight into ``generate_many`` unless scenes
+    change the model, in which case they are built up front and ordered to cut reloads; with
+    ``max_batch`` above 1, jobs that differ only in seed share one latent batch. A journal in
+    the output folder makes a re-run skip finished jobs, and records go to a
+    ``ManifestStore`` as they finish, exported to ``<name>_manifest.json`` at the end.
+    """
+    spec.output_dir.mkdir(parents=True, exist_ok=True)
+    spec.upload(client)
+    options = {
+        "client": client,
+        "lookahead": lookahead,
+        "poll_interval": poll_interval,
+        "timeout": timeout,
+        "download_dir": spec.output_dir,
+        "cache": cache,
+        "journal": JobJournal(spec.output_dir / f"{spec.name}_journal.jsonl"),
+    }
+    store = ManifestStore(spec.output_dir / f"{spec.name}_manifest.sqlite")
+    if spec.max_batch > 1:
+        results = generate_batched(
+            spec.jobs(), spec.workflow_path, max_batch=spec.max_batch, **options
+        )
+    elif spec.varies_model():
+        results = generate_many(order_jobs(spec.jobs(), spec.workflow_path), **options)
+    else:
+        results = generate_many(spec.jobs(), spec.workflow_path, **options)
+    try:
+        for result in results:
+            record = dict(result["job"]["record"])
+            paths = [Path(path) for path in result.get("paths", ())]
+            if spec.captions and record["positive"]:
+                for path in paths:
+                    path.with_suffix(".txt").write_text(record["positive"], encoding="utf-8")
+            record["prompt_id"] = result["prompt_id"]
+            if "seed" in result:
+                record.update(seed=result["seed"], batch_index=result["batch_index"])
+            record["images"] = [str(path) for path in paths]
+            store.append(record, job=result["job"])
+            yield record
+    finally:
+        options["journal"].close()
+        store.export_json(spec.output_dir / f"{spec.name}_manifest.json", run=store.run)
+        store.close()
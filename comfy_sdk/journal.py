@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Mapping, Sequence
+
+
+def prompt_seed(prompt: Mapping[str, Any]) -> int | None:
+    for node in prompt.values():
+        inputs = node.get("inputs", {})
+        for name in ("seed", "noise_seed"):
+            if isinstance(inputs.get(name), int):
+                return inputs[name]
+    return None
+
+
+class JobJournal:
+    """Append-only JSONL log of batch jobs, fsynced per record so a crashed run can resume.
+
+    Jobs are keyed by prompt hash. A ``queued`` record remembers the prompt id handed out by
+    the server, so a restart can re-attach to it; a ``done`` record holds the outputs, so a
+    restart can skip the job.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._queued: Dict[str, str] = {}
+        self._done: Dict[str, Dict[str, Any]] = {}
+        self._replay()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        if self._file.tell() and not self._ends_with_newline():
+            # The last run died mid-write; start a fresh line after the torn record.
+            self._file.write("\n")
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as handle:
+            handle.seek(-1, os.SEEK_END)
+            return handle.read(1) == b"\n"
+
+    def _replay(self) -> None:
+        if not self.path.exists():
+            return
+        with open(self.path, encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                key = record.get("key")
+                if record.get("event") == "queued":
+                    self._queued[key] = record["prompt_id"]
+                elif record.get("event") == "done":
+                    self._done[key] = record
+                    self._queued.pop(key, None)
+
+    def __enter__(self) -> "JobJournal":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def __len__(self) -> int:
+        return len(self._done)
+
+    def _append(self, record: Mapping[str, Any]) -> None:
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def done(self, key: str) -> Dict[str, Any] | None:
+        """Return the ``done`` record for ``key`` if its outputs are still on disk."""
+        record = self._done.get(key)
+        if record is None:
+            return None
+        if not all(Path(path).exists() for path in record.get("paths", [])):
+            return None
+        return record
+
+    def pending(self, key: str) -> str | None:
+        return self._queued.get(key)
+
+    def record_queued(self, key: str, *, index: int, prompt_id: str) -> None:
+        self._append({"event": "queued", "key": key, "index": index, "prompt_id": prompt_id})
+        with self._lock:
+            self._queued[key] = prompt_id
+
+    def record_done(
+        self,
+        key: str,
+        *,
+        index: int,
+        prompt_id: str,
+        seed: int | None,
+        images: Sequence[Mapping[str, Any]],
+        paths: Sequence[str | Path] = (),
+    ) -> Dict[str, Any]:
+        record = {
+            "event": "done",
+            "key": key,
+            "index": index,
+            "prompt_id": prompt_id,
+            "seed": seed,
+            "images": list(images),
+            "paths": [str(path) for path in paths],
+        }
+        self._append(record)
+        with self._lock:
+            self._done[key] = record
+            self._queued.pop(key, None)
+        return record
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Tuple
+
+from .journal import prompt_seed
+from .ordering import model_signature
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    key TEXT PRIMARY KEY,
+    run TEXT,
+    prompt_id TEXT,
+    seed INTEGER,
+    scene,
+    loras TEXT,
+    created REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_prompt_id ON records (prompt_id);
+CREATE INDEX IF NOT EXISTS records_seed ON records (seed);
+CREATE INDEX IF NOT EXISTS records_scene ON records (scene);
+CREATE INDEX IF NOT EXISTS records_loras ON records (loras);
+CREATE INDEX IF NOT EXISTS records_run ON records (run);
+"""
+
+_COLUMNS = "key, run, prompt_id, seed, scene, loras, created, data"
+_VALUES = "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+
+_SCENE_FIELDS = ("scene_index", "scene", "index")
+
+
+def lora_set(loras: Iterable[Any] | str | None) -> str | None:
+    """Canonical LoRA set: sorted unique file names joined by ``+``, strengths left out."""
+    if loras is None:
+        return None
+    if isinstance(loras, str):
+        names = [name for name in loras.split("+") if name]
+    else:
+        names = []
+        for lora in loras:
+            if isinstance(lora, Mapping):
+                names.append(str(lora["lora_name"]))
+            elif isinstance(lora, (list, tuple)):
+                names.append(str(lora[0]))
+            else:
+                names.append(str(lora))
+    return "+".join(sorted(set(names)))
+
+
+def _job_fields(job: Mapping[str, Any]) -> Tuple[int | None, str | None]:
+    prompt = job.get("prompt")
+    if prompt is not None:
+        return prompt_seed(prompt), lora_set(model_signature(prompt)[1]) or None
+    loras = job.get("loras")
+    if loras is None and job.get("lora_name") is not None:
+        loras = [job["lora_name"]]
+    return job.get("seed"), lora_set(loras)
+
+
+class ManifestStore:
+    """SQLite store of generation records, written as each job finishes.
+
+    Records are kept whole as JSON and indexed by prompt id, seed, scene and LoRA set, so a
+    crash loses nothing already appended and lookups stay fast at hundreds of thousands of
+    rows. Appending the same output again, e.g. after a resume, replaces the earlier row.
+    Stores from other runs or machines are folded in with ``merge``; old JSON manifests with
+    ``import_json``.
+    """
+
+    def __init__(self, path: str | Path, *, run: str | None = None) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.run = run or time.strftime("%Y%m%d-%H%M%S")
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # WAL with NORMAL sync survives a process crash; only an OS crash can drop the tail.
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self) -> "ManifestStore":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    @staticmethod
+    def _row(record: Mapping[str, Any], run: str, created: float) -> Tuple[Any, ...]:
+        images = record.get("images") or [""]
+        first = images[0] if isinstance(images[0], str) else json.dumps(images[0], sort_keys=True)
+        scene = next((record[name] for name in _SCENE_FIELDS if name in record), None)
+        return (
+            f"{record.get('prompt_id')}:{first}",
+            run,
+            record.get("prompt_id"),
+            record.get("seed"),
+            scene,
+            lora_set(record.get("loras")),
+            created,
+            json.dumps(record, default=str),
+        )
+
+    def append(self, record: Mapping[str, Any], *, job: Mapping[str, Any] | None = None) -> None:
+        """Store ``record`` now; ``seed`` and ``loras`` are filled in from ``job`` if missing.
+
+        ``job`` is the ``generate_many`` job: a ready ``"prompt"`` is read for its seed and
+        LoRA stack, otherwise its ``seed`` and ``loras`` overrides are used.
+        """
+        record = dict(record)
+        if job is not None:
+            seed, loras = _job_fields(job)
+            if record.get("seed") is None and seed is not None:
+                record["seed"] = seed
+            if record.get("loras") is None and loras is not None:
+                record["loras"] = loras
+        row = self._row(record, self.run, time.time())
+        with self._lock:
+            self._db.execute(f"INSERT OR REPLACE INTO records ({_COLUMNS}) {_VALUES}", row)
+            self._db.commit()
+
+    def find(
+        self,
+        *,
+        prompt_id: str | None = None,
+        seed: int | None = None,
+        scene: Any = None,
+        loras: Iterable[Any] | str | None = None,
+        run: str | None = None,
+        limit: int | None = None,
+    ) -> List[Dict[str, Any]]:
+        """Records matching every given field, ordered by scene then insertion."""
+        clauses, params = [], []
+        for column, value in (
+            ("prompt_id", prompt_id),
+            ("seed", seed),
+            ("scene", scene),
+            ("loras", lora_set(loras) if loras is not None else None),
+            ("run", run),
+        ):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        query = "SELECT data FROM records"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY scene, rowid"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.find())
+
+    def runs(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT run, COUNT(*) FROM records GROUP BY run ORDER BY run")
+            return dict(rows.fetchall())
+
+    def merge(self, other: str | Path) -> int:
+        """Copy in the records of another store that this one lacks; returns how many."""
+        with self._lock:
+            before = self._db.total_changes
+            self._db.execute("ATTACH DATABASE ? AS other", (str(other),))
+            try:
+                self._db.execute(
+                    f"INSERT OR IGNORE INTO records ({_COLUMNS}) "
+                    f"SELECT {_COLUMNS} FROM other.records"
+                )
+                self._db.commit()
+            finally:
+                self._db.execute("DETACH DATABASE other")
+            return self._db.total_changes - before
+
+    def import_json(self, path: str | Path, *, run: str | None = None) -> int:
+        """Load a legacy JSON list manifest or a JSONL file; returns the number of records."""
+        text = Path(path).read_text(encoding="utf-8")
+        stripped = text.lstrip()
+        if stripped.startswith("["):
+            records = json.loads(stripped)
+        else:
+            records = [json.loads(line) for line in text.splitlines() if line.strip()]
+        created = Path(path).stat().st_mtime
+        rows = [self._row(record, run or Path(path).stem, created) for record in records]
+        with self._lock:
+            self._db.executemany(f"INSERT OR IGNORE INTO records ({_COLUMNS}) {_VALUES}", rows)
+            self._db.commit()
+        return len(rows)
+
+    def export_json(self, path: str | Path, **filters: Any) -> int:
+        """Write matching records as the pretty-printed JSON list the scripts used to produce."""
+        records = self.find(**filters)
+        Path(path).write_text(json.dumps(records, indent=2), encoding="utf-8")
+        return len(records)
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator, List, Mapping, Sequence, Tuple
+
+from .workflow import Prompt, find_nodes_by_type
+
+Signature = Tuple[Tuple[Any, ...], Tuple[Any, ...], Tuple[Any, ...]]
+
+
+def _values(prompt: Prompt, class_type: str, fields: Sequence[str]) -> Tuple[Any, ...]:
+    rows = []
+    for node_id in find_nodes_by_type(prompt, class_type):
+        inputs = prompt[node_id].get("inputs", {})
+        rows.append(tuple(inputs.get(field) for field in fields))
+    return tuple(rows)
+
+
+def model_signature(prompt: Prompt) -> Signature:
+    """What the server must have loaded to run ``prompt``: checkpoints, LoRA stack, FaceID."""
+    return (
+        _values(prompt, "CheckpointLoaderSimple", ("ckpt_name",)),
+        _values(prompt, "LoraLoader", ("lora_name", "strength_model", "strength_clip")),
+        _values(prompt, "IPAdapterUnifiedLoaderFaceID", ("preset", "lora_strength", "provider")),
+    )
+
+
+def estimate_reloads(signatures: Sequence[Signature]) -> int:
+    """Count checkpoint, LoRA stack and FaceID preset changes between consecutive prompts."""
+    return sum(
+        sum(before != after for before, after in zip(previous, current))
+        for previous, current in zip(signatures, signatures[1:])
+    )
+
+
+def order_by_model(signatures: Sequence[Signature]) -> List[int]:
+    """Positions reordered so prompts needing the same models run back to back.
+
+    Jobs are grouped by checkpoint, then LoRA stack, then FaceID preset. Groups keep the order
+    in which they first appear and jobs keep their order within a group.
+    """
+    first_seen: Dict[Tuple[Any, ...], int] = {}
+    for position, signature in enumerate(signatures):
+        for depth in range(1, len(signature) + 1):
+            first_seen.setdefault(signature[:depth], position)
+
+    def _key(position: int) -> Tuple[int, ...]:
+        signature = signatures[position]
+        groups = [first_seen[signature[:depth]] for depth in range(1, len(signature) + 1)]
+        return (*groups, position)
+
+    return sorted(range(len(signatures)), key=_key)
+
+
+class JobPlan:
+    """Jobs with their built prompts in run order, each tagged with its original index.
+
+    ``generate_many`` accepts a plan in place of a job list; results keep the original
+    ``"index"``, so manifests sorted by it come out the same as an unordered run.
+    """
+
+    def __init__(
+        self,
+        entries: Sequence[Tuple[int, Mapping[str, Any], Prompt]],
+        *,
+        reloads_before: int,
+        reloads_after: int,
+    ) -> None:
+        self.entries = list(entries)
+        self.reloads_before = reloads_before
+        self.reloads_after = reloads_after
+
+    @property
+    def reloads_saved(self) -> int:
+        return self.reloads_before - self.reloads_after
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[Tuple[int, Mapping[str, Any], Prompt]]:
+        return iter(self.entries)
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.entries)} jobs, estimated model reloads {self.reloads_before} -> "
+            f"{self.reloads_after} (saved {self.reloads_saved})"
+        )
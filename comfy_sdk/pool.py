@@ -0,0 +1,365 @@
+from __future__ import annotations
+
+import threading
+import time
+import urllib.error
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Sequence, Tuple
+
+from .client import ComfyClient
+from .timing import TimingRecorder
+
+_MAX_ROUTES = 4096
+
+# Errors that mean a server is unreachable rather than that it rejected the request.
+_NODE_ERRORS = (urllib.error.URLError, ConnectionError)
+
+
+def _is_node_failure(exc: BaseException) -> bool:
+    return isinstance(exc, _NODE_ERRORS) and not isinstance(exc, urllib.error.HTTPError)
+
+
+class ComfyPool:
+    """Spread prompts over several ComfyUI servers behind the ``ComfyClient`` interface.
+
+    Each prompt goes to the healthy server with the shortest ``/queue``, and later history,
+    ``/view`` and download calls are routed back to that server. A server that stops
+    responding is drained for ``retry_after`` seconds and its unfinished prompts are
+    re-queued elsewhere.
+    """
+
+    def __init__(
+        self,
+        base_urls: Sequence[str],
+        timeout: float = 30.0,
+        *,
+        pool_size: int = 4,
+        retry_after: float = 30.0,
+        depth_ttl: float = 1.0,
+        timings: TimingRecorder | None = None,
+    ) -> None:
+        if not base_urls:
+            raise ValueError("ComfyPool needs at least one base URL")
+        self.clients = [
+            ComfyClient(url, timeout, pool_size=pool_size, timings=timings) for url in base_urls
+        ]
+        self.timings = timings
+        self.retry_after = retry_after
+        self.depth_ttl = depth_ttl
+
+        self._lock = threading.Lock()
+        self._routes: "OrderedDict[str, ComfyClient]" = OrderedDict()
+        self._prompts: Dict[str, Dict[str, Any]] = {}
+        # Output name to server, or None once two servers produced the same name.
+        self._outputs: "OrderedDict[Tuple[str, str, str], ComfyClient | None]" = OrderedDict()
+        self._depth: Dict[ComfyClient, Tuple[float, int]] = {}
+        self._assigned: Dict[ComfyClient, int] = {client: 0 for client in self.clients}
+        self._down_until: Dict[ComfyClient, float] = {}
+        self._drained: set[ComfyClient] = set()
+        self._uploads: List[Tuple[Path, str, str]] = []
+        self._synced: Dict[ComfyClient, int] = {client: 0 for client in self.clients}
+        self._sync_locks = {client: threading.Lock() for client in self.clients}
+
+    @property
+    def base_url(self) -> str:
+        return self.clients[0].base_url
+
+    @property
+    def base_urls(self) -> List[str]:
+        return [client.base_url for client in self.clients]
+
+    def __enter__(self) -> "ComfyPool":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for client in self.clients:
+            client.close()
+
+    def _client(self, base_url: str) -> ComfyClient:
+        for client in self.clients:
+            if client.base_url == base_url.rstrip("/"):
+                return client
+        raise ValueError(f"Unknown server {base_url!r}")
+
+    def drain(self, base_url: str) -> None:
+        with self._lock:
+            self._drained.add(self._client(base_url))
+
+    def restore(self, base_url: str) -> None:
+        client = self._client(base_url)
+        with self._lock:
+            self._drained.discard(client)
+            self._down_until.pop(client, None)
+
+    def _mark_down(self, client: ComfyClient) -> None:
+        with self._lock:
+            self._down_until[client] = time.monotonic() + self.retry_after
+            self._depth.pop(client, None)
+
+    def _healthy(self) -> List[ComfyClient]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                client
+                for client in self.clients
+                if client not in self._drained and self._down_until.get(client, 0.0) <= now
+            ]
+
+    def queue_depth(self, client: ComfyClient) -> int:
+        queue = client.get_queue()
+        return len(queue.get("queue_running", [])) + len(queue.get("queue_pending", []))
+
+    def _load(self, client: ComfyClient) -> int:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._depth.get(client)
+        if cached is None or now - cached[0] > self.depth_ttl:
+            depth = self.queue_depth(client)
+            with self._lock:
+                self._depth[client] = (now, depth)
+                self._assigned[client] = 0
+            return depth
+        with self._lock:
+            # Prompts sent since the last /queue refresh are not in the cached depth yet.
+            return cached[1] + self._assigned[client]
+
+    def _sync_uploads(self, client: ComfyClient) -> None:
+        # One replay per server at a time; progress is kept per upload, so a failure part way
+        # resumes from the first image that did not arrive.
+        with self._sync_locks[client]:
+            while True:
+                with self._lock:
+                    if self._synced[client] >= len(self._uploads):
+                        return
+                    path, subfolder, image_type = self._uploads[self._synced[client]]
+                client.upload_image(path, subfolder=subfolder, image_type=image_type)
+                with self._lock:
+                    self._synced[client] += 1
+
+    def _submit(
+        self, prompt: Dict[str, Any], exclude: ComfyClient | None = None, *, front: bool = False
+    ) -> Tuple[str, ComfyClient]:
+        last_error: BaseException | None = None
+        while True:
+            candidates = [client for client in self._healthy() if client is not exclude]
+            if not candidates:
+                if last_error is not None:
+                    raise last_error
+                raise urllib.error.URLError("No ComfyUI servers are available")
+            loads = []
+            for client in candidates:
+                try:
+                    loads.append((self._load(client), client))
+                except _NODE_ERRORS as exc:
+                    if not _is_node_failure(exc):
+                        raise
+                    last_error = exc
+                    self._mark_down(client)
+            if not loads:
+                continue
+            _, client = min(loads, key=lambda item: item[0])
+            try:
+                self._sync_uploads(client)
+                prompt_id = client.queue_prompt(prompt, front=front)
+            except _NODE_ERRORS as exc:
+                if not _is_node_failure(exc):
+                    raise
+                last_error = exc
+                self._mark_down(client)
+                continue
+            with self._lock:
+                self._assigned[client] += 1
+                self._routes[prompt_id] = client
+                self._prompts[prompt_id] = prompt
+                while len(self._routes) > _MAX_ROUTES:
+                    stale_id, _ = self._routes.popitem(last=False)
+                    self._prompts.pop(stale_id, None)
+            return prompt_id, client
+
+    def queue_prompt(self, prompt: Dict[str, Any], *, front: bool = False) -> str:
+        prompt_id, _ = self._submit(prompt, front=front)
+        return prompt_id
+
+    def attach(self, prompt_id: str, prompt: Dict[str, Any] | None = None) -> bool:
+        """Find the server that still holds ``prompt_id`` and route later calls back to it."""
+        for client in self._healthy():
+            try:
+                found = client.attach(prompt_id)
+            except _NODE_ERRORS as exc:
+                if not _is_node_failure(exc):
+                    raise
+                self._mark_down(client)
+                continue
+            if found:
+                with self._lock:
+                    self._routes[prompt_id] = client
+                    if prompt is not None:
+                        self._prompts[prompt_id] = prompt
+                return True
+        return False
+
+    def client_for_prompt(self, prompt_id: str) -> ComfyClient:
+        with self._lock:
+            client = self._routes.get(prompt_id)
+        if client is None:
+            raise KeyError(f"Prompt {prompt_id} was not queued through this pool")
+        return client
+
+    def client_for_image(
+        self, image: Mapping[str, Any], prompt_id: str | None = None
+    ) -> ComfyClient:
+        """The server holding ``image``; by its prompt when known, else by its output name.
+
+        Servers that share an ``output_prefix`` produce the same names, so a name seen on more
+        than one server, or never seen, raises ``KeyError`` instead of guessing.
+        """
+        prompt_id = prompt_id or image.get("prompt_id")
+        if prompt_id is not None:
+            return self.client_for_prompt(prompt_id)
+        key = (image["filename"], image.get("subfolder", ""), image.get("type", "output"))
+        with self._lock:
+            if key not in self._outputs:
+                raise KeyError(f"Image {key} was not produced through this pool")
+            client = self._outputs[key]
+        if client is None:
+            raise KeyError(f"Image {key} exists on several servers; pass its prompt_id")
+        return client
+
+    def get_history(self, prompt_id: str) -> Dict[str, Any]:
+        return self.client_for_prompt(prompt_id).get_history(prompt_id)
+
+    def wait_for_prompt(
+        self,
+        prompt_id: str,
+        *,
+        poll_interval: float = 1.0,
+        timeout: float = 300.0,
+        use_websocket: bool = True,
+    ) -> Dict[str, Any]:
+        deadline = time.monotonic() + timeout
+        current_id = prompt_id
+        while True:
+            client = self.client_for_prompt(current_id)
+            try:
+                history = client.wait_for_prompt(
+                    current_id,
+                    poll_interval=poll_interval,
+                    timeout=max(deadline - time.monotonic(), 0.0),
+                    use_websocket=use_websocket,
+                )
+            except _NODE_ERRORS as exc:
+                if not _is_node_failure(exc):
+                    raise
+                self._mark_down(client)
+                with self._lock:
+                    prompt = self._prompts.get(current_id)
+                if prompt is None:
+                    raise
+                current_id, _ = self._submit(prompt, exclude=client)
+                with self._lock:
+                    self._routes[prompt_id] = self._routes[current_id]
+                continue
+
+            with self._lock:
+                self._prompts.pop(current_id, None)
+                self._prompts.pop(prompt_id, None)
+            # Callers look results up by the id they were given, even after a failover.
+            return {prompt_id: history[current_id]} if current_id != prompt_id else history
+
+    def extract_images(self, history: Dict[str, Any], prompt_id: str) -> List[Dict[str, Any]]:
+        client = self.client_for_prompt(prompt_id)
+        images = client.extract_images(history, prompt_id)
+        with self._lock:
+            for image in images:
+                key = (image["filename"], image.get("subfolder", ""), image.get("type", "output"))
+                owner = self._outputs.get(key, client)
+                self._outputs[key] = client if owner is client else None
+                self._outputs.move_to_end(key)
+            while len(self._outputs) > _MAX_ROUTES:
+                self._outputs.popitem(last=False)
+        return images
+
+    def _image_client(
+        self, filename: str, subfolder: str, image_type: str, prompt_id: str | None
+    ) -> ComfyClient:
+        image = {"filename": filename, "subfolder": subfolder, "type": image_type}
+        return self.client_for_image(image, prompt_id)
+
+    def download_image(
+        self,
+        filename: str,
+        *,
+        subfolder: str = "",
+        image_type: str = "output",
+        prompt_id: str | None = None,
+    ) -> bytes:
+        client = self._image_client(filename, subfolder, image_type, prompt_id)
+        return client.download_image(filename, subfolder=subfolder, image_type=image_type)
+
+    def iter_image(
+        self,
+        filename: str,
+        *,
+        subfolder: str = "",
+        image_type: str = "output",
+        prompt_id: str | None = None,
+    ) -> Iterator[bytes]:
+        client = self._image_client(filename, subfolder, image_type, prompt_id)
+        return client.iter_image(filename, subfolder=subfolder, image_type=image_type)
+
+    def download_image_to(
+        self,
+        filename: str,
+        target: str | Path,
+        *,
+        subfolder: str = "",
+        image_type: str = "output",
+        expected_size: int | None = None,
+        prompt_id: str | None = None,
+    ) -> int:
+        client = self._image_client(filename, subfolder, image_type, prompt_id)
+        return client.download_image_to(
+            filename,
+            target,
+            subfolder=subfolder,
+            image_type=image_type,
+            expected_size=expected_size,
+        )
+
+    def upload_image(self, path: str | Path, *, subfolder: str = "", image_type: str = "input") -> str:
+        # Every server may run any prompt, so inputs are replicated to all healthy servers and
+        # replayed to the others before they are next given work.
+        with self._lock:
+            self._uploads.append((Path(path), subfolder, image_type))
+        name = None
+        for client in self._healthy():
+            try:
+                self._sync_uploads(client)
+            except _NODE_ERRORS as exc:
+                if not _is_node_failure(exc):
+                    raise
+                self._mark_down(client)
+                continue
+            name = client.upload_image(path, subfolder=subfolder, image_type=image_type)
+        if name is None:
+            raise urllib.error.URLError("No ComfyUI servers are available")
+        return name
+
+
+def connect(
+    base_url: str | Sequence[str],
+    timeout: float = 30.0,
+    *,
+    pool_size: int = 4,
+    timings: TimingRecorder | None = None,
+) -> ComfyClient | ComfyPool:
+    """Return a ``ComfyClient`` for one URL, or a ``ComfyPool`` for a list or comma-separated string."""
+    urls = base_url.split(",") if isinstance(base_url, str) else list(base_url)
+    urls = [url.strip() for url in urls if url.strip()]
+    if len(urls) == 1:
+        return ComfyClient(urls[0], timeout, pool_size=pool_size, timings=timings)
+    return ComfyPool(urls, timeout, pool_size=pool_size, timings=timings)
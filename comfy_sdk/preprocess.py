@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+import tempfile
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
+
+from .dataset import DatasetIndex
+
+MANIFEST_NAME = ".comfy_preprocess.json"
+
+_FORMATS = {"jpeg": ".jpg", "png": ".png", "webp": ".webp"}
+
+Bucket = Tuple[int, int]
+
+
+def _require_pillow() -> Any:
+    try:
+        from PIL import Image, ImageOps
+    except ImportError as exc:
+        raise ImportError(
+            "Dataset preprocessing needs Pillow; install it with 'pip install pillow'"
+        ) from exc
+    return Image, ImageOps
+
+
+def aspect_buckets(
+    base: int = 1024, *, step: int = 64, min_side: int = 512, max_side: int = 2048
+) -> List[Bucket]:
+    """Bucket sizes of about ``base * base`` pixels, sides multiples of ``step``."""
+    buckets = set()
+    area = base * base
+    for width in range(min_side, max_side + 1, step):
+        height = min(max_side, (area // width) // step * step)
+        if height >= min_side:
+            buckets.add((width, height))
+    return sorted(buckets)
+
+
+def choose_bucket(width: int, height: int, buckets: Sequence[Bucket]) -> Bucket:
+    """The bucket whose aspect ratio is closest to ``width / height`` on a log scale."""
+    ratio = math.log(width / height)
+
+    def _distance(bucket: Bucket) -> Tuple[float, int]:
+        return abs(math.log(bucket[0] / bucket[1]) - ratio), -bucket[0] * bucket[1]
+
+    return min(buckets, key=_distance)
+
+
+def _process_image(
+    source: str, target: str, buckets: Sequence[Bucket], image_format: str, quality: int
+) -> Dict[str, Any]:
+    # Runs in a worker process: decode once, crop to the bucket's aspect ratio, resize, encode.
+    Image, ImageOps = _require_pillow()
+    with Image.open(source) as opened:
+        image = ImageOps.exif_transpose(opened)
+        image = image.convert("RGB")
+    width, height = image.size
+    bucket = choose_bucket(width, height, buckets)
+    scale = max(bucket[0] / width, bucket[1] / height)
+    crop_width, crop_height = round(bucket[0] / scale), round(bucket[1] / scale)
+    left, top = (width - crop_width) // 2, (height - crop_height) // 2
+    image = image.resize(
+        bucket, Image.LANCZOS, box=(left, top, left + crop_width, top + crop_height)
+    )
+    options: Dict[str, Any] = {}
+    if image_format in ("jpeg", "webp"):
+        options["quality"] = quality
+    if image_format == "jpeg":
+        options["optimize"] = True
+    Path(target).parent.mkdir(parents=True, exist_ok=True)
+    image.save(target, format=image_format.upper(), **options)
+    return {
+        "source_size": [width, height],
+        "bucket": list(bucket),
+        "bytes": os.path.getsize(target),
+    }
+
+
+def _caption_text(tokens: Sequence[str], trigger: str | None) -> str:
+    seen = set()
+    ordered = [trigger] if trigger else []
+    ordered.extend(tokens)
+    unique = []
+    for token in ordered:
+        if token.lower() not in seen:
+            seen.add(token.lower())
+            unique.append(token)
+    return ", ".join(unique)
+
+
+def _remove_output(output: Path) -> None:
+    for path in (output, output.with_suffix(".txt")):
+        if path.exists():
+            path.unlink()
+
+
+class Preprocessor:
+    """Resize a dataset folder into aspect-ratio buckets, re-encoded, with caption sidecars.
+
+    Sources come from a ``DatasetIndex`` of ``source``, so only new or modified images are
+    hashed. A manifest in ``target`` remembers each output's source hash and settings; an
+    image is decoded again only when either changed or its output is missing. Work runs in a
+    process pool since decoding and resampling hold the GIL.
+    """
+
+    def __init__(
+        self,
+        source: str | Path,
+        target: str | Path,
+        *,
+        base: int = 1024,
+        buckets: Sequence[Bucket] | None = None,
+        image_format: str = "jpeg",
+        quality: int = 95,
+        trigger: str | None = None,
+        workers: int | None = None,
+    ) -> None:
+        if image_format not in _FORMATS:
+            raise ValueError(
+                f"Unknown image format {image_format!r}; expected one of {sorted(_FORMATS)}"
+            )
+        self.index = DatasetIndex(source)
+        self.target = Path(target)
+        self.buckets = list(buckets) if buckets is not None else aspect_buckets(base)
+        self.image_format = image_format
+        self.quality = quality
+        self.trigger = trigger
+        self.workers = workers
+        self.manifest_path = self.target / MANIFEST_NAME
+        self.manifest: Dict[str, Dict[str, Any]] = {}
+        self.errors: Dict[str, str] = {}
+        if self.manifest_path.exists():
+            with open(self.manifest_path, encoding="utf-8") as handle:
+                self.manifest = json.load(handle)
+
+    @property
+    def settings(self) -> str:
+        """Hash of everything that shapes an output besides the source bytes."""
+        settings = [self.buckets, self.image_format, self.quality]
+        return hashlib.sha256(json.dumps(settings).encode("utf-8")).hexdigest()[:16]
+
+    def _output(self, relpath: str) -> Path:
+        return self.target / Path(relpath).with_suffix(_FORMATS[self.image_format])
+
+    def run(self) -> Dict[str, int]:
+        """Process what changed since the last run; returns counts of what was done."""
+        self.index.update()
+        settings = self.settings
+        counts = {"processed": 0, "skipped": 0, "failed": 0, "removed": 0, "captions": 0}
+        self.errors = {}
+        stale = []
+        manifest: Dict[str, Dict[str, Any]] = {}
+        for record in self.index:
+            relpath = record["path"]
+            output = self._output(relpath)
+            previous = self.manifest.get(relpath)
+            if (
+                previous is not None
+                and previous["sha256"] == record["sha256"]
+                and previous["settings"] == settings
+                and output.exists()
+            ):
+                manifest[relpath] = previous
+                counts["skipped"] += 1
+            else:
+                stale.append((relpath, output))
+
+        if stale:
+            _require_pillow()
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                futures = [
+                    executor.submit(
+                        _process_image,
+                        str(self.index.absolute(relpath)),
+                        str(output),
+                        self.buckets,
+                        self.image_format,
+                        self.quality,
+                    )
+                    for relpath, output in stale
+                ]
+                for (relpath, output), future in zip(stale, futures):
+                    try:
+                        result = future.result()
+                    except BrokenExecutor:
+                        raise
+                    except Exception as exc:
+                        # Unreadable images, decompression bombs included, are reported and
+                        # retried on the next run; only a dead worker pool stops the run. The
+                        # last good output and its manifest entry stay until a retry succeeds.
+                        self.errors[relpath] = f"{type(exc).__name__}: {exc}"
+                        if relpath in self.manifest:
+                            manifest[relpath] = self.manifest[relpath]
+                        counts["failed"] += 1
+                        continue
+                    previous = self.manifest.pop(relpath, None)
+                    if previous is not None and self.target / previous["output"] != output:
+                        # Same stem as the new output, so the caption sidecar is kept.
+                        (self.target / previous["output"]).unlink(missing_ok=True)
+                    manifest[relpath] = {
+                        "sha256": self.index.get(relpath)["sha256"],
+                        "settings": settings,
+                        "output": output.relative_to(self.target).as_posix(),
+                        **result,
+                    }
+                    counts["processed"] += 1
+
+        for relpath, entry in manifest.items():
+            tokens = self.index.get(relpath)["tokens"]
+            if tokens is None or relpath in self.errors:
+                continue
+            caption = _caption_text(tokens, self.trigger)
+            sidecar = (self.target / entry["output"]).with_suffix(".txt")
+            if not sidecar.exists() or sidecar.read_text(encoding="utf-8") != caption:
+                sidecar.write_text(caption, encoding="utf-8")
+                counts["captions"] += 1
+
+        for relpath in set(self.manifest) - set(manifest):
+            _remove_output(self.target / self.manifest[relpath]["output"])
+            counts["removed"] += 1
+        self.manifest = manifest
+        self._save()
+        return counts
+
+    def _save(self) -> None:
+        self.target.mkdir(parents=True, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=self.target, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "w", encoding="utf-8") as stream:
+                json.dump(self.manifest, stream, indent=1, sort_keys=True)
+            os.replace(temp_path, self.manifest_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def bucket_counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for entry in self.manifest.values():
+            name = "x".join(str(side) for side in entry["bucket"])
+            counts[name] = counts.get(name, 0) + 1
+        return dict(sorted(counts.items()))
+
+
+def preprocess_dataset(source: str | Path, target: str | Path, **options: Any) -> Dict[str, int]:
+    """Run a ``Preprocessor`` once; ``options`` are its keyword arguments."""
+    return Preprocessor(source, target, **options).run()
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Deque, Dict, Mapping, Tuple
+
+from .client import ComfyClient
+from .pool import ComfyPool
+from .timing import execution_seconds
+
+LANES = ("interactive", "bulk")
+
+# Weight of the newest sample in the moving average of per-prompt sampling time.
+_SMOOTHING = 0.3
+
+
+class Scheduler:
+    """Feed prompts to ComfyUI while holding our outstanding prompts at a target depth.
+
+    ``interactive`` prompts are dispatched before ``bulk`` ones and are queued at the front of
+    the server queue; they may use up to ``max_depth`` slots, bulk prompts only ``depth``.
+    Bulk prompts are also held back while the server queue, including other users' prompts,
+    is at ``max_server_queue``. With ``adaptive``, ``depth`` follows the measured sampling
+    time so that about ``target_wait`` seconds of our work are queued ahead of anything new.
+    """
+
+    def __init__(
+        self,
+        client: ComfyClient | ComfyPool,
+        *,
+        depth: int = 2,
+        min_depth: int = 2,
+        max_depth: int = 8,
+        adaptive: bool = True,
+        target_wait: float = 5.0,
+        max_server_queue: int | None = None,
+        queue_ttl: float = 1.0,
+        poll_interval: float = 1.0,
+        timeout: float = 300.0,
+    ) -> None:
+        if not 1 <= min_depth <= max_depth:
+            raise ValueError("depths must satisfy 1 <= min_depth <= max_depth")
+        self.client = client
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.depth = min(max(depth, min_depth), max_depth)
+        self.adaptive = adaptive
+        self.target_wait = target_wait
+        self.max_server_queue = max_server_queue
+        self.queue_ttl = queue_ttl
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+        self.service_time: float | None = None
+        self.completed = 0
+        self._lanes: Dict[str, Deque[Tuple[Dict[str, Any], Future]]] = {
+            lane: deque() for lane in LANES
+        }
+        self._outstanding = 0
+        self._last_done: float | None = None
+        self._server_depth: Tuple[float, int] | None = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._waiters = ThreadPoolExecutor(max_workers=max_depth, thread_name_prefix="comfy-wait")
+        self._dispatcher = threading.Thread(
+            target=self._dispatch, name="comfy-dispatch", daemon=True
+        )
+        self._dispatcher.start()
+
+    def __enter__(self) -> "Scheduler":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    @property
+    def outstanding(self) -> int:
+        return self._outstanding
+
+    @property
+    def pending(self) -> int:
+        with self._cond:
+            return sum(len(queue) for queue in self._lanes.values())
+
+    def submit(self, prompt: Dict[str, Any], *, lane: str = "bulk") -> Future:
+        """Schedule ``prompt``; the future resolves to ``{"prompt_id", "history", "latency"}``."""
+        if lane not in self._lanes:
+            raise ValueError(f"Unknown lane {lane!r}; expected one of {LANES}")
+        future: Future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Scheduler is closed")
+            self._lanes[lane].append((prompt, future))
+            self._cond.notify_all()
+        return future
+
+    def close(self, *, wait: bool = True) -> None:
+        """Stop accepting prompts; with ``wait`` finish the queued ones, else cancel them."""
+        with self._cond:
+            self._closed = True
+            if not wait:
+                for queue in self._lanes.values():
+                    while queue:
+                        queue.popleft()[1].cancel()
+            self._cond.notify_all()
+        self._dispatcher.join()
+        self._waiters.shutdown(wait=wait)
+
+    def server_depth(self) -> int:
+        """Running plus pending prompts on the server(s), from websocket status or ``/queue``."""
+        now = time.monotonic()
+        if self._server_depth is not None and now - self._server_depth[0] <= self.queue_ttl:
+            return self._server_depth[1]
+        total = 0
+        for client in getattr(self.client, "clients", None) or [self.client]:
+            if client.queue_remaining is not None and now - client.queue_updated <= self.queue_ttl:
+                total += client.queue_remaining
+                continue
+            queue = client.get_queue()
+            total += len(queue.get("queue_running", [])) + len(queue.get("queue_pending", []))
+        self._server_depth = (now, total)
+        return total
+
+    def _ready_lane(self) -> str | None:
+        for lane in LANES:
+            limit = self.max_depth if lane == "interactive" else self.depth
+            if self._lanes[lane] and self._outstanding < limit:
+                return lane
+        return None
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._cond:
+                lane = self._ready_lane()
+                while lane is None:
+                    if self._closed and not any(self._lanes.values()):
+                        return
+                    self._cond.wait()
+                    lane = self._ready_lane()
+
+            if lane == "bulk" and self.max_server_queue is not None:
+                try:
+                    full = self.server_depth() >= self.max_server_queue
+                except (OSError, ValueError):
+                    # An unreachable /queue must not kill the dispatcher: send the prompt
+                    # anyway, and a server that is really down fails its future below.
+                    full = False
+                if full:
+                    with self._cond:
+                        self._cond.wait(self.queue_ttl)
+                    continue
+
+            with self._cond:
+                if not self._lanes[lane]:
+                    continue
+                prompt, future = self._lanes[lane].popleft()
+                self._outstanding += 1
+            if not future.set_running_or_notify_cancel():
+                self._release()
+                continue
+            queued_at = time.monotonic()
+            try:
+                prompt_id = self.client.queue_prompt(prompt, front=lane == "interactive")
+            except BaseException as exc:
+                future.set_exception(exc)
+                self._release()
+                continue
+            self._server_depth = None
+            self._waiters.submit(self._wait, prompt_id, future, queued_at)
+
+    def _release(self) -> None:
+        with self._cond:
+            self._outstanding -= 1
+            self._cond.notify_all()
+
+    def _wait(self, prompt_id: str, future: Future, queued_at: float) -> None:
+        try:
+            history = self.client.wait_for_prompt(
+                prompt_id, poll_interval=self.poll_interval, timeout=self.timeout
+            )
+        except BaseException as exc:
+            future.set_exception(exc)
+            self._release()
+            return
+        now = time.monotonic()
+        self._observe(history.get(prompt_id, {}), now, now - queued_at)
+        self._release()
+        future.set_result({"prompt_id": prompt_id, "history": history, "latency": now - queued_at})
+
+    def _observe(self, entry: Mapping[str, Any], now: float, latency: float) -> None:
+        with self._cond:
+            sample = execution_seconds(entry)
+            if sample is None:
+                # Without server timestamps, the gap between completions while we kept the
+                # server busy is the sampling time; an idle server only gives the latency.
+                busy = self._last_done is not None and self._outstanding > 1
+                sample = now - self._last_done if busy else latency
+            self._last_done = now
+            self.completed += 1
+            if self.service_time is None:
+                self.service_time = sample
+            else:
+                self.service_time += _SMOOTHING * (sample - self.service_time)
+            if self.adaptive and self.service_time > 0:
+                wanted = 1 + math.ceil(self.target_wait / self.service_time)
+                self.depth = min(max(wanted, self.min_depth), self.max_depth)
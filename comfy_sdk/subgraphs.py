@@ -0,0 +1,312 @@
+from __future__ import annotations
+
+import functools
+from typing import Any, Dict, List, Mapping, Sequence, Tuple
+
+from .workflow import Prompt, _get_node_id_by_type, _max_node_id, find_nodes_by_type
+
+# IPAdapterCombineParams takes params_1 .. params_5.
+_MAX_COMBINE = 5
+
+# Mask fields that take the same value in every region.
+_SHARED_MASK_FIELDS = (
+    ("width", "frame_width"),
+    ("height", "frame_height"),
+    ("height", "shape_height"),
+    ("y", "location_y"),
+    ("region_width", "shape_width"),
+)
+
+
+class Subgraph:
+    """A block of prompt nodes compiled once and spliced into many prompts.
+
+    ``nodes`` uses local names as ids; links between them are written as ``[name, slot]``.
+    ``ports`` name the inputs that link to the host prompt and ``params`` name the widget
+    values that change per job. Splicing copies the block under fresh numeric ids with a
+    single id allocation, instead of scanning the prompt once per node.
+    """
+
+    def __init__(
+        self,
+        nodes: Mapping[str, Mapping[str, Any]],
+        *,
+        ports: Mapping[str, Tuple[str, str]] | None = None,
+        params: Mapping[str, Sequence[Tuple[str, str]]] | None = None,
+        output: Tuple[str, int] | None = None,
+    ) -> None:
+        self.names = list(nodes)
+        index = {name: position for position, name in enumerate(self.names)}
+        self._class_types = [nodes[name]["class_type"] for name in self.names]
+        self._inputs: List[Dict[str, Any]] = []
+        self._links: List[Tuple[int, str, int, int]] = []
+        for position, name in enumerate(self.names):
+            inputs = {}
+            for field, value in nodes[name].get("inputs", {}).items():
+                if isinstance(value, list) and len(value) == 2 and value[0] in index:
+                    self._links.append((position, field, index[value[0]], value[1]))
+                else:
+                    inputs[field] = value
+            self._inputs.append(inputs)
+
+        def _resolve(target: Tuple[str, str]) -> Tuple[int, str]:
+            if target[0] not in index:
+                raise ValueError(f"Unknown subgraph node {target[0]!r}")
+            return index[target[0]], target[1]
+
+        self._ports = {port: _resolve(target) for port, target in (ports or {}).items()}
+        self._params = {
+            param: [_resolve(target) for target in targets]
+            for param, targets in (params or {}).items()
+        }
+        self._output = (index[output[0]], output[1]) if output is not None else None
+
+    @property
+    def ports(self) -> List[str]:
+        return list(self._ports)
+
+    @property
+    def params(self) -> List[str]:
+        return list(self._params)
+
+    def splice(
+        self, prompt: Prompt, links: Mapping[str, List[Any]], **values: Any
+    ) -> Dict[str, str]:
+        """Add the block to ``prompt`` and return its local names mapped to the new node ids."""
+        missing = set(self._ports) - set(links)
+        if missing:
+            raise ValueError(f"Subgraph ports not linked: {sorted(missing)}")
+        unknown = (set(links) - set(self._ports)) | (set(values) - set(self._params))
+        if unknown:
+            raise ValueError(f"Unknown subgraph ports or params: {sorted(unknown)}")
+
+        base = _max_node_id(prompt) + 1
+        ids = [str(base + position) for position in range(len(self.names))]
+        nodes = [
+            {"inputs": dict(inputs), "class_type": class_type}
+            for inputs, class_type in zip(self._inputs, self._class_types)
+        ]
+        for position, field, target, slot in self._links:
+            nodes[position]["inputs"][field] = [ids[target], slot]
+        for port, link in links.items():
+            position, field = self._ports[port]
+            nodes[position]["inputs"][field] = list(link)
+        for param, value in values.items():
+            for position, field in self._params[param]:
+                nodes[position]["inputs"][field] = value
+        for node_id, node in zip(ids, nodes):
+            prompt[node_id] = node
+        return dict(zip(self.names, ids))
+
+    def output_link(self, ids: Mapping[str, str]) -> List[Any]:
+        if self._output is None:
+            raise ValueError("Subgraph has no output")
+        position, slot = self._output
+        return [ids[self.names[position]], slot]
+
+
+def _sampler_model(prompt: Prompt, sampler_index: int) -> Tuple[str, List[Any]]:
+    sampler_id = _get_node_id_by_type(prompt, "KSampler", sampler_index)
+    model_link = prompt[sampler_id].get("inputs", {}).get("model")
+    if not (isinstance(model_link, list) and model_link):
+        raise ValueError(f"KSampler {sampler_id} does not link a model input")
+    return sampler_id, model_link
+
+
+def latent_size(prompt: Prompt, default: Tuple[int, int] = (1024, 1024)) -> Tuple[int, int]:
+    for node_id in find_nodes_by_type(prompt, "EmptyLatentImage"):
+        inputs = prompt[node_id].get("inputs", {})
+        return int(inputs.get("width", default[0])), int(inputs.get("height", default[1]))
+    return default
+
+
+class FaceIDSubgraph(Subgraph):
+    """IPAdapter FaceID block with one reference image and mask per region.
+
+    Regions are equal-width vertical strips, left to right, so one region covers the whole
+    frame and two split it down the middle. ``apply`` splices the block in front of the
+    KSampler's model input.
+    """
+
+    def __init__(
+        self,
+        regions: int = 1,
+        *,
+        preset: str = "FACEID PLUS V2",
+        provider: str = "CUDA",
+        lora_strength: float = 1.0,
+        weight: float = 1.0,
+        weight_type: str = "composition",
+        combine_embeds: str = "concat",
+        embeds_scaling: str = "K+V",
+    ) -> None:
+        if regions < 1:
+            raise ValueError("regions must be at least 1")
+        self.regions = regions
+
+        nodes: Dict[str, Dict[str, Any]] = {
+            "loader": {
+                "class_type": "IPAdapterUnifiedLoaderFaceID",
+                "inputs": {"preset": preset, "lora_strength": lora_strength, "provider": provider},
+            }
+        }
+        params: Dict[str, List[Tuple[str, str]]] = {}
+        for region in range(regions):
+            nodes[f"image_{region}"] = {"class_type": "LoadImage", "inputs": {"image": ""}}
+            nodes[f"mask_{region}"] = {
+                "class_type": "CreateShapeMask",
+                "inputs": {
+                    "shape": "square",
+                    "frames": 1,
+                    "location_x": 0,
+                    "location_y": 0,
+                    "grow": 0,
+                    "frame_width": 0,
+                    "frame_height": 0,
+                    "shape_width": 0,
+                    "shape_height": 0,
+                },
+            }
+            nodes[f"region_{region}"] = {
+                "class_type": "IPAdapterRegionalConditioning",
+                "inputs": {
+                    "image": [f"image_{region}", 0],
+                    "image_weight": weight,
+                    "prompt_weight": 1.0,
+                    "weight_type": weight_type,
+                    "start_at": 0.0,
+                    "end_at": 1.0,
+                    "mask": [f"mask_{region}", 0],
+                },
+            }
+            params[f"ref_{region}"] = [(f"image_{region}", "image")]
+            params[f"x_{region}"] = [(f"mask_{region}", "location_x")]
+            params.setdefault("weight", []).append((f"region_{region}", "image_weight"))
+            for param, field in _SHARED_MASK_FIELDS:
+                params.setdefault(param, []).append((f"mask_{region}", field))
+
+        # Regions are merged by a tree of combine nodes, five inputs at a time.
+        level = [[f"region_{region}", 0] for region in range(regions)]
+        depth = 0
+        while len(level) > 1:
+            merged = []
+            for start in range(0, len(level), _MAX_COMBINE):
+                group = level[start:start + _MAX_COMBINE]
+                if len(group) == 1:
+                    merged.append(group[0])
+                    continue
+                name = f"combine_{depth}_{start // _MAX_COMBINE}"
+                nodes[name] = {
+                    "class_type": "IPAdapterCombineParams",
+                    "inputs": {f"params_{slot}": link for slot, link in enumerate(group, start=1)},
+                }
+                merged.append([name, 0])
+            level = merged
+            depth += 1
+
+        nodes["apply"] = {
+            "class_type": "IPAdapterFromParams",
+            "inputs": {
+                "model": ["loader", 0],
+                "ipadapter": ["loader", 1],
+                "ipadapter_params": level[0],
+                "combine_embeds": combine_embeds,
+                "embeds_scaling": embeds_scaling,
+            },
+        }
+        super().__init__(
+            nodes, ports={"model": ("loader", "model")}, params=params, output=("apply", 0)
+        )
+
+    def apply(
+        self,
+        prompt: Prompt,
+        refs: Sequence[str],
+        *,
+        weight: float | None = None,
+        sampler_index: int = 0,
+    ) -> Dict[str, str]:
+        if len(refs) != self.regions:
+            raise ValueError(f"Expected {self.regions} reference images, got {len(refs)}")
+        sampler_id, model_link = _sampler_model(prompt, sampler_index)
+        width, height = latent_size(prompt)
+        values: Dict[str, Any] = {
+            "width": width,
+            "height": height,
+            "y": height // 2,
+            "region_width": width // self.regions,
+        }
+        for region, ref in enumerate(refs):
+            values[f"ref_{region}"] = ref
+            values[f"x_{region}"] = width * (2 * region + 1) // (2 * self.regions)
+        if weight is not None:
+            values["weight"] = weight
+        ids = self.splice(prompt, {"model": model_link}, **values)
+        prompt[sampler_id]["inputs"]["model"] = self.output_link(ids)
+        return ids
+
+
+class LoraChainSubgraph(Subgraph):
+    """``count`` chained LoraLoader nodes, spliced between the KSampler and its model source."""
+
+    def __init__(self, count: int) -> None:
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        self.count = count
+        nodes: Dict[str, Dict[str, Any]] = {}
+        params: Dict[str, List[Tuple[str, str]]] = {}
+        for position in range(count):
+            inputs: Dict[str, Any] = {"lora_name": "", "strength_model": 1.0, "strength_clip": 1.0}
+            if position:
+                inputs["model"] = [f"lora_{position - 1}", 0]
+                inputs["clip"] = [f"lora_{position - 1}", 1]
+            nodes[f"lora_{position}"] = {"class_type": "LoraLoader", "inputs": inputs}
+            for field in ("lora_name", "strength_model", "strength_clip"):
+                params[f"{field}_{position}"] = [(f"lora_{position}", field)]
+        super().__init__(
+            nodes,
+            ports={"model": ("lora_0", "model"), "clip": ("lora_0", "clip")},
+            params=params,
+            output=(f"lora_{count - 1}", 0),
+        )
+
+    def apply(
+        self, prompt: Prompt, loras: Sequence[Mapping[str, Any]], *, sampler_index: int = 0
+    ) -> Dict[str, str]:
+        if len(loras) != self.count:
+            raise ValueError(f"Expected {self.count} LoRAs, got {len(loras)}")
+        sampler_id, model_link = _sampler_model(prompt, sampler_index)
+        base_id = str(model_link[0])
+        values: Dict[str, Any] = {}
+        for position, lora in enumerate(loras):
+            values[f"lora_name_{position}"] = lora["lora_name"]
+            for field in ("strength_model", "strength_clip"):
+                if lora.get(field) is not None:
+                    values[f"{field}_{position}"] = lora[field]
+        ids = self.splice(prompt, {"model": [base_id, 0], "clip": [base_id, 1]}, **values)
+
+        last_id = ids[f"lora_{self.count - 1}"]
+        prompt[sampler_id]["inputs"]["model"] = [last_id, 0]
+        for clip_id in find_nodes_by_type(prompt, "CLIPTextEncode"):
+            inputs = prompt[clip_id].get("inputs", {})
+            clip_link = inputs.get("clip")
+            if isinstance(clip_link, list) and clip_link and str(clip_link[0]) == base_id:
+                inputs["clip"] = [last_id, clip_link[1] if len(clip_link) > 1 else 1]
+        return ids
+
+
+@functools.lru_cache(maxsize=None)
+def lora_chain(count: int) -> LoraChainSubgraph:
+    return LoraChainSubgraph(count)
+
+
+def splice_loras(
+    prompt: Prompt, loras: Sequence[Mapping[str, Any]], *, sampler_index: int = 0
+) -> Dict[str, str]:
+    """Insert ``loras`` as a new chain in front of the KSampler, compiling each length once.
+
+    Unlike ``set_loras``, an existing LoraLoader feeding the sampler is kept, not reused.
+    """
+    if not loras:
+        return {}
+    return lora_chain(len(loras)).apply(prompt, loras, sampler_index=sampler_index)
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import copy
+import inspect
+import itertools
+import json
+import random
+import threading
+from pathlib import Path
+from typing import Any, Callable, Container, Dict, Iterable, Iterator, List, Mapping, Sequence, Tuple
+
+from .cache import prompt_hash
+from .client import ComfyClient
+from .generate import DEFAULT_WORKFLOW_PATH, build_prompt_from_workflow, generate_many, order_jobs
+from .ordering import JobPlan
+from .pool import ComfyPool
+from .workflow import Prompt
+
+# The keyword overrides ``build_prompt_from_workflow`` accepts.
+OVERRIDE_KEYS = frozenset(inspect.signature(build_prompt_from_workflow).parameters) - {
+    "workflow_path"
+}
+
+
+def cartesian(grid: Mapping[str, Sequence[Any]]) -> List[Dict[str, Any]]:
+    """Every combination of the values in ``grid``, varying the last parameter fastest."""
+    names = list(grid)
+    combinations = itertools.product(*(grid[name] for name in names))
+    return [dict(zip(names, values)) for values in combinations]
+
+
+def latin_hypercube(
+    space: Mapping[str, Sequence[Any] | Tuple[float, float]],
+    samples: int,
+    *,
+    seed: int | None = None,
+) -> List[Dict[str, Any]]:
+    """``samples`` points that hit every one of ``samples`` strata once per parameter.
+
+    A tuple ``(low, high)`` is a range: floats are sampled uniformly within each stratum and
+    ints are rounded. A list is a set of choices, spread evenly over the strata.
+    """
+    if samples < 1:
+        raise ValueError("samples must be at least 1")
+    rng = random.Random(seed)
+    columns = {}
+    for name, values in space.items():
+        strata = list(range(samples))
+        rng.shuffle(strata)
+        column = []
+        for stratum in strata:
+            position = (stratum + rng.random()) / samples
+            if isinstance(values, tuple):
+                low, high = values
+                value = low + position * (high - low)
+                integral = isinstance(low, int) and isinstance(high, int)
+                column.append(round(value) if integral else value)
+            else:
+                column.append(values[min(int(position * len(values)), len(values) - 1)])
+        columns[name] = column
+    return [{name: columns[name][index] for name in columns} for index in range(samples)]
+
+
+def _set_path(overrides: Dict[str, Any], path: str, value: Any) -> None:
+    # "loras.0.strength_model" addresses one field inside a base override; every step but a
+    # new last key must already exist there.
+    head, *rest = path.split(".")
+    target = overrides.setdefault(head, {})
+    walked = head
+    try:
+        for part in rest[:-1]:
+            target = target[int(part)] if isinstance(target, list) else target[part]
+            walked = f"{walked}.{part}"
+        part = rest[-1]
+        if isinstance(target, list):
+            target[int(part)] = value
+        elif isinstance(target, dict):
+            target[part] = value
+        else:
+            raise TypeError(f"{type(target).__name__} has no fields")
+    except (KeyError, IndexError, TypeError, ValueError) as exc:
+        raise ValueError(
+            f"Sweep axis {path!r}: no {part!r} under {walked!r} in the base overrides ({exc})"
+        ) from None
+
+
+class Sweep:
+    """Expand parameter points into deduplicated jobs, run grouped by model.
+
+    Each point maps ``build_prompt_from_workflow`` overrides, or dotted paths into ``base``
+    overrides such as ``"loras.0.strength_model"``, to values. Any other name is left for
+    ``prepare(prompt, point)``, which runs after the prompt is built, e.g. to splice a
+    ``FaceIDSubgraph`` with a swept weight. Points that yield the same prompt run once.
+    """
+
+    def __init__(
+        self,
+        points: Iterable[Mapping[str, Any]],
+        *,
+        base: Mapping[str, Any] | None = None,
+        workflow_path: str | Path = DEFAULT_WORKFLOW_PATH,
+        prepare: Callable[[Prompt, Mapping[str, Any]], None] | None = None,
+    ) -> None:
+        self.points = [dict(point) for point in points]
+        self.base = dict(base or {})
+        self.workflow_path = workflow_path
+        self.prepare = prepare
+        self.duplicates = 0
+        self._jobs: List[Dict[str, Any]] | None = None
+
+    def _build(self, point: Mapping[str, Any]) -> Prompt:
+        overrides = copy.deepcopy(self.base)
+        for name, value in point.items():
+            if "." in name:
+                _set_path(overrides, name, value)
+            elif name in OVERRIDE_KEYS:
+                overrides[name] = value
+            elif self.prepare is None:
+                raise ValueError(f"Unknown sweep parameter {name!r} and no prepare hook given")
+        prompt = build_prompt_from_workflow(self.workflow_path, **overrides)
+        if self.prepare is not None:
+            self.prepare(prompt, point)
+        return prompt
+
+    def jobs(self) -> List[Dict[str, Any]]:
+        """One ``{"prompt", "key", "params"}`` job per distinct prompt, in point order."""
+        if self._jobs is None:
+            seen: Dict[str, Dict[str, Any]] = {}
+            for point in self.points:
+                prompt = self._build(point)
+                key = prompt_hash(prompt)
+                if key in seen:
+                    self.duplicates += 1
+                    continue
+                seen[key] = {"prompt": prompt, "key": key, "params": point}
+            self._jobs = list(seen.values())
+        return self._jobs
+
+    def plan(self, skip: Container[str] = ()) -> JobPlan:
+        """The jobs whose key is not in ``skip``, grouped to cut model reloads."""
+        return order_jobs(job for job in self.jobs() if job["key"] not in skip)
+
+
+class ResultsTable:
+    """Append-only JSONL table of sweep results, indexed by prompt hash and parameter value."""
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._rows: Dict[str, Dict[str, Any]] = {}
+        self._index: Dict[Tuple[str, str], List[str]] = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as handle:
+                for line in handle:
+                    try:
+                        self._add(json.loads(line))
+                    except ValueError:
+                        continue
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def _add(self, row: Dict[str, Any]) -> None:
+        self._rows[row["key"]] = row
+        for name, value in row.get("params", {}).items():
+            self._index.setdefault((name, json.dumps(value, sort_keys=True)), []).append(row["key"])
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(list(self._rows.values()))
+
+    def get(self, key: str) -> Dict[str, Any] | None:
+        return self._rows.get(key)
+
+    def append(self, row: Mapping[str, Any]) -> None:
+        line = json.dumps(row, default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as handle:
+                handle.write(line + "\n")
+            self._add(json.loads(line))
+
+    def where(self, **params: Any) -> List[Dict[str, Any]]:
+        """Rows whose params match every given value; dotted names are passed as ``**{...}``."""
+        keys: set[str] | None = None
+        for name, value in params.items():
+            matches = set(self._index.get((name, json.dumps(value, sort_keys=True)), ()))
+            keys = matches if keys is None else keys & matches
+        if keys is None:
+            return list(self)
+        return [row for row in self if row["key"] in keys]
+
+
+def run_sweep(
+    sweep: Sweep,
+    table: ResultsTable,
+    *,
+    client: ComfyClient | ComfyPool | None = None,
+    **options: Any,
+) -> Iterator[Dict[str, Any]]:
+    """Run the sweep jobs not yet in ``table`` through ``generate_many``, appending each row.
+
+    ``options`` are passed to ``generate_many``; rows are yielded as they are written.
+    """
+    for result in generate_many(sweep.plan(skip=table), client=client, **options):
+        job = result["job"]
+        row = {
+            "key": job["key"],
+            "params": job["params"],
+            "prompt_id": result["prompt_id"],
+            "images": result["images"],
+            "paths": [str(path) for path in result.get("paths", [])],
+        }
+        table.append(row)
+        yield row
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Sequence, Tuple
+
+PHASES = ("build", "queue", "server_wait", "sampling", "history", "wait", "download", "total")
+
+_MAX_OPEN = 1024
+
+Sink = Callable[[Dict[str, Any]], None]
+
+
+def execution_window(entry: Mapping[str, Any]) -> Tuple[float, float] | None:
+    """Server wall-clock start and end, in seconds, of one history entry's execution."""
+    stamps = {}
+    for message in (entry.get("status") or {}).get("messages", []):
+        if isinstance(message, list) and len(message) == 2 and isinstance(message[1], dict):
+            stamps[message[0]] = message[1].get("timestamp")
+    start, end = stamps.get("execution_start"), stamps.get("execution_success")
+    if start is None or end is None:
+        return None
+    return start / 1000.0, max(end, start) / 1000.0
+
+
+def execution_seconds(entry: Mapping[str, Any]) -> float | None:
+    window = execution_window(entry)
+    return window[1] - window[0] if window is not None else None
+
+
+class MemorySink:
+    def __init__(self) -> None:
+        self.records: List[Dict[str, Any]] = []
+
+    def __call__(self, record: Dict[str, Any]) -> None:
+        self.records.append(record)
+
+
+class JsonlSink:
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def __call__(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as handle:
+                handle.write(line)
+
+
+class TimingRecorder:
+    """Collects per-prompt phase durations and hands each finished record to the sinks.
+
+    Phases are added by prompt id as they happen; ``finish`` emits the record. Server queue
+    wait and sampling time come from the history entry's ``execution_start`` and
+    ``execution_success`` timestamps, so they assume the client and server clocks agree.
+    """
+
+    def __init__(self, *sinks: Sink) -> None:
+        self.sinks = list(sinks) or [MemorySink()]
+        self._lock = threading.Lock()
+        self._open: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    @property
+    def records(self) -> List[Dict[str, Any]]:
+        """Records kept by the first in-memory sink, if there is one."""
+        for sink in self.sinks:
+            if isinstance(sink, MemorySink):
+                return sink.records
+        return []
+
+    def _entry(self, prompt_id: str) -> Dict[str, Any]:
+        entry = self._open.get(prompt_id)
+        if entry is None:
+            entry = self._open[prompt_id] = {"prompt_id": prompt_id, "phases": {}}
+            while len(self._open) > _MAX_OPEN:
+                self._open.popitem(last=False)
+        return entry
+
+    def add(self, prompt_id: str, phase: str, seconds: float) -> None:
+        with self._lock:
+            phases = self._entry(prompt_id)["phases"]
+            phases[phase] = phases.get(phase, 0.0) + max(seconds, 0.0)
+
+    def tag(self, prompt_id: str, **values: Any) -> None:
+        with self._lock:
+            self._entry(prompt_id).update(values)
+
+    def queued(self, prompt_id: str, started: float, queued: float) -> None:
+        """Record the ``/prompt`` round trip; both times are ``time.time()`` values."""
+        with self._lock:
+            entry = self._entry(prompt_id)
+            entry.setdefault("started_at", started)
+            entry["queued_at"] = queued
+            entry["phases"]["queue"] = queued - started
+
+    def completed(self, prompt_id: str, entry: Mapping[str, Any], waited: float) -> None:
+        """Split the wait for ``prompt_id`` into server queue wait and sampling time."""
+        self.add(prompt_id, "wait", waited)
+        window = execution_window(entry)
+        with self._lock:
+            record = self._entry(prompt_id)
+            queued_at = record.get("queued_at")
+        if window is None:
+            return
+        if queued_at is not None:
+            self.add(prompt_id, "server_wait", window[0] - queued_at)
+        self.add(prompt_id, "sampling", window[1] - window[0])
+
+    def finish(self, prompt_id: str, **values: Any) -> Dict[str, Any] | None:
+        with self._lock:
+            record = self._open.pop(prompt_id, None)
+        if record is None:
+            return None
+        record.update(values)
+        record["finished_at"] = time.time()
+        if "started_at" in record:
+            record["phases"]["total"] = record["finished_at"] - record["started_at"]
+        for sink in self.sinks:
+            sink(record)
+        return record
+
+    def summary(self) -> Dict[str, Any]:
+        return summarize(self.records)
+
+
+def _percentile(values: Sequence[float], fraction: float) -> float:
+    ordered = sorted(values)
+    position = fraction * (len(ordered) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(records: Iterable[Mapping[str, Any]]) -> Dict[str, Any]:
+    """Throughput over the records' wall-clock span plus count/mean/p50/p95/max per phase."""
+    records = list(records)
+    samples: Dict[str, List[float]] = {}
+    for record in records:
+        for phase, seconds in record.get("phases", {}).items():
+            samples.setdefault(phase, []).append(seconds)
+    starts = [record["started_at"] for record in records if "started_at" in record]
+    ends = [record["finished_at"] for record in records if "finished_at" in record]
+    span = max(ends) - min(starts) if starts and ends else 0.0
+    phases = {}
+    order = {name: position for position, name in enumerate(PHASES)}
+    for phase in sorted(samples, key=lambda name: (order.get(name, len(PHASES)), name)):
+        values = samples[phase]
+        phases[phase] = {
+            "count": len(values),
+            "mean": sum(values) / len(values),
+            "p50": _percentile(values, 0.50),
+            "p95": _percentile(values, 0.95),
+            "max": max(values),
+        }
+    return {
+        "jobs": len(records),
+        "span": span,
+        "jobs_per_second": len(records) / span if span > 0 else 0.0,
+        "phases": phases,
+    }
+
+
+def format_summary(summary: Mapping[str, Any]) -> str:
+    lines = [
+        f"{summary['jobs']} jobs in {summary['span']:.2f}s "
+        f"({summary['jobs_per_second']:.2f} jobs/s)",
+        f"{'phase':<12} {'count':>6} {'mean':>9} {'p50':>9} {'p95':>9} {'max':>9}",
+    ]
+    for phase, stats in summary["phases"].items():
+        lines.append(
+            f"{phase:<12} {stats['count']:>6} {stats['mean']:>9.4f} {stats['p50']:>9.4f} "
+            f"{stats['p95']:>9.4f} {stats['max']:>9.4f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import http.client
+import io
+import threading
+import urllib.error
+import urllib.parse
+from contextlib import contextmanager
+from typing import Iterator, List, Mapping, Tuple
+
+# Errors raised when a kept-alive connection was closed by the server while idle.
+_STALE_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+
+# Methods that are safe to send twice; other requests are only resent if they never left.
+_IDEMPOTENT = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+class ConnectionPool:
+    """Thread-safe pool of HTTP/1.1 keep-alive connections to a single base URL."""
+
+    def __init__(self, base_url: str, *, maxsize: int = 4, timeout: float = 30.0) -> None:
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        parsed = urllib.parse.urlsplit(base_url)
+        if parsed.scheme not in {"http", "https"} or not parsed.hostname:
+            raise ValueError(f"Unsupported base_url={base_url!r}")
+
+        self.base_url = base_url.rstrip("/")
+        self.scheme = parsed.scheme
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        self.base_path = parsed.path.rstrip("/")
+        self.maxsize = maxsize
+        self.timeout = timeout
+
+        self._idle: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxsize)
+        self.connections_opened = 0
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        connection_cls = (
+            http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        )
+        with self._lock:
+            self.connections_opened += 1
+        return connection_cls(self.host, self.port, timeout=self.timeout)
+
+    def _checkout(self) -> Tuple[http.client.HTTPConnection, bool]:
+        self._slots.acquire()
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._new_connection(), False
+
+    def _checkin(self, connection: http.client.HTTPConnection, reusable: bool) -> None:
+        try:
+            if reusable:
+                with self._lock:
+                    self._idle.append(connection)
+            else:
+                connection.close()
+        finally:
+            self._slots.release()
+
+    def _send(
+        self,
+        connection: http.client.HTTPConnection,
+        method: str,
+        path: str,
+        body: bytes | None,
+        headers: Mapping[str, str],
+        *,
+        retry: bool,
+    ) -> http.client.HTTPResponse:
+        try:
+            connection.request(method, f"{self.base_path}{path}", body=body, headers=dict(headers))
+        except _STALE_ERRORS:
+            if not retry:
+                raise
+            # The request was not fully written, so the server cannot have acted on it.
+            connection.close()
+            return self._send(connection, method, path, body, headers, retry=False)
+        try:
+            return connection.getresponse()
+        except _STALE_ERRORS:
+            # A POST such as /prompt may already have been accepted; resending could queue it
+            # twice, so only idempotent requests are retried and the rest go to the caller.
+            if not retry or method.upper() not in _IDEMPOTENT:
+                raise
+            connection.close()
+            return self._send(connection, method, path, body, headers, retry=False)
+
+    @contextmanager
+    def open(
+        self,
+        method: str,
+        path: str,
+        body: bytes | None = None,
+        headers: Mapping[str, str] | None = None,
+    ) -> Iterator[http.client.HTTPResponse]:
+        headers = headers or {}
+        url = f"{self.base_url}{path}"
+        connection, reused = self._checkout()
+        try:
+            response = self._send(connection, method, path, body, headers, retry=reused)
+        except urllib.error.URLError:
+            self._checkin(connection, False)
+            raise
+        except OSError as exc:
+            self._checkin(connection, False)
+            raise urllib.error.URLError(exc) from exc
+        except BaseException:
+            self._checkin(connection, False)
+            raise
+
+        reusable = False
+        try:
+            if response.status >= 400:
+                payload = response.read()
+                raise urllib.error.HTTPError(
+                    url, response.status, response.reason, response.headers, io.BytesIO(payload)
+                )
+            yield response
+            # Only a fully drained response leaves the connection in a reusable state.
+            reusable = not response.will_close and response.isclosed()
+        finally:
+            if not reusable:
+                response.close()
+            self._checkin(connection, reusable)
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        body: bytes | None = None,
+        headers: Mapping[str, str] | None = None,
+    ) -> Tuple[int, http.client.HTTPMessage, bytes]:
+        with self.open(method, path, body, headers) as response:
+            payload = response.read()
+            return response.status, response.headers, payload
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
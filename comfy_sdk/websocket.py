@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import os
+import socket
+import ssl
+import struct
+import urllib.parse
+from typing import Tuple
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+
+class WebSocketError(Exception):
+    pass
+
+
+class WebSocket:
+    """Minimal RFC 6455 client, enough to follow the ComfyUI ``/ws`` event stream."""
+
+    def __init__(self, sock: socket.socket, buffer: bytes = b"") -> None:
+        self.sock = sock
+        self._buffer = bytearray(buffer)
+        self._fragments: list[bytes] = []
+        self._fragment_opcode = OP_TEXT
+        self.closed = False
+
+    @classmethod
+    def connect(cls, url: str, *, timeout: float = 10.0) -> "WebSocket":
+        parsed = urllib.parse.urlsplit(url)
+        if parsed.scheme not in {"ws", "wss"} or not parsed.hostname:
+            raise WebSocketError(f"Unsupported websocket url={url!r}")
+        port = parsed.port or (443 if parsed.scheme == "wss" else 80)
+        sock = socket.create_connection((parsed.hostname, port), timeout=timeout)
+        try:
+            if parsed.scheme == "wss":
+                sock = ssl.create_default_context().wrap_socket(sock, server_hostname=parsed.hostname)
+            key = base64.b64encode(os.urandom(16)).decode("ascii")
+            target = parsed.path or "/"
+            if parsed.query:
+                target = f"{target}?{parsed.query}"
+            handshake = (
+                f"GET {target} HTTP/1.1\r\n"
+                f"Host: {parsed.netloc}\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Key: {key}\r\n"
+                "Sec-WebSocket-Version: 13\r\n\r\n"
+            )
+            sock.sendall(handshake.encode("ascii"))
+
+            response = b""
+            while b"\r\n\r\n" not in response:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    raise WebSocketError("Connection closed during websocket handshake")
+                response += chunk
+            head, _, rest = response.partition(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            if len(lines[0].split()) < 2 or lines[0].split()[1] != "101":
+                raise WebSocketError(f"Websocket handshake rejected: {lines[0]!r}")
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            expected = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode("ascii")).digest())
+            if headers.get("sec-websocket-accept") != expected.decode("ascii"):
+                raise WebSocketError("Websocket handshake returned an invalid accept key")
+        except BaseException:
+            sock.close()
+            raise
+        return cls(sock, rest)
+
+    def settimeout(self, timeout: float | None) -> None:
+        self.sock.settimeout(timeout)
+
+    def _parse_frame(self) -> Tuple[bool, int, bytes] | None:
+        buffer = self._buffer
+        if len(buffer) < 2:
+            return None
+        fin = bool(buffer[0] & 0x80)
+        opcode = buffer[0] & 0x0F
+        masked = bool(buffer[1] & 0x80)
+        length = buffer[1] & 0x7F
+        offset = 2
+        if length == 126:
+            if len(buffer) < offset + 2:
+                return None
+            (length,) = struct.unpack_from("!H", buffer, offset)
+            offset += 2
+        elif length == 127:
+            if len(buffer) < offset + 8:
+                return None
+            (length,) = struct.unpack_from("!Q", buffer, offset)
+            offset += 8
+        mask = b""
+        if masked:
+            if len(buffer) < offset + 4:
+                return None
+            mask = bytes(buffer[offset : offset + 4])
+            offset += 4
+        if len(buffer) < offset + length:
+            return None
+        payload = bytes(buffer[offset : offset + length])
+        del buffer[: offset + length]
+        if masked:
+            payload = bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+        return fin, opcode, payload
+
+    def recv(self) -> str | bytes | None:
+        """Return the next text or binary message, or ``None`` once the server closes.
+
+        Raises ``socket.timeout`` if no complete message arrives within the socket timeout;
+        partially received frames are kept and resumed on the next call.
+        """
+        while True:
+            frame = self._parse_frame()
+            if frame is None:
+                if self.closed:
+                    return None
+                chunk = self.sock.recv(65536)
+                if not chunk:
+                    self.closed = True
+                    self.sock.close()
+                    return None
+                self._buffer.extend(chunk)
+                continue
+
+            fin, opcode, payload = frame
+            if opcode == OP_PING:
+                self._send_frame(OP_PONG, payload)
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode == OP_CLOSE:
+                self.close()
+                return None
+            if opcode == OP_CONTINUATION:
+                self._fragments.append(payload)
+            else:
+                self._fragment_opcode = opcode
+                self._fragments = [payload]
+            if not fin:
+                continue
+
+            message = b"".join(self._fragments)
+            self._fragments = []
+            if self._fragment_opcode == OP_TEXT:
+                return message.decode("utf-8")
+            return message
+
+    def _send_frame(self, opcode: int, payload: bytes) -> None:
+        header = bytes([0x80 | opcode])
+        length = len(payload)
+        if length < 126:
+            header += bytes([0x80 | length])
+        elif length < 1 << 16:
+            header += bytes([0x80 | 126]) + struct.pack("!H", length)
+        else:
+            header += bytes([0x80 | 127]) + struct.pack("!Q", length)
+        mask = os.urandom(4)
+        masked = bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+        self.sock.sendall(header + mask + masked)
+
+    def send(self, message: str | bytes) -> None:
+        if isinstance(message, str):
+            self._send_frame(OP_TEXT, message.encode("utf-8"))
+        else:
+            self._send_frame(OP_BINARY, message)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._send_frame(OP_CLOSE, struct.pack("!H", 1000))
+        except OSError:
+            pass
+        finally:
+            self.sock.close()
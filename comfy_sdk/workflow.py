@@ -1,11 +1,115 @@
 from __future__ import annotations
 
+import copy
 import json
+import os
+import threading
 from pathlib import Path
-from typing import Any, Dict, Iterable, Mapping, Sequence
+from typing import Any, Dict, Iterable, List, Mapping, Sequence, Tuple
 
 Prompt = Dict[str, Dict[str, Any]]
 
+_SCALARS = (str, int, float, bool, type(None))
+
+
+def _numeric_id(node_id: Any) -> int:
+    text = str(node_id)
+    return int(text) if text.isdigit() else 0
+
+
+class PromptGraph(Dict[str, Dict[str, Any]]):
+    """Prompt dict that keeps a class_type -> node ids index and the largest numeric id.
+
+    The index follows item assignment and deletion. Changing a node's ``class_type`` in place
+    is not tracked; call ``reindex`` afterwards.
+    """
+
+    def __init__(self, nodes: Mapping[str, Dict[str, Any]] | Iterable[Tuple[str, Dict[str, Any]]] = ()) -> None:
+        super().__init__()
+        self._by_type: Dict[str, List[str]] = {}
+        self._max_id = 0
+        self._stale = False
+        self.update(nodes)
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        return (type(self), (dict(self),))
+
+    def _index(self, node_id: str, node: Mapping[str, Any]) -> None:
+        self._by_type.setdefault(node.get("class_type"), []).append(node_id)
+        self._max_id = max(self._max_id, _numeric_id(node_id))
+
+    def _unindex(self, node_id: str, node: Mapping[str, Any]) -> None:
+        ids = self._by_type.get(node.get("class_type"))
+        if ids is not None and node_id in ids:
+            ids.remove(node_id)
+        if _numeric_id(node_id) >= self._max_id:
+            self._stale = True
+
+    def reindex(self) -> None:
+        self._by_type = {}
+        self._max_id = 0
+        for node_id, node in self.items():
+            self._index(node_id, node)
+        self._stale = False
+
+    def __setitem__(self, node_id: str, node: Dict[str, Any]) -> None:
+        previous = self.get(node_id)
+        super().__setitem__(node_id, node)
+        if previous is None:
+            self._index(node_id, node)
+        elif previous.get("class_type") != node.get("class_type"):
+            # The node keeps its dict position, so per-type order needs a full rebuild.
+            self._stale = True
+
+    def __delitem__(self, node_id: str) -> None:
+        node = self[node_id]
+        super().__delitem__(node_id)
+        self._unindex(node_id, node)
+
+    def pop(self, node_id: str, *default: Any) -> Any:
+        if node_id not in self:
+            return super().pop(node_id, *default)
+        node = self[node_id]
+        del self[node_id]
+        return node
+
+    def popitem(self) -> Tuple[str, Dict[str, Any]]:
+        node_id, node = super().popitem()
+        self._unindex(node_id, node)
+        return node_id, node
+
+    def setdefault(self, node_id: str, default: Dict[str, Any] | None = None) -> Dict[str, Any]:
+        if node_id not in self:
+            self[node_id] = default if default is not None else {}
+        return self[node_id]
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        for node_id, node in dict(*args, **kwargs).items():
+            self[node_id] = node
+
+    def clear(self) -> None:
+        super().clear()
+        self._by_type = {}
+        self._max_id = 0
+        self._stale = False
+
+    def copy(self) -> "PromptGraph":
+        return PromptGraph(self)
+
+    def nodes_of_type(self, class_type: str) -> List[str]:
+        if self._stale:
+            self.reindex()
+        return list(self._by_type.get(class_type, ()))
+
+    @property
+    def max_id(self) -> int:
+        if self._stale:
+            self.reindex()
+        return self._max_id
+
+    def next_id(self) -> str:
+        return str(self.max_id + 1)
+
 
 def load_workflow(path: str | Path) -> Dict[str, Any]:
     workflow_path = Path(path)
@@ -13,51 +117,316 @@ def load_workflow(path: str | Path) -> Dict[str, Any]:
         return json.load(handle)
 
 
-def workflow_to_prompt(workflow: Mapping[str, Any]) -> Prompt:
-    links_by_id = {link[0]: link for link in workflow.get("links", [])}
-    prompt: Prompt = {}
+# Nodes that only exist in the editor; the server has no class for them.
+_FRONTEND_ONLY = frozenset({"Reroute", "PrimitiveNode", "Note", "MarkdownNote"})
+
+# Output nodes of the core and common custom node packs. Any other node without output slots
+# is also kept, since it can only be there for its side effects.
+OUTPUT_NODE_TYPES = frozenset(
+    {
+        "SaveImage",
+        "PreviewImage",
+        "SaveAnimatedWEBP",
+        "SaveAnimatedPNG",
+        "SaveLatent",
+        "SaveVideo",
+        "SaveWEBM",
+        "SaveAudio",
+        "PreviewAudio",
+        "VHS_VideoCombine",
+    }
+)
 
-    for node in workflow.get("nodes", []):
-        node_id = str(node["id"])
-        node_type = node["type"]
-        inputs: Dict[str, Any] = {}
+# ComfyUI stores "control_after_generate" in widgets_values right after seed-like INT widgets.
+_SEED_CONTROLS = frozenset({"fixed", "increment", "decrement", "randomize"})
+
+_MUTED, _BYPASSED = 2, 4
+
+# Ids of the input and output pseudo-nodes inside a subgraph definition.
+_SUBGRAPH_INPUT, _SUBGRAPH_OUTPUT = -10, -20
 
-        widget_values = list(node.get("widgets_values") or [])
-        widget_inputs = [item for item in node.get("inputs", []) if "widget" in item]
-        if (
-            node_type == "KSampler"
-            and len(widget_values) == len(widget_inputs) + 1
-            and len(widget_values) >= 2
-            and isinstance(widget_values[1], str)
-        ):
-            # ComfyUI stores the seed "control_after_generate" after the seed value in UI workflows.
-            widget_values = [widget_values[0]] + widget_values[2:]
+Link = Tuple[Any, int]
 
+
+def _link_tuple(link: Any) -> Tuple[Any, Any, int, Any, int, Any]:
+    if isinstance(link, Mapping):
+        return (
+            link.get("id"),
+            link.get("origin_id"),
+            link.get("origin_slot", 0),
+            link.get("target_id"),
+            link.get("target_slot", 0),
+            link.get("type"),
+        )
+    padded = list(link) + [None] * (6 - len(link))
+    return padded[0], padded[1], padded[2], padded[3], padded[4], padded[5]
+
+
+class _Graph:
+    """Node and link indexes of one workflow graph or subgraph definition, built once."""
+
+    def __init__(self, graph: Mapping[str, Any]) -> None:
+        self.nodes: List[Dict[str, Any]] = list(graph.get("nodes", []))
+        self.by_id = {node["id"]: node for node in self.nodes}
+        self.links: Dict[Any, Tuple[Any, Any, int, Any, int, Any]] = {}
+        self.incoming: Dict[Tuple[Any, int], Tuple[Any, Any, int, Any, int, Any]] = {}
+        for raw in graph.get("links", []) or []:
+            link = _link_tuple(raw)
+            self.links[link[0]] = link
+            self.incoming[(link[3], link[4])] = link
+
+
+class _Scope:
+    """One placement of a graph: the root workflow or a subgraph instance inside a parent."""
+
+    def __init__(
+        self, graph: _Graph, prefix: str = "", parent: "_Scope | None" = None, instance: Any = None
+    ) -> None:
+        self.graph = graph
+        self.prefix = prefix
+        self.parent = parent
+        self.instance = instance
+        self.children: Dict[Any, "_Scope"] = {}
+
+
+def _types_match(expected: Any, actual: Any) -> bool:
+    return expected == actual or "*" in (expected, actual) or not expected or not actual
+
+
+def _passthrough_input(node: Mapping[str, Any], slot: int) -> Mapping[str, Any] | None:
+    # A bypassed node forwards the input at the same slot when its type matches, else the first
+    # input of the output's type; a reroute forwards its only input.
+    inputs = node.get("inputs", [])
+    linked = [item for item in inputs if item.get("link") is not None]
+    if node.get("type") == "Reroute":
+        return linked[0] if linked else None
+    outputs = node.get("outputs", [])
+    output_type = outputs[slot].get("type") if slot < len(outputs) else None
+    if slot < len(inputs) and inputs[slot].get("link") is not None:
+        if _types_match(inputs[slot].get("type"), output_type):
+            return inputs[slot]
+    for item in linked:
+        if _types_match(item.get("type"), output_type):
+            return item
+    return None
+
+
+class _Converter:
+    def __init__(self, workflow: Mapping[str, Any]) -> None:
+        definitions = (workflow.get("definitions") or {}).get("subgraphs", []) or []
+        self._definitions = {definition["id"]: definition for definition in definitions}
+        self._graphs: Dict[str, _Graph] = {}
+        self._resolved: Dict[Tuple[str, Any, int], List[Any] | Tuple[str, Any] | None] = {}
+        self.root = _Scope(_Graph(workflow))
+
+    def _child(self, scope: _Scope, node: Mapping[str, Any]) -> _Scope:
+        child = scope.children.get(node["id"])
+        if child is None:
+            graph = self._graphs.get(node["type"])
+            if graph is None:
+                graph = self._graphs[node["type"]] = _Graph(self._definitions[node["type"]])
+            prefix = f"{scope.prefix}{node['id']}:"
+            child = scope.children[node["id"]] = _Scope(graph, prefix, scope, node)
+        return child
+
+    def resolve(self, scope: _Scope, origin: Any, slot: int) -> List[Any] | Tuple[str, Any] | None:
+        """Follow reroutes, bypassed nodes, primitives and subgraph borders to a real output.
+
+        Returns ``[node_id, slot]``, ``("value", value)`` for a primitive, or None when the
+        chain ends at a muted node or an unconnected input. Every hop is memoized, so each
+        link is followed once per conversion.
+        """
+        visited: Dict[Tuple[str, Any, int], None] = {}
+        result: List[Any] | Tuple[str, Any] | None = None
+        while True:
+            key = (scope.prefix, origin, slot)
+            if key in self._resolved:
+                result = self._resolved[key]
+                break
+            if key in visited:
+                raise ValueError(f"Link cycle through node {scope.prefix}{origin}")
+            visited[key] = None
+            link = None
+            if origin == _SUBGRAPH_INPUT:
+                if scope.parent is not None:
+                    inputs = scope.instance.get("inputs", [])
+                    link_id = inputs[slot].get("link") if slot < len(inputs) else None
+                    link = scope.parent.graph.links.get(link_id)
+                    scope = scope.parent
+            else:
+                node = scope.graph.by_id.get(origin)
+                if node is None or node.get("mode") == _MUTED:
+                    pass
+                elif node.get("mode") == _BYPASSED or node.get("type") == "Reroute":
+                    item = _passthrough_input(node, slot)
+                    link = scope.graph.links.get(item.get("link")) if item else None
+                elif node.get("type") == "PrimitiveNode":
+                    values = node.get("widgets_values") or []
+                    result = ("value", values[0]) if values else None
+                    break
+                elif node.get("type") in self._definitions:
+                    scope = self._child(scope, node)
+                    link = scope.graph.incoming.get((_SUBGRAPH_OUTPUT, slot))
+                else:
+                    result = [f"{scope.prefix}{origin}", slot]
+                    break
+            if link is None:
+                break
+            origin, slot = link[1], link[2]
+        for key in visited:
+            self._resolved[key] = result
+        return result
+
+    def emit(self, scope: _Scope, prompt: PromptGraph, outputs: List[str], types: frozenset) -> None:
+        for node in scope.graph.nodes:
+            node_type = node.get("type")
+            if node.get("mode") in (_MUTED, _BYPASSED) or node_type in _FRONTEND_ONLY:
+                continue
+            if node_type in self._definitions:
+                self.emit(self._child(scope, node), prompt, outputs, types)
+                continue
+            node_id = f"{scope.prefix}{node['id']}"
+            prompt[node_id] = {"inputs": self._inputs(scope, node), "class_type": node_type}
+            if node_type in types or not node.get("outputs"):
+                outputs.append(node_id)
+
+    def _inputs(self, scope: _Scope, node: Mapping[str, Any]) -> Dict[str, Any]:
+        raw_values = node.get("widgets_values")
+        named = raw_values if isinstance(raw_values, Mapping) else None
+        values = [] if named is not None else list(raw_values or [])
+        input_defs = node.get("inputs", [])
+        surplus = len(values) - sum(1 for item in input_defs if "widget" in item)
+
+        inputs: Dict[str, Any] = {}
         widget_index = 0
-        for input_def in node.get("inputs", []):
+        for input_def in input_defs:
             name = input_def.get("name")
             if not name:
                 continue
-
-            link_id = input_def.get("link")
-            if link_id is not None:
-                link = links_by_id.get(link_id)
-                if link is None:
-                    continue
-                inputs[name] = [str(link[1]), link[2]]
-                continue
-
+            widget_value: Any = None
+            has_widget = False
             if "widget" in input_def:
-                if widget_index < len(widget_values):
-                    inputs[name] = widget_values[widget_index]
+                if named is not None:
+                    has_widget = name in named
+                    widget_value = named.get(name)
+                elif widget_index < len(values):
+                    has_widget = True
+                    widget_value = values[widget_index]
                     widget_index += 1
-
-        prompt[node_id] = {"inputs": inputs, "class_type": node_type}
-
-    return prompt
+                    if (
+                        surplus > 0
+                        and type(widget_value) is int
+                        and widget_index < len(values)
+                        and values[widget_index] in _SEED_CONTROLS
+                    ):
+                        widget_index += 1
+                        surplus -= 1
+
+            link = scope.graph.links.get(input_def.get("link"))
+            source = self.resolve(scope, link[1], link[2]) if link is not None else None
+            if isinstance(source, tuple):
+                inputs[name] = source[1]
+            elif source is not None:
+                inputs[name] = source
+            elif has_widget:
+                inputs[name] = widget_value
+        return inputs
+
+
+def _reachable(prompt: Prompt, outputs: Sequence[str]) -> set:
+    seen = set(outputs)
+    stack = list(outputs)
+    while stack:
+        for value in prompt[stack.pop()]["inputs"].values():
+            if isinstance(value, list) and len(value) == 2 and isinstance(value[0], str):
+                if value[0] in prompt and value[0] not in seen:
+                    seen.add(value[0])
+                    stack.append(value[0])
+    return seen
+
+
+def workflow_to_prompt(
+    workflow: Mapping[str, Any],
+    *,
+    prune: bool = True,
+    output_types: Iterable[str] = OUTPUT_NODE_TYPES,
+) -> Prompt:
+    """Convert an editor workflow to API prompt form in time linear in nodes plus links.
+
+    Muted nodes are dropped and bypassed nodes pass their inputs through by type. Reroutes are
+    collapsed, PrimitiveNode values are written into the widgets they feed, groups are
+    ignored and subgraph instances are flattened with ``"<instance>:<inner>"`` ids. With
+    ``prune``, nodes that feed no output node are left out; a workflow without any
+    recognised output node is kept whole.
+    """
+    converter = _Converter(workflow)
+    prompt = PromptGraph()
+    outputs: List[str] = []
+    converter.emit(converter.root, prompt, outputs, frozenset(output_types))
+    if not prune or not outputs:
+        return prompt
+    keep = _reachable(prompt, outputs)
+    if len(keep) == len(prompt):
+        return prompt
+    return PromptGraph((node_id, node) for node_id, node in prompt.items() if node_id in keep)
+
+
+def _copy_value(value: Any) -> Any:
+    if isinstance(value, _SCALARS):
+        return value
+    if type(value) is list:
+        return [item if isinstance(item, _SCALARS) else copy.deepcopy(item) for item in value]
+    return copy.deepcopy(value)
+
+
+def copy_prompt(prompt: Mapping[str, Mapping[str, Any]]) -> PromptGraph:
+    copied = PromptGraph()
+    for node_id, node in prompt.items():
+        node_copy = dict(node)
+        inputs = node.get("inputs")
+        if inputs is not None:
+            node_copy["inputs"] = {name: _copy_value(value) for name, value in inputs.items()}
+        copied[node_id] = node_copy
+    return copied
+
+
+class WorkflowTemplate:
+    """A workflow converted to prompt form once, handing out independent copies."""
+
+    def __init__(self, prompt: Mapping[str, Mapping[str, Any]], path: Path | None = None) -> None:
+        self.path = path
+        self._prompt = copy_prompt(prompt)
+
+    @classmethod
+    def from_workflow(cls, workflow: Mapping[str, Any], path: Path | None = None) -> "WorkflowTemplate":
+        return cls(workflow_to_prompt(workflow), path)
+
+    def prompt(self) -> PromptGraph:
+        return copy_prompt(self._prompt)
+
+
+_TEMPLATE_CACHE: Dict[str, Tuple[Tuple[int, int], WorkflowTemplate]] = {}
+_TEMPLATE_LOCK = threading.Lock()
+
+
+def load_template(path: str | Path) -> WorkflowTemplate:
+    key = os.fspath(path)
+    stat = os.stat(key)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _TEMPLATE_LOCK:
+        cached = _TEMPLATE_CACHE.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    template = WorkflowTemplate.from_workflow(load_workflow(key), Path(key))
+    with _TEMPLATE_LOCK:
+        _TEMPLATE_CACHE[key] = (signature, template)
+    return template
 
 
 def find_nodes_by_type(prompt: Prompt, class_type: str) -> Iterable[str]:
+    if isinstance(prompt, PromptGraph):
+        return prompt.nodes_of_type(class_type)
     return [node_id for node_id, node in prompt.items() if node.get("class_type") == class_type]
 
 
@@ -74,6 +443,8 @@ def _get_node_id_by_type(prompt: Prompt, class_type: str, index: int) -> str:
 
 
 def _max_node_id(prompt: Prompt) -> int:
+    if isinstance(prompt, PromptGraph):
+        return prompt.max_id
     numeric_ids = [int(node_id) for node_id in prompt.keys() if node_id.isdigit()]
     return max(numeric_ids, default=0)
 
@@ -212,10 +583,8 @@ def add_lora_to_chain(
     prompt[new_id] = {"inputs": lora_inputs, "class_type": "LoraLoader"}
 
     sampler_inputs["model"] = [new_id, 0]
-    for node in prompt.values():
-        if node.get("class_type") != "CLIPTextEncode":
-            continue
-        inputs = node.get("inputs", {})
+    for clip_id in find_nodes_by_type(prompt, "CLIPTextEncode"):
+        inputs = prompt[clip_id].get("inputs", {})
         clip_link = inputs.get("clip")
         if isinstance(clip_link, list) and clip_link and str(clip_link[0]) == str(base_lora_id):
             inputs["clip"] = [new_id, clip_link[1] if len(clip_link) > 1 else 1]
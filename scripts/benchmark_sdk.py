@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from comfy_sdk import (
+    DEFAULT_WORKFLOW_PATH,
+    ComfyClient,
+    Scheduler,
+    TimingRecorder,
+    build_prompt_from_workflow,
+    connect,
+    format_summary,
+    generate_batched,
+    generate_from_workflow,
+    generate_many,
+)
+from comfy_sdk.fakeserver import FakeComfyServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCENARIOS = ("client", "generate", "batch", "seed-batch", "pool", "scheduler")
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Measure SDK throughput against local fake ComfyUI servers; no GPU needed."
+    )
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS)
+    parser.add_argument("--prompts", type=int, default=40)
+    parser.add_argument("--sampling-delay", type=float, default=0.02)
+    parser.add_argument("--history-delay", type=float, default=0.0)
+    parser.add_argument("--image-bytes", type=int, default=256 * 1024)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--lookahead", type=int, default=4)
+    parser.add_argument("--max-batch", type=int, default=4, help="Seeds per seed-batch prompt.")
+    parser.add_argument("--servers", type=int, default=2, help="Fake servers for the pool run.")
+    parser.add_argument("--workflow", default=str(DEFAULT_WORKFLOW_PATH))
+    parser.add_argument("--timings", action="store_true", help="Print per-phase timings.")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this file.")
+    return parser
+
+
+def _start_servers(args: argparse.Namespace, count: int) -> List[FakeComfyServer]:
+    return [
+        FakeComfyServer(
+            sampling_delay=args.sampling_delay,
+            image_bytes=args.image_bytes,
+            history_delay=args.history_delay,
+        ).start()
+        for _ in range(count)
+    ]
+
+
+def _jobs(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    return [
+        {"seed": index, "batch_size": args.batch_size, "output_prefix": f"bench_{index:05d}"}
+        for index in range(args.prompts)
+    ]
+
+
+def _run_client(args: argparse.Namespace, client: ComfyClient, output_dir: Path) -> None:
+    prompt = build_prompt_from_workflow(args.workflow, batch_size=args.batch_size)
+    for _ in range(args.prompts):
+        prompt_id = client.queue_prompt(prompt)
+        history = client.wait_for_prompt(prompt_id, poll_interval=0.05)
+        for image in client.extract_images(history, prompt_id):
+            client.download_image_to(image["filename"], output_dir / image["filename"])
+
+
+def _run_generate(args: argparse.Namespace, client: ComfyClient, output_dir: Path) -> None:
+    for job in _jobs(args):
+        result = generate_from_workflow(args.workflow, client=client, poll_interval=0.05, **job)
+        for image in result["images"]:
+            client.download_image_to(image["filename"], output_dir / image["filename"])
+
+
+def _run_batch(args: argparse.Namespace, client: Any, output_dir: Path) -> None:
+    results = generate_many(
+        _jobs(args),
+        args.workflow,
+        client=client,
+        lookahead=args.lookahead,
+        poll_interval=0.05,
+        download_dir=output_dir,
+    )
+    for _ in results:
+        pass
+
+
+def _run_seed_batch(args: argparse.Namespace, client: Any, output_dir: Path) -> None:
+    results = generate_batched(
+        _jobs(args),
+        args.workflow,
+        max_batch=args.max_batch,
+        client=client,
+        lookahead=args.lookahead,
+        poll_interval=0.05,
+        download_dir=output_dir,
+    )
+    for _ in results:
+        pass
+
+
+def _run_scheduler(args: argparse.Namespace, client: ComfyClient, output_dir: Path) -> None:
+    prompts = [build_prompt_from_workflow(args.workflow, **job) for job in _jobs(args)]
+    with Scheduler(client, max_depth=max(args.lookahead, 2), poll_interval=0.05) as scheduler:
+        futures = [scheduler.submit(prompt) for prompt in prompts]
+        for future in futures:
+            future.result()
+
+
+RUNNERS: Dict[str, Callable[[argparse.Namespace, Any, Path], None]] = {
+    "client": _run_client,
+    "generate": _run_generate,
+    "batch": _run_batch,
+    "seed-batch": _run_seed_batch,
+    "pool": _run_batch,
+    "scheduler": _run_scheduler,
+}
+
+
+def _max_rss_mib() -> float | None:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and in bytes on macOS.
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_scenario(args: argparse.Namespace, scenario: str) -> Dict[str, Any]:
+    servers = _start_servers(args, args.servers if scenario == "pool" else 1)
+    timings = TimingRecorder()
+    client = connect([server.base_url for server in servers], timings=timings)
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            tracemalloc.start()
+            cpu_started, started = time.process_time(), time.perf_counter()
+            RUNNERS[scenario](args, client, Path(output_dir))
+            elapsed = time.perf_counter() - started
+            cpu = time.process_time() - cpu_started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    finally:
+        client.close()
+        for server in servers:
+            server.stop()
+
+    requests: Dict[str, int] = {}
+    bytes_in = bytes_out = connections = 0
+    for server in servers:
+        stats = server.stats()
+        for endpoint, count in stats["requests"].items():
+            requests[endpoint] = requests.get(endpoint, 0) + count
+        bytes_in += stats["bytes_in"]
+        bytes_out += stats["bytes_out"]
+        connections += stats["connections"]
+    return {
+        "scenario": scenario,
+        "prompts": args.prompts,
+        "seconds": elapsed,
+        "prompts_per_second": args.prompts / elapsed if elapsed > 0 else 0.0,
+        "requests": dict(sorted(requests.items())),
+        "connections": connections,
+        "bytes_sent": bytes_in,
+        "bytes_received": bytes_out,
+        "cpu_seconds": cpu,
+        "cpu_per_prompt_ms": 1000.0 * cpu / args.prompts if args.prompts else 0.0,
+        "peak_traced_mib": peak / (1024 * 1024),
+        "max_rss_mib": _max_rss_mib(),
+        "timings": timings.summary(),
+    }
+
+
+def format_result(result: Dict[str, Any]) -> str:
+    requests = ", ".join(f"{endpoint} {count}" for endpoint, count in result["requests"].items())
+    rss = result["max_rss_mib"]
+    lines = [
+        f"[{result['scenario']}] {result['prompts']} prompts in {result['seconds']:.2f}s "
+        f"({result['prompts_per_second']:.1f} prompts/s)",
+        f"  requests: {requests} ({result['connections']} connections)",
+        f"  bytes: {result['bytes_sent']:,} sent, {result['bytes_received']:,} received",
+        f"  client cpu: {result['cpu_seconds']:.2f}s ({result['cpu_per_prompt_ms']:.2f} ms/prompt)"
+        f", peak traced {result['peak_traced_mib']:.1f} MiB"
+        + (f", max rss {rss:.0f} MiB" if rss is not None else ""),
+    ]
+    return "\n".join(lines)
+
+
+def main() -> int:
+    args = build_arg_parser().parse_args()
+    if args.prompts < 1:
+        raise SystemExit("--prompts must be at least 1")
+    results = []
+    for scenario in args.scenario or SCENARIOS:
+        result = run_scenario(args, scenario)
+        results.append(result)
+        print(format_result(result))
+        # Only the generate helpers finish timing records; raw client calls leave none.
+        if args.timings and result["timings"]["jobs"]:
+            print(format_summary(result["timings"]))
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
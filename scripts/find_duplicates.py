@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+from comfy_sdk.dedup import METHODS, DuplicateFinder
+
+DEFAULT_ROOT = Path(os.environ.get("DATASET_DIR", "TRAINING_DATA/CLIN7"))
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Find near-duplicate images in a dataset folder by perceptual hash."
+    )
+    parser.add_argument("--root", default=str(DEFAULT_ROOT))
+    parser.add_argument("--threshold", type=int, default=6, help="Max differing hash bits.")
+    parser.add_argument("--method", default="phash", choices=METHODS)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--report", help="Write the clusters as JSON to this file.")
+    parser.add_argument(
+        "--quarantine", help="Move duplicates and their captions into this folder."
+    )
+    return parser
+
+
+def main() -> int:
+    args = build_arg_parser().parse_args()
+    finder = DuplicateFinder(
+        args.root, threshold=args.threshold, method=args.method, workers=args.workers
+    )
+    started = time.perf_counter()
+    clusters = finder.clusters()
+    report = finder.report(clusters)
+    print(
+        f"{report['images']} images, {len(clusters)} clusters, {report['duplicates']} "
+        f"duplicates, {len(report['skipped'])} skipped in {time.perf_counter() - started:.2f}s"
+    )
+    for cluster in report["clusters"]:
+        print(f"  keep {cluster['keep']}")
+        for duplicate in cluster["duplicates"]:
+            print(f"    {duplicate['path']} (distance {duplicate['distance']})")
+    for relpath, error in report["skipped"].items():
+        print(f"  skipped {relpath}: {error}")
+    if args.report:
+        Path(args.report).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if args.quarantine:
+        moved = finder.quarantine(clusters, args.quarantine)
+        print(f"Moved {len(moved)} files to {args.quarantine}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,12 +1,11 @@
 from __future__ import annotations
 
-import json
 import os
 import sys
 import urllib.error
 from pathlib import Path
 
-from comfy_sdk import ComfyClient, generate_from_workflow
+from comfy_sdk import JobJournal, ManifestStore, connect, generate_many
 
 
 BASE_URL = os.environ.get("COMFY_URL", "http://127.0.0.1:8188")
@@ -67,59 +66,58 @@ SCENES = [
 
 def main() -> int:
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    client = ComfyClient(base_url=BASE_URL)
+    client = connect(BASE_URL)
 
-    manifest = []
-    for index, scene in enumerate(SCENES, start=1):
-        try:
-            result = generate_from_workflow(
-                client=client,
-                positive=scene["positive"],
-                negative=NEGATIVE_PROMPT,
-                ckpt_name=CKPT_NAME,
-                seed=SEED_BASE + index,
-                steps=30,
-                cfg=3.5,
-                sampler_name="dpmpp_2m_sde",
-                scheduler="karras",
-                denoise=1.0,
-                output_prefix=f"amber_story_{index:02d}",
-            )
-        except urllib.error.URLError as exc:
-            print(
-                f"ComfyUI is not reachable at {BASE_URL}. "
-                "Start the server or set COMFY_URL.",
-                file=sys.stderr,
-            )
-            raise SystemExit(1) from exc
-        images = result.get("images", [])
-        if not images:
-            raise RuntimeError(f"No images returned for {scene['name']}")
+    jobs = [
+        {
+            "positive": scene["positive"],
+            "negative": NEGATIVE_PROMPT,
+            "ckpt_name": CKPT_NAME,
+            "seed": SEED_BASE + index,
+            "steps": 30,
+            "cfg": 3.5,
+            "sampler_name": "dpmpp_2m_sde",
+            "scheduler": "karras",
+            "denoise": 1.0,
+            "output_prefix": f"amber_story_{index:02d}",
+        }
+        for index, scene in enumerate(SCENES, start=1)
+    ]
 
-        saved = []
-        for image in images:
-            data = client.download_image(
-                image["filename"],
-                subfolder=image.get("subfolder", ""),
-                image_type=image.get("type", "output"),
-            )
-            target = OUTPUT_DIR / image["filename"]
-            target.write_bytes(data)
-            saved.append(str(target))
+    store = ManifestStore(OUTPUT_DIR / "manifest.sqlite")
+    journal = JobJournal(OUTPUT_DIR / "journal.jsonl")
+    try:
+        for result in generate_many(
+            jobs, client=client, ordered=True, download_dir=OUTPUT_DIR, journal=journal
+        ):
+            scene = SCENES[result["index"]]
+            images = result["images"]
+            if not images:
+                raise RuntimeError(f"No images returned for {scene['name']}")
 
-        manifest.append(
-            {
-                "scene": scene["name"],
-                "prompt_id": result["prompt_id"],
-                "positive": scene["positive"],
-                "negative": NEGATIVE_PROMPT,
-                "images": saved,
-            }
-        )
+            saved = [str(target) for target in result["paths"]]
 
-    (OUTPUT_DIR / "manifest.json").write_text(
-        json.dumps(manifest, indent=2), encoding="utf-8"
-    )
+            store.append(
+                {
+                    "scene": scene["name"],
+                    "prompt_id": result["prompt_id"],
+                    "positive": scene["positive"],
+                    "negative": NEGATIVE_PROMPT,
+                    "images": saved,
+                },
+                job=result["job"],
+            )
+    except urllib.error.URLError as exc:
+        print(
+            f"ComfyUI is not reachable at {BASE_URL}. "
+            "Start the server or set COMFY_URL.",
+            file=sys.stderr,
+        )
+        raise SystemExit(1) from exc
+    finally:
+        journal.close()
+        store.export_json(OUTPUT_DIR / "manifest.json", run=store.run)
+        store.close()
     return 0
 
 
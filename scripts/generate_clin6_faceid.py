@@ -1,14 +1,20 @@
 from __future__ import annotations
 
-import json
 import os
-import shutil
 import sys
 import urllib.error
 from pathlib import Path
 
-from comfy_sdk import ComfyClient, build_prompt_from_workflow
-from comfy_sdk.workflow import find_nodes_by_type
+from comfy_sdk import (
+    ComfyClient,
+    ComfyPool,
+    JobJournal,
+    ManifestStore,
+    build_prompt_from_workflow,
+    connect,
+    generate_many,
+)
+from comfy_sdk.subgraphs import FaceIDSubgraph
 
 
 BASE_URL = os.environ.get("COMFY_URL", "http://127.0.0.1:8000")
@@ -37,7 +43,6 @@ elif REF_ENV_SINGLE:
     REF_IMAGES = [Path(REF_ENV_SINGLE.strip())]
 else:
     REF_IMAGES = DEFAULT_REFS
-COMFY_INPUT_DIR = Path("C:/Users/chuck/ComfyUI/input")
 
 FACEID_PRESET = os.environ.get("FACEID_PRESET", "FACEID PLUS V2")
 FACEID_PROVIDER = os.environ.get("FACEID_PROVIDER", "CUDA")
@@ -102,100 +107,20 @@ NEGATIVE_PROMPT = (
 SEED_BASE = int(os.environ.get("SEED_BASE", "5542111"))
 
 
-def _next_id(prompt: dict[str, dict[str, object]]) -> str:
-    ids = [int(node_id) for node_id in prompt.keys() if node_id.isdigit()]
-    return str((max(ids) if ids else 0) + 1)
-
-
-def _get_size(prompt: dict[str, dict[str, object]]) -> tuple[int, int]:
-    for node_id in find_nodes_by_type(prompt, "EmptyLatentImage"):
-        inputs = prompt[node_id].get("inputs", {})
-        width = int(inputs.get("width", 1024))
-        height = int(inputs.get("height", 1024))
-        return width, height
-    return 1024, 1024
-
-
-def _insert_faceid_single(prompt: dict[str, dict[str, object]], *, ref_image: str) -> None:
-    width, height = _get_size(prompt)
-
-    ksampler_id = next(iter(find_nodes_by_type(prompt, "KSampler")), None)
-    if not ksampler_id:
-        raise RuntimeError("No KSampler node found")
-
-    model_link = prompt[ksampler_id]["inputs"].get("model")
-    if not (isinstance(model_link, list) and model_link):
-        raise RuntimeError("KSampler model link is missing")
-
-    face_loader_id = _next_id(prompt)
-    prompt[face_loader_id] = {
-        "class_type": "IPAdapterUnifiedLoaderFaceID",
-        "inputs": {
-            "model": model_link,
-            "preset": FACEID_PRESET,
-            "lora_strength": FACEID_LORA_STRENGTH,
-            "provider": FACEID_PROVIDER,
-        },
-    }
-
-    ref_img_id = _next_id(prompt)
-    prompt[ref_img_id] = {"class_type": "LoadImage", "inputs": {"image": ref_image}}
-
-    mask_id = _next_id(prompt)
-    prompt[mask_id] = {
-        "class_type": "CreateShapeMask",
-        "inputs": {
-            "shape": "square",
-            "frames": 1,
-            "location_x": width // 2,
-            "location_y": height // 2,
-            "grow": 0,
-            "frame_width": width,
-            "frame_height": height,
-            "shape_width": width,
-            "shape_height": height,
-        },
-    }
-
-    region_id = _next_id(prompt)
-    prompt[region_id] = {
-        "class_type": "IPAdapterRegionalConditioning",
-        "inputs": {
-            "image": [ref_img_id, 0],
-            "image_weight": FACEID_WEIGHT,
-            "prompt_weight": 1.0,
-            "weight_type": FACEID_WEIGHT_TYPE,
-            "start_at": 0.0,
-            "end_at": 1.0,
-            "mask": [mask_id, 0],
-        },
-    }
-
-    apply_id = _next_id(prompt)
-    prompt[apply_id] = {
-        "class_type": "IPAdapterFromParams",
-        "inputs": {
-            "model": [face_loader_id, 0],
-            "ipadapter": [face_loader_id, 1],
-            "ipadapter_params": [region_id, 0],
-            "combine_embeds": "concat",
-            "embeds_scaling": "K+V",
-        },
-    }
-
-    prompt[ksampler_id]["inputs"]["model"] = [apply_id, 0]
-
-
-def _prepare_ref_images(refs: list[Path]) -> list[str]:
-    COMFY_INPUT_DIR.mkdir(parents=True, exist_ok=True)
+def _prepare_ref_images(client: ComfyClient | ComfyPool, refs: list[Path]) -> list[str]:
     ref_names = []
-    for index, src in enumerate(refs, start=1):
+    for src in refs:
         if not src.exists():
             raise FileNotFoundError(f"Reference image not found: {src}")
-        target = COMFY_INPUT_DIR / f"clin6_ref_{index}{src.suffix}"
-        if not target.exists():
-            shutil.copyfile(src, target)
-        ref_names.append(target.name)
+    try:
+        for src in refs:
+            ref_names.append(client.upload_image(src))
+    except urllib.error.URLError as exc:
+        print(
+            f"ComfyUI is not reachable at {BASE_URL}. Start the server or set COMFY_URL.",
+            file=sys.stderr,
+        )
+        raise SystemExit(1) from exc
     return ref_names
 
 
@@ -220,75 +145,84 @@ def _build_loras() -> list[dict[str, object]]:
 
 def main() -> int:
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    client = ComfyClient(base_url=BASE_URL)
+    client = connect(BASE_URL)
 
-    ref_names = _prepare_ref_images(REF_IMAGES)
+    ref_names = _prepare_ref_images(client, REF_IMAGES)
     loras = _build_loras()
 
-    manifest = []
-    for index, scene in enumerate(SCENES, start=1):
-        positive = f"{BASE_PROMPT}, {scene}"
-        ref_name = ref_names[(index - 1) % len(ref_names)]
-        prompt = build_prompt_from_workflow(
-            positive=positive,
-            negative=NEGATIVE_PROMPT,
-            ckpt_name=CKPT_NAME,
-            loras=loras,
-            seed=SEED_BASE + index,
-            steps=35,
-            cfg=3.5,
-            sampler_name="dpmpp_2m_sde",
-            scheduler="karras",
-            denoise=1.0,
-            width=1024,
-            height=1024,
-            output_prefix=f"{OUTPUT_PREFIX}_{index:03d}",
-        )
-
-        _insert_faceid_single(prompt, ref_image=ref_name)
+    faceid = FaceIDSubgraph(
+        1,
+        preset=FACEID_PRESET,
+        provider=FACEID_PROVIDER,
+        lora_strength=FACEID_LORA_STRENGTH,
+        weight=FACEID_WEIGHT,
+        weight_type=FACEID_WEIGHT_TYPE,
+    )
 
-        try:
-            prompt_id = client.queue_prompt(prompt)
-        except urllib.error.URLError as exc:
-            print(
-                f"ComfyUI is not reachable at {BASE_URL}. Start the server or set COMFY_URL.",
-                file=sys.stderr,
+    def _jobs():
+        for index, scene in enumerate(SCENES, start=1):
+            prompt = build_prompt_from_workflow(
+                positive=f"{BASE_PROMPT}, {scene}",
+                negative=NEGATIVE_PROMPT,
+                ckpt_name=CKPT_NAME,
+                loras=loras,
+                seed=SEED_BASE + index,
+                steps=35,
+                cfg=3.5,
+                sampler_name="dpmpp_2m_sde",
+                scheduler="karras",
+                denoise=1.0,
+                width=1024,
+                height=1024,
+                output_prefix=f"{OUTPUT_PREFIX}_{index:03d}",
             )
-            raise SystemExit(1) from exc
-
-        history = client.wait_for_prompt(prompt_id, poll_interval=1.0, timeout=600.0)
-        images = client.extract_images(history, prompt_id)
-        if not images:
-            raise RuntimeError(f"No images returned for scene {index}")
-
-        saved = []
-        for image in images:
-            data = client.download_image(
-                image["filename"],
-                subfolder=image.get("subfolder", ""),
-                image_type=image.get("type", "output"),
+            faceid.apply(prompt, [ref_names[(index - 1) % len(ref_names)]])
+            yield {"prompt": prompt}
+
+    store = ManifestStore(OUTPUT_DIR / "clin6_hq_manifest.sqlite")
+    journal = JobJournal(OUTPUT_DIR / "clin6_hq_journal.jsonl")
+    try:
+        for result in generate_many(
+            _jobs(),
+            client=client,
+            poll_interval=1.0,
+            timeout=600.0,
+            download_dir=OUTPUT_DIR,
+            journal=journal,
+        ):
+            index = result["index"] + 1
+            positive = f"{BASE_PROMPT}, {SCENES[result['index']]}"
+            ref_name = ref_names[(index - 1) % len(ref_names)]
+            images = result["images"]
+            if not images:
+                raise RuntimeError(f"No images returned for scene {index}")
+
+            saved = []
+            for target in result["paths"]:
+                target.with_suffix(".txt").write_text(positive, encoding="utf-8")
+                saved.append(str(target))
+
+            store.append(
+                {
+                    "scene_index": index,
+                    "prompt_id": result["prompt_id"],
+                    "ref_image": ref_name,
+                    "positive": positive,
+                    "negative": NEGATIVE_PROMPT,
+                    "images": saved,
+                },
+                job=result["job"],
             )
-            target = OUTPUT_DIR / image["filename"]
-            target.write_bytes(data)
-
-            caption_path = target.with_suffix(".txt")
-            caption_path.write_text(positive, encoding="utf-8")
-            saved.append(str(target))
-
-        manifest.append(
-            {
-                "scene_index": index,
-                "prompt_id": prompt_id,
-                "ref_image": ref_name,
-                "positive": positive,
-                "negative": NEGATIVE_PROMPT,
-                "images": saved,
-            }
+    except urllib.error.URLError as exc:
+        print(
+            f"ComfyUI is not reachable at {BASE_URL}. Start the server or set COMFY_URL.",
+            file=sys.stderr,
         )
-
-    (OUTPUT_DIR / "clin6_hq_manifest.json").write_text(
-        json.dumps(manifest, indent=2), encoding="utf-8"
-    )
+        raise SystemExit(1) from exc
+    finally:
+        journal.close()
+        store.export_json(OUTPUT_DIR / "clin6_hq_manifest.json", run=store.run)
+        store.close()
     return 0
 
 
@@ -78,13 +78,13 @@ def main() -> int:
         raise RuntimeError("No images returned")
 
     for image in images:
-        data = client.download_image(
+        target = OUTPUT_DIR / image["filename"]
+        client.download_image_to(
             image["filename"],
+            target,
             subfolder=image.get("subfolder", ""),
             image_type=image.get("type", "output"),
         )
-        target = OUTPUT_DIR / image["filename"]
-        target.write_bytes(data)
 
     return 0
 
@@ -1,12 +1,11 @@
 from __future__ import annotations
 
-import json
 import os
 import sys
 import urllib.error
 from pathlib import Path
 
-from comfy_sdk import ComfyClient, generate_from_workflow
+from comfy_sdk import JobJournal, ManifestStore, connect, generate_many
 
 
 BASE_URL = os.environ.get("COMFY_URL", "http://127.0.0.1:8000")
@@ -87,70 +86,66 @@ SEED_BASE = 9204371
 
 def main() -> int:
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    client = ComfyClient(base_url=BASE_URL)
+    client = connect(BASE_URL)
 
     scenes = [("explicit", s) for s in EXPLICIT_SCENES] + [("mixed", s) for s in MIXED_SCENES]
     if len(scenes) != 40:
         raise RuntimeError(f"Expected 40 scenes, got {len(scenes)}")
 
-    manifest = []
-    for index, (scene_type, scene) in enumerate(scenes, start=1):
-        positive = f"{BASE_PROMPT}, {scene}"
-
-        try:
-            result = generate_from_workflow(
-                client=client,
-                positive=positive,
-                negative=NEGATIVE_PROMPT,
-                ckpt_name=CKPT_NAME,
-                loras=LORAS,
-                seed=SEED_BASE + index,
-                steps=30,
-                cfg=3.5,
-                sampler_name="dpmpp_2m_sde",
-                scheduler="karras",
-                denoise=1.0,
-            output_prefix=f"{OUTPUT_PREFIX}_{index:03d}",
-        )
-        except urllib.error.URLError as exc:
-            print(
-                f"ComfyUI is not reachable at {BASE_URL}. Start the server or set COMFY_URL.",
-                file=sys.stderr,
-            )
-            raise SystemExit(1) from exc
-
-        images = result.get("images", [])
-        if not images:
-            raise RuntimeError(f"No images returned for scene {index}")
-
-        saved = []
-        for image in images:
-            data = client.download_image(
-                image["filename"],
-                subfolder=image.get("subfolder", ""),
-                image_type=image.get("type", "output"),
+    jobs = [
+        {
+            "positive": f"{BASE_PROMPT}, {scene}",
+            "negative": NEGATIVE_PROMPT,
+            "ckpt_name": CKPT_NAME,
+            "loras": LORAS,
+            "seed": SEED_BASE + index,
+            "steps": 30,
+            "cfg": 3.5,
+            "sampler_name": "dpmpp_2m_sde",
+            "scheduler": "karras",
+            "denoise": 1.0,
+            "output_prefix": f"{OUTPUT_PREFIX}_{index:03d}",
+        }
+        for index, (_, scene) in enumerate(scenes, start=1)
+    ]
+
+    store = ManifestStore(OUTPUT_DIR / "duo_gen_manifest.sqlite")
+    journal = JobJournal(OUTPUT_DIR / "duo_gen_journal.jsonl")
+    try:
+        for result in generate_many(jobs, client=client, download_dir=OUTPUT_DIR, journal=journal):
+            index = result["index"] + 1
+            scene_type, _ = scenes[result["index"]]
+            positive = result["job"]["positive"]
+            images = result["images"]
+            if not images:
+                raise RuntimeError(f"No images returned for scene {index}")
+
+            saved = []
+            for target in result["paths"]:
+                target.with_suffix(".txt").write_text(positive, encoding="utf-8")
+                saved.append(str(target))
+
+            store.append(
+                {
+                    "scene_index": index,
+                    "scene_type": scene_type,
+                    "prompt_id": result["prompt_id"],
+                    "positive": positive,
+                    "negative": NEGATIVE_PROMPT,
+                    "images": saved,
+                },
+                job=result["job"],
             )
-            target = OUTPUT_DIR / image["filename"]
-            target.write_bytes(data)
-
-            caption_path = target.with_suffix(".txt")
-            caption_path.write_text(positive, encoding="utf-8")
-            saved.append(str(target))
-
-        manifest.append(
-            {
-                "scene_index": index,
-                "scene_type": scene_type,
-                "prompt_id": result["prompt_id"],
-                "positive": positive,
-                "negative": NEGATIVE_PROMPT,
-                "images": saved,
-            }
+    except urllib.error.URLError as exc:
+        print(
+            f"ComfyUI is not reachable at {BASE_URL}. Start the server or set COMFY_URL.",
+            file=sys.stderr,
         )
-
-    (OUTPUT_DIR / "duo_gen_manifest.json").write_text(
-        json.dumps(manifest, indent=2), encoding="utf-8"
-    )
+        raise SystemExit(1) from exc
+    finally:
+        journal.close()
+        store.export_json(OUTPUT_DIR / "duo_gen_manifest.json", run=store.run)
+        store.close()
     return 0
 
 
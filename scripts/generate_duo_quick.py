@@ -135,13 +135,13 @@ def main() -> int:
 
     saved = []
     for image in images:
-        data = client.download_image(
+        target = output_dir / image["filename"]
+        client.download_image_to(
             image["filename"],
+            target,
             subfolder=image.get("subfolder", ""),
             image_type=image.get("type", "output"),
         )
-        target = output_dir / image["filename"]
-        target.write_bytes(data)
         saved.append(str(target))
 
     print(f"Saved {len(saved)} image(s) to {output_dir}")
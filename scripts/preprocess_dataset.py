@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from pathlib import Path
+
+from comfy_sdk.preprocess import Preprocessor
+
+DEFAULT_SOURCE = Path(os.environ.get("DATASET_DIR", "TRAINING_DATA/CLIN7"))
+DEFAULT_TARGET = Path(os.environ.get("PREPROCESSED_DIR", "generated/preprocessed/CLIN7"))
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Resize a training folder into aspect buckets with caption sidecars."
+    )
+    parser.add_argument("--source", default=str(DEFAULT_SOURCE))
+    parser.add_argument("--target", default=str(DEFAULT_TARGET))
+    parser.add_argument("--base", type=int, default=1024, help="Side of the square bucket.")
+    parser.add_argument(
+        "--format", dest="image_format", default="jpeg", choices=("jpeg", "png", "webp")
+    )
+    parser.add_argument("--quality", type=int, default=95)
+    parser.add_argument("--trigger", default=os.environ.get("TRIGGER_TOKEN"))
+    parser.add_argument("--workers", type=int, default=None)
+    return parser
+
+
+def main() -> int:
+    args = build_arg_parser().parse_args()
+    preprocessor = Preprocessor(
+        args.source,
+        args.target,
+        base=args.base,
+        image_format=args.image_format,
+        quality=args.quality,
+        trigger=args.trigger,
+        workers=args.workers,
+    )
+    started = time.perf_counter()
+    counts = preprocessor.run()
+    elapsed = time.perf_counter() - started
+    print(
+        f"{counts['processed']} processed, {counts['skipped']} unchanged, "
+        f"{counts['failed']} failed, {counts['removed']} removed, "
+        f"{counts['captions']} captions written in {elapsed:.2f}s"
+    )
+    for relpath, error in sorted(preprocessor.errors.items()):
+        print(f"  failed {relpath}: {error}")
+    for bucket, count in preprocessor.bucket_counts().items():
+        print(f"  {bucket}: {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())